@@ -6,6 +6,7 @@ from app.services.metadata.musicbrainz import musicbrainz_client, MusicBrainzCli
 from app.services.metadata.discogs_service import discogs_service, DiscogsService
 from app.services.metadata.wikipedia_service import wikipedia_service, WikipediaService
 from app.services.audio_identification.acoustid_service import acoustid_client, AcoustIDClient
+from app.services.audio.matcher import audio_similarity_index
 
 # Simple dependency injections that return service instances
 def get_musixmatch_service():
@@ -26,6 +27,9 @@ def get_discogs_service():
 def get_wikipedia_service():
     return wikipedia_service
 
+def get_audio_similarity_index():
+    return audio_similarity_index
+
 def get_acoustid_client() -> AcoustIDClient:
     """Get AcoustID client instance."""
     from app.services.audio_identification.acoustid_service import acoustid_client, AcoustIDClient
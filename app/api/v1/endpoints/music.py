@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Request
 from typing import Dict, Any, List, Optional
-import requests
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.executors import bulkheads
 from app.services.metadata.musicbrainz import musicbrainz_client, MusicBrainzClient
 from app.services.metadata.jamendo import jamendo_service, JamendoService
 from app.services.metadata.musixmatch import musixmatch_service, MusixmatchService
@@ -18,13 +18,115 @@ import asyncio
 from fastapi import status
 import subprocess
 import aiofiles
-from .dependencies import get_musixmatch_service, get_jamendo_service, get_gemini_service, get_musicbrainz_service, get_discogs_service, get_wikipedia_service, get_acoustid_client
+from .dependencies import get_musixmatch_service, get_jamendo_service, get_gemini_service, get_musicbrainz_service, get_discogs_service, get_wikipedia_service, get_acoustid_client, get_audio_similarity_index
+from app.services.audio.matcher import AudioSimilarityIndex
+from app.services.similarity.cursor import similar_tracks_cursors, InvalidCursorError
+from app.services.media.preview_cache import jamendo_preview_cache
+from app.services.media.artwork import artwork_service, ArtworkRejected, DEFAULT_THUMBNAIL_SIZE
+from app.core.exceptions import AudioAnalysisError
 from app.services.audio_identification.acoustid_service import AcoustIDClient, AcoustIDError
 import re
 from app.utils.id3_extractor import extract_id3_tags
 
 router = APIRouter()
 
+SIMILAR_TRACKS_PAGE_SIZE = 10
+
+async def _get_wikipedia_summary(
+    title: str,
+    artist: str,
+    mbid: Optional[str] = None,
+    release_group_id: Optional[str] = None
+) -> Optional[str]:
+    """
+    Fetch the Wikipedia summary for a track. When MusicBrainz links the recording
+    (or its work/release group) to Wikipedia or Wikidata, that page is used
+    directly; title guessing is only the fallback. The fallback runs concurrently
+    with the (rate-limited) MusicBrainz lookup, so it costs no extra latency.
+    """
+    # Candidate titles in priority order, resolved together in a single request:
+    # "Title (Artist song)" first, then the plain "Title (song)" fallback
+    wiki_search_terms = [f"{title} ({artist} song)", f"{title} (song)"]
+    title_guess = asyncio.ensure_future(wikipedia_service.get_wikipedia_summary(*wiki_search_terms))
+    try:
+        if mbid:
+            wiki_reference = await musicbrainz_client.get_wikipedia_reference(mbid, release_group_id=release_group_id)
+            if wiki_reference:
+                wikipedia_summary = await wikipedia_service.get_summary_for_reference(wiki_reference)
+                if wikipedia_summary:
+                    logger.info(f"Successfully retrieved Wikipedia summary via MusicBrainz url-rels: {wiki_reference}")
+                    title_guess.cancel()
+                    return wikipedia_summary
+                logger.info(f"Linked Wikipedia page had no summary ({wiki_reference}). Falling back to title guessing.")
+    except BaseException:
+        title_guess.cancel()
+        raise
+
+    wikipedia_summary = await title_guess
+    if wikipedia_summary:
+         logger.info(f"Successfully retrieved Wikipedia summary for: {wiki_search_terms}")
+    else:
+         logger.info(f"No Wikipedia summary found for: {wiki_search_terms}")
+    return wikipedia_summary
+
+def _speculative_seed_keywords(
+    musixmatch_metadata: Optional[Dict],
+    musicbrainz_data: Optional[Dict],
+    discogs_data: Optional[Dict]
+) -> List[str]:
+    """Tags known before Gemini runs, used to start the Jamendo search early."""
+    seed_keywords: List[str] = []
+    if musixmatch_metadata:
+        seed_keywords += musixmatch_metadata.get("genres", [])
+    if musicbrainz_data:
+        seed_keywords += musicbrainz_data.get("tags", [])
+    if discogs_data:
+        seed_keywords += discogs_data.get("styles", []) + discogs_data.get("genres", [])
+    return seed_keywords
+
+def _jamendo_search_keywords(keywords: List[str], musixmatch_metadata: Optional[Dict]) -> List[str]:
+    """Gemini keywords with the Musixmatch genres prepended for Jamendo search priority."""
+    musixmatch_genres = musixmatch_metadata.get("genres", []) if musixmatch_metadata else []
+    return musixmatch_genres + list(keywords)
+
+class _EarlyJamendoRanking:
+    """
+    Starts the Jamendo ranking from Gemini's keywords as soon as they have been
+    streamed, so it overlaps the rest of the Gemini response.
+    """
+
+    def __init__(self, jamendo_service: JamendoService, musixmatch_metadata: Optional[Dict], speculative: Optional[asyncio.Task]):
+        self.jamendo_service = jamendo_service
+        self.musixmatch_metadata = musixmatch_metadata
+        self.speculative = speculative
+        self.keywords: Optional[List[str]] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def _rank(self, keywords: List[str], speculative: Optional[asyncio.Task]):
+        return self.jamendo_service.rank_similar_tracks(
+            keywords=_jamendo_search_keywords(keywords, self.musixmatch_metadata),
+            limit=SIMILAR_TRACKS_PAGE_SIZE,
+            speculative=speculative
+        )
+
+    def start(self, keywords: List[str]) -> None:
+        """on_keywords callback for GeminiService.analyze_song_and_generate_keywords."""
+        logger.info(f"Gemini keywords streamed; starting Jamendo ranking early: {keywords}")
+        self.keywords = list(keywords)
+        self.task = asyncio.ensure_future(self._rank(self.keywords, self.speculative))
+
+    async def result(self, keywords: List[str]) -> List[Dict[str, Any]]:
+        """Ranked tracks for the final keywords, reusing the early ranking when they match."""
+        if self.task is not None and self.keywords == list(keywords):
+            return await self.task
+        self.cancel()
+        # The early ranking owned the speculative task, if it ran at all
+        return await self._rank(keywords, None if self.task is not None else self.speculative)
+
+    def cancel(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
 @router.post("/search")
 async def search_and_analyze(title: str = Form(...), artist: str = Form(...)) -> Dict[str, Any]:
     """
@@ -115,24 +217,20 @@ async def search_and_analyze(title: str = Form(...), artist: str = Form(...)) ->
          logger.exception(f"Unexpected error searching Discogs: {e}. Proceeding without it.")
          discogs_data = None
 
+    # Start Jamendo on the tags we already have so it overlaps Wikipedia and Gemini
+    early_jamendo: Optional[_EarlyJamendoRanking] = None
+    speculative_jamendo = jamendo_service.start_speculative_search(
+        _speculative_seed_keywords(musixmatch_metadata, musicbrainz_data, discogs_data), limit=SIMILAR_TRACKS_PAGE_SIZE
+    )
+
     # --- 4. Get Wikipedia Summary --- 
     try:
-        # Construct a search term - add " (song)" suffix
-        wiki_search_term = f"{lookup_title} ({lookup_artist} song)" # Try adding artist context too
-        # Alternative: wiki_search_term = f"{lookup_title} (song)" # Simpler, maybe better?
-        wikipedia_summary = await wikipedia_service.get_wikipedia_summary(wiki_search_term)
-        if wikipedia_summary:
-             logger.info(f"Successfully retrieved Wikipedia summary for: {wiki_search_term}")
-        else:
-             logger.info(f"No Wikipedia summary found for: {wiki_search_term}. Trying title only...")
-             # Fallback: Try searching just the title + (song)
-             wiki_search_term_fallback = f"{lookup_title} (song)"
-             wikipedia_summary = await wikipedia_service.get_wikipedia_summary(wiki_search_term_fallback)
-             if wikipedia_summary:
-                 logger.info(f"Successfully retrieved Wikipedia summary on fallback: {wiki_search_term_fallback}")
-             else:
-                 logger.info(f"No Wikipedia summary found on fallback either: {wiki_search_term_fallback}")
-
+        wikipedia_summary = await _get_wikipedia_summary(
+            lookup_title,
+            lookup_artist,
+            mbid=musicbrainz_data.get("mbid") if musicbrainz_data else None,
+            release_group_id=musicbrainz_data.get("release_group_id") if musicbrainz_data else None
+        )
     except Exception as e:
          logger.exception(f"Unexpected error fetching Wikipedia summary: {e}. Proceeding without it.")
          wikipedia_summary = None
@@ -157,7 +255,8 @@ async def search_and_analyze(title: str = Form(...), artist: str = Form(...)) ->
                  logger.info("Including Discogs year in Gemini prompt.")
         
         logger.info(f"Starting Gemini analysis with combined data: {analysis_input.get('title')}...")
-        gemini_analysis = await gemini_service.analyze_song_and_generate_keywords(analysis_input)
+        early_jamendo = _EarlyJamendoRanking(jamendo_service, musixmatch_metadata, speculative_jamendo)
+        gemini_analysis = await gemini_service.analyze_song_and_generate_keywords(analysis_input, on_keywords=early_jamendo.start)
         logger.info(f"Gemini analysis successful for {analysis_input.get('title', 'Unknown Title')} by {analysis_input.get('artist', 'Unknown Artist')}. Keywords: {gemini_analysis['keywords']}")
         keywords = gemini_analysis.get("keywords")
 
@@ -176,22 +275,16 @@ async def search_and_analyze(title: str = Form(...), artist: str = Form(...)) ->
         logger.info(f"Original Gemini keywords: {keywords}")
         
         # Prepend Musixmatch genres to the keywords for Jamendo search priority
-        jamendo_search_keywords = list(keywords) # Create a copy
-        musixmatch_genres = musixmatch_metadata.get("genres", [])
-        if musixmatch_genres: 
-            # Add genres at the beginning of the list
-            jamendo_search_keywords = musixmatch_genres + jamendo_search_keywords 
-            logger.info(f"Prepending Musixmatch genres. Keywords for Jamendo: {jamendo_search_keywords}")
-        else:
-            logger.info("No Musixmatch genres to prepend.")
-        
-        # Limit the total number of keywords if it gets too long? Optional.
-        # MAX_JAMENDO_KEYWORDS = 10 
-        # jamendo_search_keywords = jamendo_search_keywords[:MAX_JAMENDO_KEYWORDS]
-            
+        jamendo_search_keywords = _jamendo_search_keywords(keywords, musixmatch_metadata)
         logger.info(f"Searching Jamendo with keywords: {jamendo_search_keywords}")
-        # jamendo_tracks = await jamendo_service.find_similar_tracks_by_keywords(keywords=keywords, limit=10) # OLD
-        jamendo_tracks = await jamendo_service.find_similar_tracks_by_keywords(keywords=jamendo_search_keywords, limit=10) # NEW
+        # Usually already running, started while Gemini was still streaming the description
+        ranked_tracks = await early_jamendo.result(keywords)
+        jamendo_tracks = ranked_tracks[:SIMILAR_TRACKS_PAGE_SIZE]
+        # Keep the rest of the ranked list server-side for /similar pagination
+        similar_tracks_cursor = await similar_tracks_cursors.create(
+            jamendo_search_keywords, ranked_tracks, served=len(jamendo_tracks),
+            fetched=jamendo_service.candidate_limit(SIMILAR_TRACKS_PAGE_SIZE)
+        )
         
         logger.info("Search query processing complete.")
 
@@ -201,7 +294,8 @@ async def search_and_analyze(title: str = Form(...), artist: str = Form(...)) ->
             "discogs_data": discogs_data,
             "wikipedia_summary": wikipedia_summary,
             "analysis": gemini_analysis,
-            "similar_tracks": jamendo_tracks
+            "similar_tracks": jamendo_tracks,
+            "similar_tracks_cursor": similar_tracks_cursor
         }
 
     except AIServiceError as e:
@@ -223,6 +317,11 @@ async def search_and_analyze(title: str = Form(...), artist: str = Form(...)) ->
             status_code=500,
             detail=f"An unexpected error occurred during AI analysis or similarity search."
         )
+    finally:
+        if speculative_jamendo:
+            speculative_jamendo.cancel() # No-op once consumed; stops it on early returns
+        if early_jamendo:
+            early_jamendo.cancel()
 
 @router.post("/process-file")
 async def process_file(
@@ -445,21 +544,22 @@ async def process_file(
     else:
         logger.warning("Insufficient title/artist to search Discogs.")
 
+    # Start Jamendo on the tags we already have so it overlaps Wikipedia and Gemini
+    early_jamendo: Optional[_EarlyJamendoRanking] = None
+    speculative_jamendo = jamendo_service.start_speculative_search(
+        _speculative_seed_keywords(musixmatch_metadata, musicbrainz_data, discogs_data), limit=SIMILAR_TRACKS_PAGE_SIZE
+    )
+
     # 5. Get Wikipedia Summary
     if final_lookup_title and final_lookup_artist:
         try:
-            wiki_search_term = f"{final_lookup_title} ({final_lookup_artist} song)"
-            wikipedia_summary = await wikipedia_service.get_wikipedia_summary(wiki_search_term)
-            if wikipedia_summary:
-                 logger.info(f"Successfully retrieved Wikipedia summary for: {wiki_search_term}")
-            else:
-                 logger.info(f"No Wikipedia summary found for: {wiki_search_term}. Trying title only...")
-                 wiki_search_term_fallback = f"{final_lookup_title} (song)"
-                 wikipedia_summary = await wikipedia_service.get_wikipedia_summary(wiki_search_term_fallback)
-                 if wikipedia_summary:
-                     logger.info(f"Successfully retrieved Wikipedia summary on fallback: {wiki_search_term_fallback}")
-                 else:
-                     logger.info(f"No Wikipedia summary found on fallback either: {wiki_search_term_fallback}")
+            # Prefer the AcoustID-provided MBID, else the one found by the MusicBrainz search
+            wikipedia_summary = await _get_wikipedia_summary(
+                final_lookup_title,
+                final_lookup_artist,
+                mbid=mbid_from_acoustid or (musicbrainz_data.get("mbid") if musicbrainz_data else None),
+                release_group_id=musicbrainz_data.get("release_group_id") if musicbrainz_data else None
+            )
         except Exception as e:
              logger.exception(f"Unexpected error fetching Wikipedia summary: {e}. Proceeding without it.")
              wikipedia_summary = None
@@ -501,7 +601,8 @@ async def process_file(
                  logger.info("Including Discogs year in Gemini prompt.")
         
         logger.info(f"Starting Gemini analysis with combined data: {analysis_input.get('title')}...")
-        gemini_analysis = await gemini_service.analyze_song_and_generate_keywords(analysis_input)
+        early_jamendo = _EarlyJamendoRanking(jamendo_service, musixmatch_metadata, speculative_jamendo)
+        gemini_analysis = await gemini_service.analyze_song_and_generate_keywords(analysis_input, on_keywords=early_jamendo.start)
         logger.info(f"Gemini analysis successful. Keywords: {gemini_analysis['keywords']}")
         keywords = gemini_analysis.get("keywords")
 
@@ -519,14 +620,15 @@ async def process_file(
              }
 
         # --- 6. Find similar tracks on Jamendo --- 
-        jamendo_search_keywords = list(keywords)
-        musixmatch_genres = musixmatch_metadata.get("genres", []) if musixmatch_metadata else []
-        if musixmatch_genres:
-            jamendo_search_keywords = musixmatch_genres + jamendo_search_keywords
-            logger.info(f"Prepending Musixmatch genres. Keywords for Jamendo: {jamendo_search_keywords}")
-        
+        jamendo_search_keywords = _jamendo_search_keywords(keywords, musixmatch_metadata)
         logger.info(f"Searching Jamendo with keywords: {jamendo_search_keywords}")
-        jamendo_tracks = await jamendo_service.find_similar_tracks_by_keywords(keywords=jamendo_search_keywords, limit=10)
+        ranked_tracks = await early_jamendo.result(keywords)
+        jamendo_tracks = ranked_tracks[:SIMILAR_TRACKS_PAGE_SIZE]
+        # Keep the rest of the ranked list server-side for /similar pagination
+        similar_tracks_cursor = await similar_tracks_cursors.create(
+            jamendo_search_keywords, ranked_tracks, served=len(jamendo_tracks),
+            fetched=jamendo_service.candidate_limit(SIMILAR_TRACKS_PAGE_SIZE)
+        )
         
         logger.info("File processing complete.")
 
@@ -538,7 +640,8 @@ async def process_file(
             "discogs_data": discogs_data,
             "wikipedia_summary": wikipedia_summary,
             "analysis": gemini_analysis,
-            "similar_tracks": jamendo_tracks
+            "similar_tracks": jamendo_tracks,
+            "similar_tracks_cursor": similar_tracks_cursor
         }
 
     except AIServiceError as e:
@@ -561,6 +664,97 @@ async def process_file(
             status_code=500,
             detail=f"An unexpected error occurred during file processing."
         )
+    finally:
+        if speculative_jamendo:
+            speculative_jamendo.cancel() # No-op once consumed; stops it on early returns
+        if early_jamendo:
+            early_jamendo.cancel()
 
 # Remove the old /process-link implementation if not needed, or update it similarly
-# @router.post("/process-link") ... 
\ No newline at end of file
+# @router.post("/process-link") ... 
+
+@router.get("/similar")
+async def get_similar_tracks_page(cursor: str, limit: int = SIMILAR_TRACKS_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Serve the next page of similar tracks for a `similar_tracks_cursor` returned by
+    /search or /process-file (or a `next_cursor` from this endpoint).
+    """
+    if not 1 <= limit <= 50:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
+    try:
+        page = await similar_tracks_cursors.page(cursor, limit=limit)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if page is None:
+        raise HTTPException(status_code=404, detail="Cursor not found or expired. Please run the search again.")
+    return page
+
+@router.get("/preview/{track_id}")
+async def get_preview(track_id: str, request: Request):
+    """
+    Stream a Jamendo track preview through the local cache. Supports Range requests,
+    so players can seek; the first play fills the cache while it streams.
+    """
+    if not track_id.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Jamendo track id")
+    response = await jamendo_preview_cache.response_for(track_id, request.headers)
+    if response is None:
+        raise HTTPException(status_code=502, detail="Preview could not be fetched from Jamendo")
+    return response
+
+@router.get("/artwork")
+async def get_artwork(request: Request, url: str, size: int = DEFAULT_THUMBNAIL_SIZE):
+    """
+    Serve a resized thumbnail of Discogs or Jamendo artwork. The source image is
+    fetched once; every size is rendered from it and cached on disk.
+    """
+    try:
+        response = await artwork_service.response_for(url, size, request.headers)
+    except ArtworkRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if response is None:
+        raise HTTPException(status_code=502, detail="Artwork could not be fetched")
+    return response
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def _save_upload(file: UploadFile, path: str) -> None:
+    """Copy an upload to `path` chunk by chunk, rejecting it with 413 once it exceeds MAX_UPLOAD_SIZE."""
+    written = 0
+    async with aiofiles.open(path, 'wb') as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > settings.MAX_UPLOAD_SIZE:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Upload exceeds the {settings.MAX_UPLOAD_SIZE // (1024 * 1024)} MB limit"
+                )
+            await f.write(chunk)
+
+@router.post("/similar-audio")
+async def find_similar_audio(
+    file: UploadFile = File(...),
+    k: int = Form(10),
+    audio_index: AudioSimilarityIndex = Depends(get_audio_similarity_index)
+) -> Dict[str, Any]:
+    """
+    Extract audio features from an uploaded file and return the k catalog tracks
+    that sound most alike, according to the offline audio similarity index.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="Filename missing from upload")
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+    if not await bulkheads["index"].run(audio_index.ensure_loaded):
+        raise HTTPException(status_code=503, detail="Audio similarity index has not been built")
+
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file.filename)[1] or '.tmp') as tmp_file:
+        await _save_upload(file, tmp_file.name)
+        try:
+            result = await bulkheads["audio"].run(audio_index.search_file, tmp_file.name, k)
+        except AudioAnalysisError as e:
+            logger.error(f"Audio feature extraction failed for {file.filename}: {e}")
+            raise HTTPException(status_code=422, detail=f"Could not analyse audio: {e}")
+
+    logger.info(f"Found {len(result['similar_tracks'])} audio-similar tracks for {file.filename}")
+    return result
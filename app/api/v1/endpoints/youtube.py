@@ -18,7 +18,7 @@ async def process_youtube_url(request: YouTubeURLRequest = Body(...)) -> Dict[st
         video_id = youtube_client.extract_video_id(request.url)
         
         # Get video info
-        video_info = youtube_client.get_video_info(video_id)
+        video_info = await youtube_client.get_video_info(video_id)
         
         logger.info(f"Successfully processed YouTube video: {video_info['title']}")
         return video_info
@@ -0,0 +1,147 @@
+import itertools
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Optional
+from .config import settings
+from .exceptions import BulkheadFullError
+from .executors import bulkheads
+from .logging import logger
+
+class PersistentTTLCache:
+    """
+    Small key/value store with per-entry expiry, backed by SQLite so every worker
+    process shares it. Values are stored as JSON. Storage errors are logged and
+    treated as cache misses, so callers never fail because of the cache. From async
+    code use get_async/set_async, which keep the SQLite calls off the event loop.
+    Expired entries are only skipped on read; every `purge_every` writes the
+    namespace's expired entries are deleted and the freed pages returned to the
+    filesystem, so the file does not grow without bound.
+    """
+
+    def __init__(self, namespace: str, ttl: float, db_path: Optional[str] = None, purge_every: int = 500):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.purge_every = max(1, purge_every)
+        self._writes = itertools.count(1) # next() is atomic, so concurrent writer threads are counted once each
+        self.db_path = db_path or settings.CACHE_DB_PATH or os.path.join(settings.CACHE_DIR, "cache.sqlite3")
+        try:
+            self._init_db()
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Failed to initialize cache '{namespace}' at {self.db_path}: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+
+    def _init_db(self) -> None:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL") # Only takes effect before the first table is created
+            conn.execute("PRAGMA journal_mode=WAL") # Readers never block the writer
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+                """
+            )
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("VACUUM") # A database created without it: rebuild once so purges can shrink the file
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if it is missing or expired."""
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT value FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (self.namespace, key, time.time())
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.namespace}' read failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value), expires_at)
+                )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.namespace}' write failed: {e}")
+            return
+        if next(self._writes) % self.purge_every == 0:
+            self.purge_expired()
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """get() on the storage bulkhead. A saturated pool counts as a miss."""
+        try:
+            return await bulkheads["storage"].run(self.get, key)
+        except BulkheadFullError as e:
+            logger.warning(f"Cache '{self.namespace}' read skipped: {e}")
+            return None
+
+    async def set_async(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """set() on the storage bulkhead. A saturated pool drops the write."""
+        try:
+            await bulkheads["storage"].run(self.set, key, value, ttl)
+        except BulkheadFullError as e:
+            logger.warning(f"Cache '{self.namespace}' write skipped: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.namespace}' delete failed: {e}")
+
+    def clear(self) -> int:
+        """Delete every entry of this namespace. Returns the number removed."""
+        try:
+            conn = self._connect()
+            try:
+                return conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,)).rowcount
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.namespace}' clear failed: {e}")
+            return 0
+
+    def purge_expired(self) -> int:
+        """Delete expired entries of this namespace and release the freed space. Returns the number removed."""
+        try:
+            conn = self._connect()
+            try:
+                removed = conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+                    (self.namespace, time.time())
+                ).rowcount
+                if removed:
+                    conn.executescript("PRAGMA incremental_vacuum;") # Run to completion; execute() would free a single page
+                return removed
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.namespace}' purge failed: {e}")
+            return 0
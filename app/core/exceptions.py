@@ -69,4 +69,10 @@ class MusixmatchAPIError(MetadataAPIError):
 
 class AudioAnalysisError(Exception):
     """Custom exception for audio analysis service errors (e.g., AcousticBrainz)."""
-    pass
\ No newline at end of file
+    pass
+
+class BulkheadFullError(Exception):
+    """Raised when a bulkhead's threads and queue are all taken (see app/core/executors.py)."""
+    def __init__(self, pool: str):
+        self.pool = pool
+        super().__init__(f"The {pool} pool is saturated")
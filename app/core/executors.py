@@ -0,0 +1,124 @@
+"""
+Bulkheads: a dedicated, sized thread pool per kind of blocking work.
+
+asyncio.to_thread runs everything on the loop's default executor (min(32, cpus + 4)
+threads), so one slow caller - musicbrainzngs sleeping for its rate limit, a long
+audio decode - starves every other one. Each bulkhead owns its own executor and
+admits at most max_workers running plus max_queue waiting calls. Beyond that it
+fails fast with BulkheadFullError instead of queueing without bound; the API
+turns that into a 503. Queue depth, running calls, wait time and rejections are
+exported per pool.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+from .config import settings
+from .exceptions import BulkheadFullError
+from .metrics import metrics
+
+T = TypeVar("T")
+
+BULKHEAD_QUEUED = metrics.gauge("bulkhead_queued_calls", "Calls waiting for a thread", ["pool"])
+BULKHEAD_ACTIVE = metrics.gauge("bulkhead_active_calls", "Calls running on a thread", ["pool"])
+BULKHEAD_WAIT = metrics.histogram(
+    "bulkhead_wait_seconds", "Time calls waited for a thread", (0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10), ["pool"]
+)
+BULKHEAD_REJECTED = metrics.counter("bulkhead_rejected_total", "Calls rejected because the pool was saturated", ["pool"])
+
+class Bulkhead:
+    """A named thread pool with a bounded queue."""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"bulkhead-{name}")
+        self._admitted = 0 # Queued + running
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def submit(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> "Future[T]":
+        """Schedule `func` on this pool, raising BulkheadFullError if it is saturated."""
+        with self._lock:
+            if self._admitted >= self.capacity:
+                BULKHEAD_REJECTED.inc(pool=self.name)
+                raise BulkheadFullError(self.name)
+            self._admitted += 1
+        BULKHEAD_QUEUED.inc(pool=self.name)
+        enqueued = time.perf_counter()
+        context = contextvars.copy_context() # Like asyncio.to_thread, keep the caller's context vars
+
+        def call() -> T:
+            BULKHEAD_QUEUED.dec(pool=self.name)
+            BULKHEAD_WAIT.observe(time.perf_counter() - enqueued, pool=self.name)
+            BULKHEAD_ACTIVE.inc(pool=self.name)
+            try:
+                return context.run(func, *args, **kwargs)
+            finally:
+                BULKHEAD_ACTIVE.dec(pool=self.name)
+
+        try:
+            future = self._executor.submit(call)
+        except RuntimeError: # Shut down
+            BULKHEAD_QUEUED.dec(pool=self.name)
+            with self._lock:
+                self._admitted -= 1
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future) -> None:
+        if future.cancelled(): # Cancelled while queued, so call() never ran
+            BULKHEAD_QUEUED.dec(pool=self.name)
+        with self._lock:
+            self._admitted -= 1
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Await `func(*args, **kwargs)` on this pool; the drop-in for asyncio.to_thread."""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": int(BULKHEAD_ACTIVE.value(pool=self.name)),
+            "queued": int(BULKHEAD_QUEUED.value(pool=self.name)),
+            "rejected": int(BULKHEAD_REJECTED.value(pool=self.name)),
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+class BulkheadRegistry:
+    """The process's bulkheads by name."""
+
+    def __init__(self, limits: Dict[str, Tuple[int, int]]):
+        self._pools = {name: Bulkhead(name, workers, queue) for name, (workers, queue) in limits.items()}
+
+    def __getitem__(self, name: str) -> Bulkhead:
+        return self._pools[name]
+
+    def names(self) -> List[str]:
+        return list(self._pools)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+    def shutdown(self, wait: bool = False) -> None:
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+
+# Create a global instance
+bulkheads = BulkheadRegistry({
+    "musicbrainz": (settings.BULKHEAD_MUSICBRAINZ_WORKERS, settings.BULKHEAD_MUSICBRAINZ_QUEUE),
+    "audio": (settings.BULKHEAD_AUDIO_WORKERS, settings.BULKHEAD_AUDIO_QUEUE),
+    "images": (settings.BULKHEAD_IMAGES_WORKERS, settings.BULKHEAD_IMAGES_QUEUE),
+    "index": (settings.BULKHEAD_INDEX_WORKERS, settings.BULKHEAD_INDEX_QUEUE),
+    "storage": (settings.BULKHEAD_STORAGE_WORKERS, settings.BULKHEAD_STORAGE_QUEUE),
+})
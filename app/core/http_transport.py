@@ -0,0 +1,280 @@
+"""
+The app's single outbound HTTP transport.
+
+Every service builds its own httpx.AsyncClient (base URL, headers, redirect
+policy) on top of this one transport, so they all share one connection pool:
+keep-alive connections to a host are reused across services, HTTP/2 is used when
+the optional `h2` package is installed, and timeouts default uniformly. On top
+of httpx's global pool limits the transport caps concurrent requests per host
+(HTTP_PER_HOST_LIMIT, overridable per host with HTTP_HOST_LIMITS), caches DNS
+answers for HTTP_DNS_TTL seconds, and exports per-host utilisation. Clients
+given an explicit transport ignore HTTP(S)_PROXY/ALL_PROXY/NO_PROXY, so the
+transport applies those itself: matching requests go through a proxied pool.
+"""
+import asyncio
+import importlib.util
+import ipaddress
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import httpcore
+import httpx
+from httpx._utils import URLPattern, get_environment_proxies
+from .config import settings
+from .logging import logger
+from .metrics import metrics
+
+HTTP_REQUESTS = metrics.counter("http_client_requests_total", "Outbound HTTP requests by host and outcome", ["host", "outcome"])
+HTTP_HOST_ACTIVE = metrics.gauge("http_client_host_active_requests", "Outbound requests in progress per host", ["host"])
+HTTP_HOST_WAITING = metrics.gauge("http_client_host_waiting_requests", "Outbound requests waiting for a per-host slot", ["host"])
+HTTP_HOST_WAIT = metrics.histogram(
+    "http_client_host_wait_seconds", "Time outbound requests waited for a per-host slot", (0.001, 0.01, 0.05, 0.1, 0.5, 1, 5), ["host"]
+)
+
+Resolver = Callable[[str, int], Awaitable[List[str]]]
+
+def parse_host_limits(spec: str) -> Dict[str, int]:
+    """'api.jamendo.com=20,api.discogs.com=5' -> {'api.jamendo.com': 20, 'api.discogs.com': 5}"""
+    limits = {}
+    for item in spec.split(","):
+        host, _, limit = item.partition("=")
+        if host.strip() and limit.strip():
+            limits[host.strip().lower()] = int(limit)
+    return limits
+
+async def _getaddrinfo(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+class CachingDNSBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend that resolves host names itself and remembers the answers.
+    TLS still verifies against (and sends SNI for) the original host name, which
+    httpcore passes separately when it starts TLS.
+    """
+
+    def __init__(self, ttl: float, backend: Optional[httpcore.AsyncNetworkBackend] = None, resolver: Resolver = _getaddrinfo):
+        self.ttl = ttl
+        self._backend = backend or httpcore.AnyIOBackend()
+        self._resolver = resolver
+        self._cache: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    @staticmethod
+    def _is_ip(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    async def resolve(self, host: str, port: int, timeout: Optional[float] = None) -> List[str]:
+        if self.ttl <= 0 or self._is_ip(host):
+            return [host]
+        cached = self._cache.get((host, port))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        try:
+            addresses = await asyncio.wait_for(self._resolver(host, port), timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise httpcore.ConnectError(f"Could not resolve {host}: {e}") from e
+        if not addresses:
+            raise httpcore.ConnectError(f"No addresses for {host}")
+        self._cache[(host, port)] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    async def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None, local_address: Optional[str] = None,
+                          socket_options: Any = None) -> httpcore.AsyncNetworkStream:
+        last_error: Optional[Exception] = None
+        for address in await self.resolve(host, port, timeout):
+            try:
+                return await self._backend.connect_tcp(address, port, timeout=timeout, local_address=local_address, socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+        self._cache.pop((host, port), None) # Possibly stale; resolve again next time
+        raise last_error
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options: Any = None) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+class _HostSlots:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.requests = 0
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees the host slot once it has been read or closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+class SharedHTTPTransport(httpx.AsyncBaseTransport):
+    """One connection pool for all outbound clients, with per-host concurrency limits."""
+
+    def __init__(self, per_host_limit: int, host_limits: Optional[Dict[str, int]] = None, timeout: Optional[httpx.Timeout] = None,
+                 limits: Optional[httpx.Limits] = None, dns_ttl: float = 300.0, http2: bool = True,
+                 transport: Optional[httpx.AsyncBaseTransport] = None, trust_env: bool = True):
+        self.per_host_limit = per_host_limit
+        self.host_limits = host_limits or {}
+        self.timeout = timeout or httpx.Timeout(15.0, connect=5.0)
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.info("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+        self._pool: Optional[httpcore.AsyncConnectionPool] = None
+        # Proxy pools by URL pattern, most specific first (as httpx.AsyncClient orders its mounts); None = direct
+        self._proxies: List[Tuple[URLPattern, Optional[httpx.AsyncHTTPTransport]]] = []
+        if transport is None:
+            limits = limits or httpx.Limits()
+            if trust_env:
+                self._proxies = sorted(
+                    (
+                        (URLPattern(pattern), None if proxy is None else httpx.AsyncHTTPTransport(proxy=proxy, http2=self.http2, limits=limits))
+                        for pattern, proxy in get_environment_proxies().items()
+                    ),
+                    key=lambda mount: mount[0]
+                )
+            transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=limits)
+            # Same pool httpx would build, plus the caching resolver (not exposed by httpx)
+            self._pool = transport._pool = httpcore.AsyncConnectionPool(
+                ssl_context=httpx.create_ssl_context(),
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+                http1=True,
+                http2=self.http2,
+                network_backend=CachingDNSBackend(dns_ttl)
+            )
+        self._transport = transport
+        self._hosts: Dict[str, _HostSlots] = {}
+
+    def client(self, **kwargs: Any) -> httpx.AsyncClient:
+        """An AsyncClient on the shared pool; pass base_url/headers/follow_redirects as usual. Closing it leaves the pool open."""
+        kwargs.setdefault("timeout", self.timeout)
+        return httpx.AsyncClient(transport=self, **kwargs)
+
+    def _slots(self, host: str) -> _HostSlots:
+        slots = self._hosts.get(host)
+        if slots is None:
+            slots = self._hosts[host] = _HostSlots(self.host_limits.get(host, self.per_host_limit))
+        return slots
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        slots = self._slots(host)
+        started = time.perf_counter()
+        slots.waiting += 1
+        HTTP_HOST_WAITING.inc(host=host)
+        try:
+            # Waiting for a host slot counts against the request's pool timeout, like waiting for a connection.
+            # asyncio.timeout rather than wait_for: on 3.11 wait_for can time out after the acquire
+            # succeeded and drop the permit, shrinking the host's limit for good.
+            async with asyncio.timeout(request.extensions.get("timeout", {}).get("pool")):
+                await slots.semaphore.acquire()
+        except asyncio.TimeoutError:
+            HTTP_REQUESTS.inc(host=host, outcome="pool_timeout")
+            raise httpx.PoolTimeout(f"Timed out waiting for a {host} slot", request=request) from None
+        finally:
+            slots.waiting -= 1
+            HTTP_HOST_WAITING.dec(host=host)
+        HTTP_HOST_WAIT.observe(time.perf_counter() - started, host=host)
+        slots.active += 1
+        slots.requests += 1
+        HTTP_HOST_ACTIVE.inc(host=host)
+
+        released = False
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                slots.active -= 1
+                HTTP_HOST_ACTIVE.dec(host=host)
+                slots.semaphore.release()
+
+        try:
+            response = await self._transport_for(request.url).handle_async_request(request)
+        except BaseException:
+            release()
+            HTTP_REQUESTS.inc(host=host, outcome="error")
+            raise
+        HTTP_REQUESTS.inc(host=host, outcome=f"{response.status_code // 100}xx")
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions
+        )
+
+    def _transport_for(self, url: httpx.URL) -> httpx.AsyncBaseTransport:
+        for pattern, proxy in self._proxies:
+            if pattern.matches(url):
+                return proxy if proxy is not None else self._transport
+        return self._transport
+
+    async def warm(self, origin: str, connections: int = 1) -> None:
+        """
+        Resolve `origin`'s host and leave up to `connections` keep-alive connections
+        to it in the pool, by sending that many concurrent HEAD requests (their
+        status does not matter).
+        """
+        async with self.client() as client:
+            await asyncio.gather(*(client.head(origin) for _ in range(max(1, connections))))
+
+    async def aclose(self) -> None:
+        # Called whenever a client built on this transport is closed; the pool is shared
+        pass
+
+    async def shutdown(self) -> None:
+        """Close the shared connection pool and any proxy pools (on application shutdown)."""
+        await self._transport.aclose()
+        for _, proxy in self._proxies:
+            if proxy is not None:
+                await proxy.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool and per-host utilisation."""
+        connections = self._pool.connections if self._pool is not None else []
+        return {
+            "http2": self.http2,
+            "connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            "hosts": {
+                host: {
+                    "limit": slots.limit,
+                    "active": slots.active,
+                    "waiting": slots.waiting,
+                    "requests": slots.requests,
+                    "utilisation": round(slots.active / slots.limit, 3),
+                }
+                for host, slots in sorted(self._hosts.items())
+            },
+        }
+
+# Create a global instance
+http_transport = SharedHTTPTransport(
+    per_host_limit=settings.HTTP_PER_HOST_LIMIT,
+    host_limits=parse_host_limits(settings.HTTP_HOST_LIMITS),
+    timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+    limits=httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+    ),
+    dns_ttl=settings.HTTP_DNS_TTL,
+    http2=settings.HTTP2_ENABLED
+)
@@ -0,0 +1,291 @@
+"""
+Metrics rendered in the Prometheus text exposition format.
+
+Each process records into its own metrics. Gunicorn runs several workers behind
+one port, and a scrape reaches only one of them at random, so in multiprocess
+mode (METRICS_MULTIPROC_DIR, set by gunicorn.conf.py) every worker also writes
+its values to <dir>/<pid>.json every few seconds, and rendering merges all the
+files: counters and histograms are summed over every worker that has run since
+the directory was cleared (so totals survive worker restarts), gauges over the
+workers that are still alive. Kept dependency-free on purpose: only counters,
+gauges and histograms are needed.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .config import settings
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    def escape(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _ScalarSeries:
+    """Snapshot, (de)serialization and merging of one value per label combination."""
+
+    _values: Dict[LabelValues, float]
+    _lock: threading.Lock
+
+    def samples(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def encode(samples: Dict[LabelValues, float]) -> List[Any]:
+        return [[list(key), value] for key, value in samples.items()]
+
+    @staticmethod
+    def decode(series: List[Any]) -> Dict[LabelValues, float]:
+        return {tuple(key): float(value) for key, value in series}
+
+    @staticmethod
+    def merge(into: Dict[LabelValues, float], samples: Dict[LabelValues, float]) -> None:
+        for key, value in samples.items():
+            into[key] = into.get(key, 0.0) + value
+
+class Counter(_ScalarSeries):
+    """Monotonically increasing value per label combination."""
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self, samples: Optional[Dict[LabelValues, float]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted((self.samples() if samples is None else samples).items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(_ScalarSeries):
+    """Value per label combination that can go up and down."""
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self, samples: Optional[Dict[LabelValues, float]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted((self.samples() if samples is None else samples).items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+HistogramSeries = Tuple[List[int], List[float]] # bucket counts (+Inf last), [sum, count]
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, plus their sum and count."""
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {} # bucket counts (+Inf last), [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, totals = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return series[1][1] if series else 0
+
+    def sum(self, **labels: str) -> float:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return series[1][0] if series else 0.0
+
+    def samples(self) -> Dict[LabelValues, HistogramSeries]:
+        with self._lock:
+            return {key: (list(counts), list(totals)) for key, (counts, totals) in self._series.items()}
+
+    @staticmethod
+    def encode(samples: Dict[LabelValues, HistogramSeries]) -> List[Any]:
+        return [[list(key), counts, totals] for key, (counts, totals) in samples.items()]
+
+    @staticmethod
+    def decode(series: List[Any]) -> Dict[LabelValues, HistogramSeries]:
+        return {tuple(key): (counts, totals) for key, counts, totals in series}
+
+    @staticmethod
+    def merge(into: Dict[LabelValues, HistogramSeries], samples: Dict[LabelValues, HistogramSeries]) -> None:
+        for key, (counts, totals) in samples.items():
+            if key not in into:
+                into[key] = (list(counts), list(totals))
+                continue
+            merged_counts, merged_totals = into[key]
+            for i, count in enumerate(counts[:len(merged_counts)]): # Same buckets in every worker
+                merged_counts[i] += count
+            merged_totals[0] += totals[0]
+            merged_totals[1] += totals[1]
+
+    def render(self, samples: Optional[Dict[LabelValues, HistogramSeries]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, totals) in sorted((self.samples() if samples is None else samples).items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + [float("inf")], counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(totals[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(totals[1])}")
+        return lines
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # Exists, but belongs to someone else
+    return True
+
+class MetricsRegistry:
+    """
+    Named metrics of this process; registering an existing name returns the same metric.
+    With a `multiprocess_dir`, rendering covers every worker writing to that directory.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, multiprocess_dir: Optional[str] = None, flush_interval: float = 5.0):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+        self._stopping = threading.Event()
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        with self._lock:
+            return self._metrics.setdefault(name, Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Iterable[str] = ()) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, documentation, buckets, labelnames))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """This process's values, in the form written to the multiprocess directory."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: {"type": metric.TYPE, "series": metric.encode(metric.samples())} for metric in metrics}
+
+    def flush(self) -> None:
+        """Write this process's values to <multiprocess_dir>/<pid>.json (atomically)."""
+        if not self.multiprocess_dir:
+            return
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass # Metrics must never break the worker; the next flush retries
+
+    def start(self) -> None:
+        """Flush every flush_interval seconds in the background (once per process, e.g. from the app lifespan)."""
+        if not self.multiprocess_dir or self._flusher_pid == os.getpid():
+            return
+        self._stopping.clear()
+        self._flusher_pid = os.getpid() # A thread started before a fork does not exist in the child
+        self._flusher = threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def stop(self) -> None:
+        """Stop the background flushes after a final one."""
+        self._stopping.set()
+        self.flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+    def _merged_samples(self, metrics: List[Any]) -> Dict[str, Dict[LabelValues, Any]]:
+        by_name = {metric.name: metric for metric in metrics}
+        merged: Dict[str, Dict[LabelValues, Any]] = {}
+        for path in glob.glob(os.path.join(self.multiprocess_dir, "*.json")):
+            pid = os.path.basename(path)[:-len(".json")]
+            try:
+                with open(path) as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = pid.isdigit() and _process_alive(int(pid))
+            for name, entry in values.items():
+                metric = by_name.get(name)
+                if metric is None or entry.get("type") != metric.TYPE:
+                    continue
+                if metric.TYPE == "gauge" and not alive:
+                    continue # A dead worker's in-flight requests and queues are gone
+                metric.merge(merged.setdefault(name, {}), metric.decode(entry["series"]))
+        return merged
+
+    def render(self) -> str:
+        """All metrics in the text format: this process's, or every worker's in multiprocess mode (blocking)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        if not self.multiprocess_dir:
+            return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+        self.flush() # Include this worker's latest values
+        merged = self._merged_samples(metrics)
+        return "\n".join(line for metric in metrics for line in metric.render(merged.get(metric.name, {}))) + "\n"
+
+# Create a global instance
+metrics = MetricsRegistry(settings.METRICS_MULTIPROC_DIR or None, settings.METRICS_FLUSH_INTERVAL)
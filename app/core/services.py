@@ -0,0 +1,101 @@
+"""
+Lazily built service singletons.
+
+Service modules register a factory here instead of constructing their client at
+import time. The module-level name they export (e.g. `gemini_service`) is a
+LazyService proxy: the first attribute access builds the real instance,
+configuring the SDK and opening its connection pool. Importing the API therefore
+no longer pays for every client up front, and a worker only builds the clients
+its requests use. The app's lifespan can build some of them eagerly
+(SERVICES_PRELOAD) and closes whatever was built on shutdown.
+"""
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+from .logging import logger
+from .metrics import metrics
+
+SERVICE_INIT_SECONDS = metrics.histogram(
+    "service_init_seconds", "Time spent constructing a service", (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5), ["service"]
+)
+
+class LazyService:
+    """Stands in for a registered service and forwards attribute access to it, building it on first use."""
+
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: "ServiceRegistry", name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._registry.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self._registry.get(self._name), attr, value)
+
+    def __repr__(self) -> str:
+        state = "built" if self._registry.is_built(self._name) else "not built"
+        return f"<LazyService {self._name} ({state})>"
+
+class ServiceRegistry:
+    """Factories and (once built) instances of the process's services."""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {} # In construction order
+        self._lock = threading.RLock() # Factories may use other services
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyService:
+        """Register `factory` under `name` and return the proxy to export in its place."""
+        self._factories[name] = factory
+        return LazyService(self, name)
+
+    def get(self, name: str) -> Any:
+        """The instance registered as `name`, built now if needed. Construction errors propagate and are retried on the next call."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                elapsed = time.perf_counter() - started
+                SERVICE_INIT_SECONDS.observe(elapsed, service=name)
+                logger.info(f"Initialized {name} service in {elapsed * 1000:.0f} ms")
+            return self._instances[name]
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def built(self) -> List[str]:
+        return list(self._instances)
+
+    def preload(self, names: Iterable[str]) -> None:
+        """Build the named services now; failures are logged, leaving them to be retried on first use."""
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Failed to initialize {name} service: {e}")
+
+    async def aclose(self) -> None:
+        """Close every built service (aclose() or close(), newest first) and forget it."""
+        for name in reversed(list(self._instances)):
+            instance = self._instances.pop(name)
+            close = getattr(instance, "aclose", None) or getattr(instance, "close", None)
+            if close is None:
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error closing {name} service: {e}")
+
+# Create a global instance
+services = ServiceRegistry()
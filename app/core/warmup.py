@@ -0,0 +1,104 @@
+"""
+Startup warm-up.
+
+After a deploy or worker recycle, the first call to every provider pays for DNS,
+TCP and TLS setup. The lifespan starts this warm-up in the background: for each
+provider in WARMUP_PROVIDERS it resolves the host and opens that many pooled
+keep-alive connections on the shared transport. With WARMUP_PRELOAD_INDEXES it
+also loads the in-memory Jamendo catalog and audio similarity indexes that the
+first searches would otherwise load. /api/v1/health answers 503 "warming_up"
+until this has finished, so the load balancer only routes to warm workers.
+Warm-up is best effort: a provider that fails or times out is reported, but it
+does not keep the worker from becoming ready.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from .config import settings
+from .executors import bulkheads
+from .http_transport import http_transport, parse_host_limits, SharedHTTPTransport
+from .logging import logger
+
+PROVIDER_ORIGINS = {
+    "musixmatch": "https://api.musixmatch.com",
+    "jamendo": "https://api.jamendo.com",
+    "wikipedia": "https://en.wikipedia.org",
+    "acoustid": "https://api.acoustid.org",
+    "zyla": "https://zylalabs.com",
+    "discogs": "https://api.discogs.com",
+}
+
+async def _preload_indexes() -> None:
+    from ..services.audio.matcher import audio_similarity_index
+    from ..services.metadata.jamendo_catalog import jamendo_catalog_index
+    if jamendo_catalog_index.store.available and not jamendo_catalog_index.loaded:
+        await bulkheads["index"].run(jamendo_catalog_index.load)
+    await bulkheads["index"].run(audio_similarity_index.ensure_loaded)
+
+class StartupWarmup:
+    """Warms provider connections (and optionally indexes) once, and tracks readiness."""
+
+    def __init__(self, transport: SharedHTTPTransport, providers: Dict[str, int], timeout: float, preload_indexes: bool = False):
+        self.transport = transport
+        self.providers = providers
+        self.timeout = timeout
+        self.preload_indexes = preload_indexes
+        self.ready = False
+        self.duration_ms: Optional[int] = None
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _step(self, name: str, coro) -> None:
+        started = time.perf_counter()
+        self.results[name] = {"status": "running"}
+        try:
+            await coro
+            self.results[name] = {"status": "ok"}
+        except asyncio.CancelledError:
+            self.results[name] = {"status": "timed out"}
+            raise
+        except Exception as e:
+            self.results[name] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        self.results[name]["ms"] = round((time.perf_counter() - started) * 1000)
+
+    async def run(self) -> None:
+        """Run every step concurrently, bounded by the timeout; the worker is ready afterwards either way."""
+        started = time.perf_counter()
+        steps = []
+        for name, connections in self.providers.items():
+            origin = PROVIDER_ORIGINS.get(name)
+            if origin is None:
+                logger.warning(f"Unknown warm-up provider {name!r}; known: {', '.join(PROVIDER_ORIGINS)}")
+                continue
+            steps.append(self._step(name, self.transport.warm(origin, connections)))
+        if self.preload_indexes:
+            steps.append(self._step("indexes", _preload_indexes()))
+        try:
+            await asyncio.wait_for(asyncio.gather(*steps), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Warm-up did not finish within {self.timeout:.0f}s")
+        finally:
+            self.duration_ms = round((time.perf_counter() - started) * 1000)
+            self.ready = True
+        logger.info(f"Warm-up finished in {self.duration_ms} ms: {self.results}")
+
+    def start(self) -> asyncio.Task:
+        """Run the warm-up in the background (from the lifespan)."""
+        self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def report(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "duration_ms": self.duration_ms, "steps": self.results}
+
+# Create a global instance
+startup_warmup = StartupWarmup(
+    http_transport,
+    providers=parse_host_limits(settings.WARMUP_PROVIDERS),
+    timeout=settings.WARMUP_TIMEOUT,
+    preload_indexes=settings.WARMUP_PRELOAD_INDEXES
+)
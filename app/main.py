@@ -1,18 +1,42 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
 import os
 from .api.v1.router import api_router
 from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.exceptions import BulkheadFullError
+from app.core.config import settings
+from app.core.executors import bulkheads
+from app.core.services import services
+from app.core.http_transport import http_transport
+from app.core.warmup import startup_warmup
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Services are built on first use; SERVICES_PRELOAD moves that cost to startup
+    services.preload(name.strip() for name in settings.SERVICES_PRELOAD.split(",") if name.strip())
+    startup_warmup.start() # Health reports ready once it has finished
+    metrics.start() # Shares this worker's metrics with the others (multiprocess mode)
+    yield
+    await startup_warmup.stop()
+    metrics.stop()
+    logger.info(f"Shutting down, closing services: {services.built()}")
+    await services.aclose()
+    await http_transport.shutdown()
+    bulkheads.shutdown()
+
 # Create FastAPI app
 app = FastAPI(
     title="SoundMatch AI",
     description="AI-powered music similarity search platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 logger.info("FastAPI application starting up...")
@@ -37,15 +61,30 @@ app.add_middleware(
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
 
-# Health check endpoint
+# A saturated bulkhead fails fast; tell clients to come back shortly
+@app.exception_handler(BulkheadFullError)
+async def bulkhead_full_handler(request, exc: BulkheadFullError):
+    logger.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# Health check endpoint; 503 until the startup warm-up has finished
 @app.get("/api/v1/health")
-async def health_check():
+async def health_check(response: Response):
+    if not startup_warmup.ready:
+        response.status_code = 503
     return {
-        "status": "healthy",
+        "status": "healthy" if startup_warmup.ready else "warming_up",
         "version": "1.0.0",
-        "environment": os.getenv("APP_ENV", "development")
+        "environment": os.getenv("APP_ENV", "development"),
+        "warmup": startup_warmup.report()
     }
 
+# Prometheus metrics of every worker process (multiprocess mode), or of this one
+@app.get("/api/v1/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # Reading the other workers' files is blocking I/O
+    return Response(await bulkheads["storage"].run(metrics.render), media_type=metrics.CONTENT_TYPE)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -1,29 +1,127 @@
-import google.generativeai as genai
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
+import hashlib
 import json
+import re
+from app.core.cache import PersistentTTLCache
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.services import services
 from app.core.exceptions import AIServiceError
+from app.services.ai.keyword_engine import keyword_engine
+from app.services.ai.prompt_builder import analysis_prompt_builder
+from app.services.ai.semantic_cache import semantic_analysis_cache
+from app.utils.json_stream import StreamingFieldParser
 import asyncio
-import re
+import time
+
+GEMINI_CALLS = metrics.counter("gemini_requests_total", "Gemini calls by kind and outcome", ["kind", "outcome"])
+GEMINI_TOKENS = metrics.counter("gemini_tokens_total", "Tokens reported by Gemini", ["kind", "direction"])
+GEMINI_PROMPT_TOKENS = metrics.histogram(
+    "gemini_prompt_tokens", "Prompt tokens per Gemini call", (256, 512, 1024, 2048, 4096, 8192, 16384), ["kind"]
+)
+GEMINI_RESPONSE_TOKENS = metrics.histogram(
+    "gemini_response_tokens", "Response tokens per Gemini call", (64, 128, 256, 512, 1024, 2048, 4096), ["kind"]
+)
+GEMINI_LATENCY = metrics.histogram(
+    "gemini_request_duration_seconds", "Gemini call latency", (0.25, 0.5, 1, 2, 4, 8, 16, 32), ["kind"]
+)
+GEMINI_KEYWORDS_LATENCY = metrics.histogram(
+    "gemini_time_to_keywords_seconds", "Time until streamed keywords were complete", (0.25, 0.5, 1, 2, 4, 8, 16)
+)
 
 class GeminiService:
     """Service for interacting with Google Gemini API."""
 
+    ANALYSIS_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "description": {"type": "string"},
+            "keywords": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["description", "keywords"],
+    }
+    BATCH_SCHEMA = {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {"index": {"type": "integer"}, **ANALYSIS_SCHEMA["properties"]},
+            "required": ["index", "description", "keywords"],
+        },
+    }
+    MAX_ATTEMPTS = 2
+    # Bump whenever the prompt template or schema changes; older cached analyses stop matching
+    PROMPT_VERSION = "4"
+    # Volatile identifiers and counters that do not change what the analysis should say
+    CACHE_KEY_IGNORED_FIELDS = frozenset({"musixmatch_id", "commontrack_id", "updated_time", "rating"})
+
     def __init__(self):
         self.api_key = settings.GOOGLE_GEMINI_API_KEY
         if not self.api_key:
             raise ValueError("Google Gemini API key not configured")
+        import google.generativeai as genai # Deferred: the SDK (and grpc) take most of a second to import
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel('gemini-1.5-flash') # Use a faster model if possible
+        # JSON mode, so no fence stripping is needed. No response_schema here: the API emits
+        # schema properties alphabetically, and streaming needs "keywords" ahead of "description".
+        self.generation_config = genai.GenerationConfig(response_mime_type="application/json")
+        self.batch_generation_config = genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=self.BATCH_SCHEMA
+        )
+        self._semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        self.analysis_cache = PersistentTTLCache("gemini_analysis", ttl=settings.GEMINI_CACHE_TTL)
+        self.semantic_cache = semantic_analysis_cache
+        self.keyword_engine = keyword_engine
+        self.prompts = analysis_prompt_builder
+        self._refining: Dict[str, asyncio.Task] = {} # Background refinements by cache key
+
+    @classmethod
+    def _canonical_value(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return re.sub(r"\s+", " ", value).strip().casefold()
+        if isinstance(value, (list, tuple, set)):
+            items = [cls._canonical_value(item) for item in value if item not in (None, "")]
+            if all(isinstance(item, str) for item in items):
+                return sorted(set(items)) # Tag order and duplicates carry no meaning
+            return items
+        if isinstance(value, dict):
+            return {k: cls._canonical_value(v) for k, v in value.items() if v not in (None, "", [], {})}
+        return value
 
-    async def analyze_song_and_generate_keywords(self, track_metadata: Dict[str, Any]) -> Dict[str, Any]:
+    def analysis_cache_key(self, track_metadata: Dict[str, Any]) -> str:
+        """Stable hash of the canonicalized analysis input, the model and the prompt version."""
+        canonical = self._canonical_value({
+            k: v for k, v in track_metadata.items() if k not in self.CACHE_KEY_IGNORED_FIELDS
+        })
+        payload = json.dumps(
+            {"prompt_version": self.PROMPT_VERSION, "model": self.model.model_name, "input": canonical},
+            sort_keys=True, separators=(",", ":"), default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def invalidate_analysis_cache(self) -> int:
+        """Drop every cached analysis (e.g. after editing the prompt without bumping PROMPT_VERSION)."""
+        removed = self.analysis_cache.clear()
+        self.semantic_cache.clear()
+        logger.info(f"Invalidated {removed} cached Gemini analyses")
+        return removed
+
+    async def analyze_song_and_generate_keywords(
+        self,
+        track_metadata: Dict[str, Any],
+        on_keywords: Optional[Callable[[List[str]], None]] = None
+    ) -> Dict[str, Any]:
         """
         Analyzes track metadata using Gemini to generate a description and keywords
         suitable for finding similar royalty-free tracks.
 
         Args:
             track_metadata: Dictionary containing track info (title, artist, genres, etc.)
+            on_keywords: Called once with the keywords as soon as they are known; the
+                response is streamed, so this happens while the description is still
+                being generated. The final result's keywords can differ only if the
+                first streamed response turned out malformed and was retried.
 
         Returns:
             Dictionary with 'description' and 'keywords' (list of strings).
@@ -31,113 +129,237 @@ class GeminiService:
         Raises:
             AIServiceError: If the Gemini API call fails or returns unexpected data.
         """
-        title = track_metadata.get("title", "Unknown Title")
-        artist = track_metadata.get("artist", "Unknown Artist")
-        genres = track_metadata.get("genres", [])
-        rating = track_metadata.get("rating")
-        instrumental = track_metadata.get("instrumental")
-
-        # Construct conditional parts of the prompt
-        genre_info = f"with genre(s) {', '.join(genres)}" if genres else ""
-        instrumental_info = "which is instrumental" if instrumental else ""
-        rating_info = f"and has a rating of {rating}" if rating is not None else ""
-
-        # Check for MusicBrainz tags
-        musicbrainz_tags = track_metadata.get('musicbrainz_tags')
-        musicbrainz_info = ""
-        if musicbrainz_tags:
-            musicbrainz_info = f" MusicBrainz tags suggest: {', '.join(musicbrainz_tags[:5])}."
-            
-        # Check for Discogs data (styles, year)
-        discogs_styles = track_metadata.get('discogs_styles')
-        discogs_year = track_metadata.get('discogs_year')
-        discogs_info = ""
-        if discogs_year:
-             discogs_info += f" Released around {discogs_year}."
-        if discogs_styles:
-             discogs_info += f" Discogs styles include: {', '.join(discogs_styles[:3])}."
-
-        prompt = f"""
-        Analyze the song "{title}" by "{artist}". You have the following metadata:
-        - Musixmatch Data: {{'title': '{title}', 'artist': '{artist}', 'genres': {genres}, 'instrumental': {instrumental}, 'rating': {rating}}}
-        - MusicBrainz Data: {musicbrainz_info if musicbrainz_info else 'Not Available'}
-        - Discogs Data: {discogs_info if discogs_info else 'Not Available'}
-
-        Synthesize insights from the available structured data AND your internal knowledge base to perform the following tasks:
-
-        1.  **Provide a SPECIFIC technical description (3-4 sentences)** focusing on objective musical characteristics useful for finding similar *royalty-free* music. 
-            *   Synthesize information from Musixmatch genres, Discogs genres/styles, and MusicBrainz tags to determine the most likely subgenre(s) and overall sound.
-            *   **Use your internal knowledge** about the song and artist to enrich the description with details about characteristic instrumentation (e.g., specific synth models used, unique guitar sounds), production techniques (e.g., reverb style, drum machine sound), or common interpretations/cultural context, *if known and relevant*.
-            *   Use the Discogs year for era context.
-            *   Infer distinctive instrumentation (beyond basic drums/bass/guitar) and vocal styles (e.g., falsetto, rap, male/female lead, harmonies) if implied by the combined metadata (artist, genre, styles, era) **or your internal knowledge**.
-            *   Estimate tempo range and primary mood/energy based on the synthesized understanding.
-            *   Example: Instead of 'Pop song with vocals', aim for 'Upbeat 80s synth-pop with prominent synthesizers (like Juno or DX7 sounds), gated reverb drums, and a clear male lead vocal'. Instead of 'Funk track', aim for 'Minimalist mid-80s funk with a distinctive falsetto vocal, LinnDrum machine beat, and sparse, clean guitar riff'.
-            *   Prioritize provided metadata, but enhance with verifiable internal knowledge. Avoid pure speculation.
-            *   Do NOT mention if the track is explicit.
-
-        2.  **Generate a list of 6-8 SPECIFIC keywords** (tags) suitable for searching a royalty-free music library. Keywords MUST reflect the synthesized understanding of the track.
-            *   **Prioritize Specificity:** Start with the most specific Genre/Style terms available (Discogs Styles first, then Musixmatch Genres, then Discogs Genres, then relevant MusicBrainz tags).
-            *   Add 1-2 keywords reflecting the primary Mood/Energy (e.g., 'upbeat', 'melancholic', 'driving', 'chill').
-            *   Add 1 keyword reflecting the Era (using Discogs Year if available, e.g., '80s', '2010s').
-            *   Add 1-2 keywords for distinctive Instrumentation or Production elements identified (e.g., 'synthesizer', 'falsetto', 'drum machine', 'gated reverb', 'LinnDrum').
-            *   Add 'vocal' or 'instrumental' based on the input flag.
-            *   Ensure keywords are common search terms. Output *only* the keywords as a JSON list of strings.
-
-        Example Input Data (Depeche Mode): {{...}} # Keep existing example
-        Example Input Data (Prince - Kiss): {{ 'title': 'Kiss', 'artist': 'Prince', 'genres': [], 'instrumental': False, 'rating': 63, 'discogs_styles': ['Funk'], 'discogs_year': 1986, 'discogs_genres': ['Funk / Soul', 'Pop'] }}
-        Example Output (Prince - Kiss): 
-        {{
-          "description": "A minimalist mid-80s funk track (1986) featuring a distinctive falsetto vocal. The arrangement likely relies heavily on a syncopated drum machine beat and a signature funky guitar riff, with less emphasis on bass compared to traditional funk. The mood is upbeat, confident, and danceable.",
-          "keywords": ["Funk", "Minimal Funk", "80s", "Falsetto", "Upbeat", "Danceable", "Vocal", "Drum Machine"]
-        }}
-
-        Input Data: {json.dumps(track_metadata)}
-        Output (JSON):
+        cache_key = self.analysis_cache_key(track_metadata)
+        cached = await self._cached_analysis(cache_key, track_metadata) or self._rule_based_analysis(cache_key, track_metadata)
+        if cached is not None:
+            if on_keywords is not None:
+                self._emit_keywords(on_keywords, cached["keywords"])
+            return cached
+
+        analysis_result = await self._generate_analysis(track_metadata, on_keywords)
+        await self._store_analysis(cache_key, track_metadata, analysis_result)
+        return analysis_result
+
+    async def analyze_batch(self, tracks: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Analyze many tracks with few requests, for bulk enrichment jobs.
+
+        Uncached tracks are packed GEMINI_BATCH_SIZE at a time into one prompt that
+        carries the instruction block once and asks for a JSON array with one result
+        per track. Each element is validated on its own; only tracks whose result is
+        missing or malformed are sent again, up to MAX_ATTEMPTS rounds.
+
+        Returns:
+            One analysis per input track, in order; None for tracks that still failed.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tracks)
+        pending: Dict[str, List[int]] = {} # cache key -> positions (duplicates analysed once)
+        for position, track_metadata in enumerate(tracks):
+            cache_key = self.analysis_cache_key(track_metadata)
+            if cache_key in pending:
+                pending[cache_key].append(position)
+                continue
+            cached = await self._cached_analysis(cache_key, track_metadata)
+            if cached is not None:
+                results[position] = cached
+            else:
+                pending[cache_key] = [position]
+
+        batch_size = max(1, settings.GEMINI_BATCH_SIZE)
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            if not pending:
+                break
+            keys = list(pending)
+            chunks = [keys[i:i + batch_size] for i in range(0, len(keys), batch_size)]
+            outcomes = await asyncio.gather(*(
+                self._generate_batch([tracks[pending[key][0]] for key in chunk]) for chunk in chunks
+            ))
+            for chunk, analyses in zip(chunks, outcomes):
+                for key, analysis_result in zip(chunk, analyses):
+                    if analysis_result is None:
+                        continue
+                    positions = pending.pop(key)
+                    await self._store_analysis(key, tracks[positions[0]], analysis_result)
+                    for position in positions:
+                        results[position] = analysis_result
+            if pending:
+                logger.warning(f"Gemini batch round {attempt}/{self.MAX_ATTEMPTS}: {len(pending)} of {len(tracks)} tracks need another attempt")
+
+        if pending:
+            logger.error(f"Gemini batch analysis failed for {len(pending)} of {len(tracks)} tracks")
+        return results
+
+    async def _cached_analysis(self, cache_key: str, track_metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Exact cache hit, else a near-duplicate analysis, else None."""
+        cached = await self.analysis_cache.get_async(cache_key)
+        if cached is not None:
+            logger.info(f"Gemini analysis cache hit for {track_metadata.get('title', 'Unknown Title')}")
+            self.semantic_cache.add(cache_key, track_metadata, cached)
+            return cached
+        # Same artist/genres/styles/era as an analysed track: its keywords fit this one too
+        return self.semantic_cache.lookup(track_metadata)
+
+    def _rule_based_analysis(self, cache_key: str, track_metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Local keywords for well-tagged tracks, per KEYWORD_RULES_MODE: "bypass" skips
+        Gemini, "background" answers now and lets Gemini refine the cached analysis.
         """
-        
+        mode = settings.KEYWORD_RULES_MODE
+        if mode not in ("bypass", "background"):
+            return None
+        if self.keyword_engine.coverage(track_metadata) < settings.KEYWORD_RULES_MIN_COVERAGE:
+            return None
+        analysis_result = self.keyword_engine.generate(track_metadata)
+        if analysis_result is None:
+            return None
+        logger.info(f"Rule-based keywords for {track_metadata.get('title', 'Unknown Title')} ({mode}): {analysis_result['keywords']}")
+        if mode == "background" and cache_key not in self._refining:
+            task = asyncio.ensure_future(self._refine_in_background(cache_key, track_metadata))
+            self._refining[cache_key] = task
+            task.add_done_callback(lambda _: self._refining.pop(cache_key, None))
+        return analysis_result
+
+    async def _refine_in_background(self, cache_key: str, track_metadata: Dict[str, Any]) -> None:
+        """Run the full Gemini analysis so the next request for this track gets it from the cache."""
+        try:
+            analysis_result = await self._generate_analysis(track_metadata)
+            await self._store_analysis(cache_key, track_metadata, analysis_result)
+        except AIServiceError as e:
+            logger.warning(f"Background Gemini refinement failed for {track_metadata.get('title', 'Unknown Title')}: {e}")
+
+    async def _store_analysis(self, cache_key: str, track_metadata: Dict[str, Any], analysis_result: Dict[str, Any]) -> None:
+        await self.analysis_cache.set_async(cache_key, {
+            "description": analysis_result["description"],
+            "keywords": analysis_result["keywords"],
+        })
+        self.semantic_cache.add(cache_key, track_metadata, analysis_result)
+
+    def _record_call(self, kind: str, outcome: str, started: float, usage: Any = None) -> None:
+        """Export latency and token counts of one Gemini call."""
+        elapsed = time.perf_counter() - started
+        GEMINI_CALLS.inc(kind=kind, outcome=outcome)
+        GEMINI_LATENCY.observe(elapsed, kind=kind)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        if prompt_tokens or response_tokens:
+            GEMINI_TOKENS.inc(prompt_tokens, kind=kind, direction="prompt")
+            GEMINI_TOKENS.inc(response_tokens, kind=kind, direction="response")
+            GEMINI_PROMPT_TOKENS.observe(prompt_tokens, kind=kind)
+            GEMINI_RESPONSE_TOKENS.observe(response_tokens, kind=kind)
+        logger.info(f"Gemini {kind} call ({outcome}): {prompt_tokens} prompt + {response_tokens} response tokens in {elapsed:.2f}s")
+
+    async def _generate_batch(self, tracks: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """One request for several tracks; None for each track whose result is missing or invalid."""
+        analyses: List[Optional[Dict[str, Any]]] = [None] * len(tracks)
+        prompt = self.prompts.batch(tracks)
+        started = time.perf_counter()
+        response = None
+        try:
+            async with self._semaphore:
+                response = await self.model.generate_content_async(prompt, generation_config=self.batch_generation_config)
+            items = json.loads(response.text)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Failed to decode JSON from Gemini batch response: {e}")
+            self._record_call("batch", "malformed", started, getattr(response, "usage_metadata", None))
+            return analyses
+        except Exception as e:
+            logger.error(f"Error during Gemini batch call: {str(e)}", exc_info=True)
+            self._record_call("batch", "error", started)
+            return analyses
+        self._record_call("batch", "ok", started, getattr(response, "usage_metadata", None))
+        if not isinstance(items, list):
+            logger.warning("Gemini batch response is not a JSON array")
+            return analyses
+
+        for position, item in enumerate(items):
+            index = item.get("index", position) if isinstance(item, dict) else position
+            if not isinstance(index, int) or not 0 <= index < len(tracks) or analyses[index] is not None:
+                continue
+            try:
+                analysis_result = self._validate_analysis(item)
+            except AIServiceError as e:
+                logger.warning(f"Invalid Gemini batch element for song {index}: {e}")
+                continue
+            analyses[index] = {"description": analysis_result["description"], "keywords": analysis_result["keywords"]}
+        return analyses
+
+    async def _generate_analysis(
+        self,
+        track_metadata: Dict[str, Any],
+        on_keywords: Optional[Callable[[List[str]], None]] = None
+    ) -> Dict[str, Any]:
+        """Build the prompt for `track_metadata` and stream Gemini's analysis."""
+        prompt = self.prompts.single(track_metadata)
         logger.debug(f"Sending prompt to Gemini: \n{prompt}")
 
+        keywords_sent = on_keywords is None
+        last_error: Optional[AIServiceError] = None
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            started = time.perf_counter()
+            usage = None
+            try:
+                # Native async call: no thread is held while waiting on the model
+                async with self._semaphore:
+                    response = await self.model.generate_content_async(prompt, generation_config=self.generation_config, stream=True)
+                    parser = StreamingFieldParser("keywords")
+                    parts = []
+                    async for chunk in response:
+                        parts.append(chunk.text)
+                        usage = getattr(chunk, "usage_metadata", None) or usage # Totals arrive with the last chunk
+                        if keywords_sent:
+                            continue
+                        keywords = parser.feed(chunk.text)
+                        if isinstance(keywords, list) and keywords and all(isinstance(kw, str) for kw in keywords):
+                            keywords_sent = True
+                            GEMINI_KEYWORDS_LATENCY.observe(time.perf_counter() - started)
+                            self._emit_keywords(on_keywords, keywords)
+                text = "".join(parts)
+                logger.debug(f"Raw Gemini response: {text}")
+                analysis_result = self._parse_analysis(text)
+                self._record_call("single", "ok", started, usage)
+                return analysis_result
+            except AIServiceError as e:
+                # Malformed output is rare in JSON mode; ask again rather than failing the request
+                self._record_call("single", "malformed", started, usage)
+                last_error = e
+                logger.warning(f"Gemini returned malformed output (attempt {attempt}/{self.MAX_ATTEMPTS}): {e}")
+            except Exception as e:
+                # Catch potential errors from the SDK call or other issues
+                self._record_call("single", "error", started, usage)
+                logger.error(f"Error during Gemini API call or processing: {str(e)}", exc_info=True)
+                raise AIServiceError(f"AI service request failed: {str(e)}")
+        raise last_error
+
+    @staticmethod
+    def _emit_keywords(on_keywords: Callable[[List[str]], None], keywords: List[str]) -> None:
         try:
-            # Use asyncio.to_thread for the synchronous SDK call
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                prompt
-            )
-            
-            # Debug: Log raw response text
-            logger.debug(f"Raw Gemini response: {response.text}")
-            
-            # Attempt to extract JSON from the response text
-            # Handle potential markdown code fences (```json ... ```)
-            match = re.search(r"```json\n(.*?)\n```", response.text, re.DOTALL)
-            if match:
-                json_text = match.group(1).strip()
-            else:
-                # Assume the whole text might be JSON if no fences found
-                json_text = response.text.strip()
-                
-            analysis_result = json.loads(json_text)
-
-            if not isinstance(analysis_result, dict) or \
-               "description" not in analysis_result or \
-               "keywords" not in analysis_result or \
-               not isinstance(analysis_result["keywords"], list):
-                raise AIServiceError("Invalid format in Gemini response.")
-            
-            # Basic validation for keywords list elements
-            if not all(isinstance(kw, str) for kw in analysis_result["keywords"]):
-                 raise AIServiceError("Invalid keyword format in Gemini response keywords list.")
-
-            return analysis_result
-        
+            on_keywords(list(keywords))
+        except Exception as e:
+            logger.error(f"on_keywords callback failed: {e}", exc_info=True)
+
+    @classmethod
+    def _parse_analysis(cls, text: str) -> Dict[str, Any]:
+        """Parse and validate the model's JSON output."""
+        try:
+            analysis_result = json.loads(text)
         except json.JSONDecodeError as e:
-            logger.error(f"Failed to decode JSON from Gemini response: {e}\nResponse text: {response.text}")
+            logger.error(f"Failed to decode JSON from Gemini response: {e}\nResponse text: {text}")
             raise AIServiceError(f"Failed to parse JSON from AI service: {e}")
-        except Exception as e:
-            # Catch potential errors from the SDK call or other issues
-            logger.error(f"Error during Gemini API call or processing: {str(e)}", exc_info=True)
-            raise AIServiceError(f"AI service request failed: {str(e)}")
+        return cls._validate_analysis(analysis_result)
+
+    @staticmethod
+    def _validate_analysis(analysis_result: Any) -> Dict[str, Any]:
+        if not isinstance(analysis_result, dict) or \
+           not isinstance(analysis_result.get("description"), str) or \
+           not isinstance(analysis_result.get("keywords"), list):
+            raise AIServiceError("Invalid format in Gemini response.")
+
+        # Basic validation for keywords list elements
+        if not all(isinstance(kw, str) for kw in analysis_result["keywords"]):
+            raise AIServiceError("Invalid keyword format in Gemini response keywords list.")
+
+        return analysis_result
 
 # Create a global instance
 # Consider making this configurable or using dependency injection
-gemini_service = GeminiService() 
\ No newline at end of file
+gemini_service = services.register("gemini", GeminiService)
\ No newline at end of file
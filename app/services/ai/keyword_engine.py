@@ -0,0 +1,181 @@
+"""
+Deterministic keyword generator for tracks with rich metadata.
+
+When Musixmatch genres, Discogs styles/year and MusicBrainz tags are all known,
+Gemini's keywords are mostly a reshuffle of them plus an era and a mood. This
+engine produces the same kind of list locally: input terms are folded onto a
+curated genre/style taxonomy, weighted by how many sources mention them (and
+how prominently), and completed with an era bucket, moods implied by the top
+genres and a vocal/instrumental flag.
+"""
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Canonical genre/style -> moods it usually implies. Canonical names double as
+# the keywords we emit, so they use the wording Jamendo tags use.
+TAXONOMY: Dict[str, Tuple[str, ...]] = {
+    "rock": ("energetic",),
+    "alternative rock": ("energetic",),
+    "indie rock": ("energetic",),
+    "hard rock": ("powerful",),
+    "punk": ("aggressive",),
+    "metal": ("aggressive",),
+    "grunge": ("dark",),
+    "pop": ("upbeat",),
+    "synthpop": ("upbeat",),
+    "indie pop": ("dreamy",),
+    "electronic": ("driving",),
+    "house": ("danceable",),
+    "techno": ("driving",),
+    "trance": ("euphoric",),
+    "drum and bass": ("energetic",),
+    "dubstep": ("dark",),
+    "ambient": ("calm",),
+    "downtempo": ("chill",),
+    "trip hop": ("moody",),
+    "lounge": ("relaxed",),
+    "chillout": ("chill",),
+    "idm": ("experimental",),
+    "new wave": ("upbeat",),
+    "disco": ("danceable",),
+    "dance": ("danceable",),
+    "funk": ("groovy",),
+    "soul": ("warm",),
+    "rnb": ("smooth",),
+    "hiphop": ("confident",),
+    "jazz": ("smooth",),
+    "blues": ("melancholic",),
+    "country": ("warm",),
+    "folk": ("acoustic",),
+    "singer songwriter": ("intimate",),
+    "reggae": ("relaxed",),
+    "latin": ("festive",),
+    "world": ("exotic",),
+    "classical": ("elegant",),
+    "soundtrack": ("cinematic",),
+    "experimental": ("experimental",),
+    "gospel": ("uplifting",),
+}
+
+# Folded variant -> canonical taxonomy name
+SYNONYMS: Dict[str, str] = {
+    "hiphop": "hiphop", "rap": "hiphop", "hip hop": "hiphop", "gangsta": "hiphop", "trap": "hiphop",
+    "rnb": "rnb", "r&b": "rnb", "rhythm and blues": "rnb", "contemporary r&b": "rnb", "neo soul": "soul",
+    "synth pop": "synthpop", "synthpop": "synthpop", "electropop": "synthpop", "electro pop": "synthpop",
+    "dance pop": "pop", "pop rock": "rock", "soft rock": "rock", "classic rock": "rock",
+    "alternative": "alternative rock", "alt rock": "alternative rock", "indie": "indie rock",
+    "heavy metal": "metal", "thrash": "metal", "death metal": "metal", "punk rock": "punk", "hardcore": "punk",
+    "electronica": "electronic", "electro": "electronic", "edm": "electronic", "deep house": "house",
+    "tech house": "house", "acid house": "house", "minimal": "techno", "dnb": "drum and bass",
+    "drum n bass": "drum and bass", "drum & bass": "drum and bass", "jungle": "drum and bass", "chill out": "chillout", "chill": "chillout",
+    "trip-hop": "trip hop", "triphop": "trip hop", "synthwave": "synthpop", "new romantic": "new wave",
+    "funk / soul": "funk", "p.funk": "funk", "p funk": "funk", "minimal funk": "funk", "boogie": "funk",
+    "smooth jazz": "jazz", "jazz fusion": "jazz", "fusion": "jazz", "bossa nova": "latin", "salsa": "latin",
+    "reggaeton": "latin", "dancehall": "reggae", "dub": "reggae", "score": "soundtrack", "film score": "soundtrack",
+    "stage & screen": "soundtrack", "modern classical": "classical", "contemporary classical": "classical",
+    "acoustic": "folk", "folk rock": "folk", "americana": "country", "singer-songwriter": "singer songwriter",
+    "euro house": "house", "eurodance": "dance", "hi nrg": "dance", "italo disco": "disco",
+}
+
+DISPLAY_NAMES = {"rnb": "RnB", "hiphop": "Hip Hop", "idm": "IDM", "synthpop": "Synth-pop", "trip hop": "Trip-hop"}
+
+SOURCE_WEIGHTS = {"discogs_styles": 1.5, "genres": 1.0, "musicbrainz_tags": 0.75}
+COVERAGE_SIGNALS = ("genres", "discogs_styles", "discogs_year", "musicbrainz_tags")
+
+def fold(term: str) -> str:
+    """Lower-case, unify separators and trim a genre/tag term."""
+    term = term.casefold().replace("_", " ").replace("-", " ")
+    return re.sub(r"\s+", " ", term).strip()
+
+def canonical_genre(term: Any) -> Optional[str]:
+    """Taxonomy name for a genre/style/tag term, or None if it is not a known genre."""
+    if not isinstance(term, str):
+        return None
+    folded = fold(term)
+    if folded in SYNONYMS:
+        return SYNONYMS[folded]
+    if folded in TAXONOMY:
+        return folded
+    squashed = folded.replace(" ", "")
+    if squashed in SYNONYMS or squashed in TAXONOMY:
+        return SYNONYMS.get(squashed, squashed)
+    # Compound labels such as Musixmatch's "R&B/Soul": use the first part we know
+    for part in re.split(r"\s*[/,]\s*", folded):
+        if part != folded and canonical_genre(part):
+            return canonical_genre(part)
+    return None
+
+def display_name(genre: str) -> str:
+    return DISPLAY_NAMES.get(genre) or " ".join(w if w == "and" else w.capitalize() for w in genre.split())
+
+def era_bucket(year: Any) -> Optional[str]:
+    """'80s' for 1986, '2010s' for 2014, matching the era keywords Gemini emits."""
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        return None
+    if not 1900 <= year <= 2100:
+        return None
+    decade = year // 10 * 10
+    return f"{decade % 100:02d}s" if decade < 2000 else f"{decade}s"
+
+class RuleBasedKeywordEngine:
+    """Builds Gemini-style keyword lists from structured metadata alone."""
+
+    MAX_GENRE_KEYWORDS = 4
+    MAX_MOOD_KEYWORDS = 2
+    MIN_GENRE_TERMS = 2 # Fewer recognised genres than this is not enough to go on
+
+    def coverage(self, track_metadata: Dict[str, Any]) -> float:
+        """Share of the metadata signals (Musixmatch genres, Discogs styles and year, MusicBrainz tags) present."""
+        return sum(1 for signal in COVERAGE_SIGNALS if track_metadata.get(signal)) / len(COVERAGE_SIGNALS)
+
+    def genre_weights(self, track_metadata: Dict[str, Any]) -> Dict[str, float]:
+        """Taxonomy genres mentioned by the inputs, weighted by source and by position within each list."""
+        weights: Dict[str, float] = defaultdict(float)
+        for source, source_weight in SOURCE_WEIGHTS.items():
+            seen = set()
+            for rank, term in enumerate(track_metadata.get(source) or []):
+                genre = canonical_genre(term)
+                if genre is None or genre in seen:
+                    continue
+                seen.add(genre)
+                # Lists come most relevant first (MusicBrainz tags by vote count)
+                weights[genre] += source_weight / (1.0 + 0.25 * rank)
+        return weights
+
+    def generate(self, track_metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Keywords (and a short templated description) for the track, or None when too
+        few of its terms map onto the taxonomy to produce a trustworthy list.
+        """
+        weights = self.genre_weights(track_metadata)
+        if len(weights) < self.MIN_GENRE_TERMS:
+            return None
+        genres = sorted(weights, key=lambda g: (-weights[g], g))[:self.MAX_GENRE_KEYWORDS]
+
+        moods: List[str] = []
+        for genre in genres:
+            for mood in TAXONOMY[genre]:
+                if mood not in moods and len(moods) < self.MAX_MOOD_KEYWORDS:
+                    moods.append(mood)
+
+        keywords = [display_name(genre) for genre in genres] + [mood.capitalize() for mood in moods]
+        era = era_bucket(track_metadata.get("discogs_year"))
+        if era:
+            keywords.append(era)
+        instrumental = track_metadata.get("instrumental")
+        if instrumental is not None:
+            keywords.append("Instrumental" if instrumental else "Vocal")
+
+        description = f"{' and '.join(moods).capitalize()} {era + ' ' if era else ''}{display_name(genres[0])} track"
+        if len(genres) > 1:
+            influences = [display_name(g) for g in genres[1:]]
+            description += f" with {', '.join(influences[:-1]) + ' and ' if len(influences) > 1 else ''}{influences[-1]} influences"
+        if instrumental is not None:
+            description += ", instrumental" if instrumental else ", with vocals"
+        return {"keywords": keywords, "description": description + ".", "source": "rules"}
+
+# Create a global instance
+keyword_engine = RuleBasedKeywordEngine()
@@ -1,6 +1,6 @@
-import google.generativeai as genai
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.services import services
 from typing import List, Optional
 
 class GeminiService:
@@ -10,6 +10,7 @@ class GeminiService:
         if not settings.GOOGLE_GEMINI_API_KEY:
             raise ValueError("Google Gemini API key not configured")
         
+        import google.generativeai as genai # Deferred: the SDK (and grpc) take most of a second to import
         genai.configure(api_key=settings.GOOGLE_GEMINI_API_KEY)
         self.model = genai.GenerativeModel('gemini-1.5-flash') # Or choose another suitable model
         logger.info("Gemini Service Initialized")
@@ -44,4 +45,4 @@ class GeminiService:
             return None
 
 # Create a global instance
-gemini_service = GeminiService() 
\ No newline at end of file
+gemini_service = services.register("gemini_keywords", GeminiService)
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Compact prompts for Gemini track analysis.
+
+Each track's metadata appears exactly once, as compact JSON with null/empty
+fields, volatile identifiers and duplicate tags removed and long lists and
+strings capped. The task instructions are written once per request (also for
+batches) and the worked example is optional, so prompt size can be traded
+against answer quality (GEMINI_PROMPT_EXAMPLE).
+"""
+import json
+from typing import Any, Dict, List
+from ...core.config import settings
+
+# Fields that do not help the analysis
+DROPPED_FIELDS = frozenset({"musixmatch_id", "commontrack_id", "updated_time", "rating", "explicit"})
+LIST_CAPS = {"genres": 5, "discogs_styles": 5, "musicbrainz_tags": 8}
+DEFAULT_LIST_CAP = 5
+MAX_STRING_LENGTH = 200
+
+ANALYSIS_INSTRUCTIONS = """Use the metadata and your knowledge of the song and artist. Prefer the metadata; avoid speculation.
+1. "keywords": 6-8 specific tags for searching a royalty-free music library, most specific first:
+   - genre/style terms (Discogs styles, then Musixmatch genres, then MusicBrainz tags)
+   - 1-2 mood/energy terms (e.g. upbeat, melancholic, driving, chill)
+   - 1 era term from the Discogs year (e.g. 80s, 2010s)
+   - 1-2 distinctive instrumentation/production terms (e.g. synthesizer, falsetto, drum machine, gated reverb)
+   - "vocal" or "instrumental" from the instrumental flag
+   Use common search terms.
+2. "description": 3-4 sentences on objective musical characteristics: likely subgenre(s) and overall sound,
+   distinctive instrumentation and vocal style, production techniques, era, tempo range and mood.
+   Do not mention explicit content.
+Write "keywords" first, then "description"."""
+
+ANALYSIS_EXAMPLE = """Example input: {"title":"Kiss","artist":"Prince","discogs_styles":["Funk"],"discogs_year":1986,"instrumental":false}
+Example output: {"keywords":["Funk","Minimal Funk","80s","Falsetto","Upbeat","Danceable","Vocal","Drum Machine"],"description":"A minimalist mid-80s funk track featuring a distinctive falsetto vocal. It relies on a syncopated drum machine beat and a signature clean guitar riff, with little bass. The mood is upbeat, confident and danceable."}"""
+
+class AnalysisPromptBuilder:
+    """Builds single-track and batched analysis prompts."""
+
+    def __init__(self, include_example: bool = True):
+        self.include_example = include_example
+
+    @staticmethod
+    def _compact_value(key: str, value: Any) -> Any:
+        if isinstance(value, str):
+            value = " ".join(value.split())
+            return value[:MAX_STRING_LENGTH] + "…" if len(value) > MAX_STRING_LENGTH else value
+        if isinstance(value, (list, tuple)):
+            items, seen = [], set()
+            for item in value:
+                if item in (None, ""):
+                    continue
+                folded = item.casefold() if isinstance(item, str) else json.dumps(item, sort_keys=True, default=str)
+                if folded not in seen:
+                    seen.add(folded)
+                    items.append(item)
+            return items[:LIST_CAPS.get(key, DEFAULT_LIST_CAP)]
+        return value
+
+    def compact_input(self, track_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """The metadata worth sending: no nulls/empties or volatile ids, deduplicated and capped."""
+        compact = {}
+        for key, value in track_metadata.items():
+            if key in DROPPED_FIELDS:
+                continue
+            value = self._compact_value(key, value)
+            if value in (None, "", [], {}):
+                continue
+            compact[key] = value
+        return compact
+
+    def _track_json(self, track_metadata: Dict[str, Any]) -> str:
+        return json.dumps(self.compact_input(track_metadata), ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def _instructions(self) -> str:
+        return ANALYSIS_INSTRUCTIONS + ("\n" + ANALYSIS_EXAMPLE if self.include_example else "")
+
+    def single(self, track_metadata: Dict[str, Any]) -> str:
+        return (
+            "Analyze this song to find similar royalty-free music.\n"
+            f"Song: {self._track_json(track_metadata)}\n"
+            f"{self._instructions()}\n"
+            "Output (JSON object):"
+        )
+
+    def batch(self, tracks: List[Dict[str, Any]]) -> str:
+        songs = "\n".join(f"Song {index}: {self._track_json(track)}" for index, track in enumerate(tracks))
+        return (
+            f"Analyze each of these {len(tracks)} songs independently to find similar royalty-free music.\n"
+            f"{songs}\n"
+            f"{self._instructions()}\n"
+            'Return a JSON array with exactly one object per song: {"index": <song number>, "keywords": [...], "description": "..."}.\n'
+            "Output (JSON array):"
+        )
+
+# Create a global instance
+analysis_prompt_builder = AnalysisPromptBuilder(include_example=settings.GEMINI_PROMPT_EXAMPLE)
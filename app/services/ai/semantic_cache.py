@@ -0,0 +1,138 @@
+"""
+Near-duplicate cache for Gemini track analyses.
+
+Tracks that share artist, genres, Discogs styles, MusicBrainz tags and era get
+practically the same keywords, even when their titles differ. Each analysis
+input is embedded locally as a hashed TF-IDF vector over those fields (the title
+is deliberately left out). A new input reuses the nearest cached analysis when
+their cosine similarity clears a threshold, so no model call is needed. Only the
+keywords are reused: the cached description is about a different song, so a hit
+comes back with an empty description (the client hides it).
+"""
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import scipy.sparse as sp
+from ...core.config import settings
+from ...core.logging import logger
+
+class SemanticAnalysisCache:
+    """Bounded in-process index of analyses, searched by cosine similarity of hashed features."""
+
+    DIM = 1 << 18 # Hash buckets; large enough that collisions are negligible
+    FIELD_WEIGHTS = {"artist": 1.0, "genre": 1.0, "style": 1.5, "tag": 0.75, "era": 1.0, "vocal": 0.5}
+    MIN_FEATURES = 3 # Inputs with less signal than this are never matched
+
+    def __init__(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # entry key -> (bucket indices, weights, keywords, label), oldest first
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, np.ndarray, List[str], Dict[str, Any]]]" = OrderedDict()
+        self._df = np.zeros(self.DIM, dtype=np.int32) # Number of entries with each bucket
+        self._matrix: Optional[sp.csr_matrix] = None # Rebuilt lazily after changes
+        self._keys: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(value: Any) -> str:
+        return re.sub(r"\s+", " ", str(value)).strip().casefold()
+
+    @classmethod
+    def _bucket(cls, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % cls.DIM
+
+    @classmethod
+    def features(cls, track_metadata: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """Hashed feature buckets and their field weights for an analysis input."""
+        values: List[Tuple[str, Any]] = [("artist", track_metadata.get("artist"))]
+        values += [("genre", g) for g in track_metadata.get("genres") or []]
+        values += [("style", s) for s in track_metadata.get("discogs_styles") or []]
+        values += [("tag", t) for t in track_metadata.get("musicbrainz_tags") or []]
+        year = track_metadata.get("discogs_year")
+        if isinstance(year, int) or (isinstance(year, str) and year.isdigit()):
+            values.append(("era", f"{int(year) // 10 * 10}s"))
+        instrumental = track_metadata.get("instrumental")
+        if instrumental is not None:
+            values.append(("vocal", "instrumental" if instrumental else "vocal"))
+
+        weights: Dict[int, float] = {}
+        for field, value in values:
+            if not isinstance(value, (str, int)) or not cls._normalize(value):
+                continue
+            bucket = cls._bucket(f"{field}:{cls._normalize(value)}")
+            weights[bucket] = max(weights.get(bucket, 0.0), cls.FIELD_WEIGHTS[field])
+        indices = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+        return indices, np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+
+    def _build_matrix(self) -> sp.csr_matrix:
+        if self._matrix is None:
+            self._keys = list(self._entries.keys())
+            entries = list(self._entries.values())
+            indptr = np.cumsum([0] + [len(e[0]) for e in entries])
+            indices = np.concatenate([e[0] for e in entries]) if entries else np.zeros(0, dtype=np.int64)
+            data = np.concatenate([e[1] for e in entries]) if entries else np.zeros(0, dtype=np.float32)
+            self._matrix = sp.csr_matrix((data, indices, indptr), shape=(len(entries), self.DIM))
+        return self._matrix
+
+    def add(self, key: str, track_metadata: Dict[str, Any], analysis: Dict[str, Any]) -> None:
+        """Index an analysis under `key` (re-adding a known key is a no-op)."""
+        if key in self._entries:
+            return
+        indices, weights = self.features(track_metadata)
+        if len(indices) < self.MIN_FEATURES:
+            return
+        if len(self._entries) >= self.max_entries:
+            old_indices = self._entries.popitem(last=False)[1][0]
+            self._df[old_indices] -= 1
+        label = {"title": track_metadata.get("title"), "artist": track_metadata.get("artist")}
+        self._entries[key] = (indices, weights, list(analysis["keywords"]), label)
+        self._df[indices] += 1
+        self._matrix = None
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._df[:] = 0
+        self._matrix = None
+
+    def lookup(self, track_metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Return {"keywords", "description": "", "source": "semantic"} with the keywords of
+        the most similar cached input if it clears the threshold; otherwise None. The
+        track they came from is logged, not returned.
+        """
+        if not self._entries:
+            return None
+        indices, weights = self.features(track_metadata)
+        if len(indices) < self.MIN_FEATURES:
+            return None
+
+        matrix = self._build_matrix()
+        n = matrix.shape[0]
+        # Smoothed IDF over the cached entries, evaluated only on the buckets in play
+        idf_query = np.log((1.0 + n) / (1.0 + self._df[indices])) + 1.0
+        query = weights * idf_query
+        query_norm = np.linalg.norm(query)
+
+        columns = matrix[:, indices] # n x q: weights of the query's buckets in every entry
+        dots = np.asarray(columns @ (query * idf_query)).ravel()
+        # Row norms need the IDF of every bucket a row uses
+        row_idf = np.log((1.0 + n) / (1.0 + self._df[matrix.indices])) + 1.0
+        squared = sp.csr_matrix(((matrix.data * row_idf) ** 2, matrix.indices, matrix.indptr), shape=matrix.shape)
+        row_norms = np.sqrt(np.asarray(squared.sum(axis=1)).ravel())
+        similarities = dots / np.maximum(row_norms * query_norm, 1e-12)
+
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            return None
+        _, _, keywords, label = self._entries[self._keys[best]]
+        logger.info(f"Semantic cache hit for {track_metadata.get('title')}: reusing keywords of {label['title']} by {label['artist']} ({similarity:.3f})")
+        return {"keywords": list(keywords), "description": "", "source": "semantic"}
+
+# Create a global instance
+semantic_analysis_cache = SemanticAnalysisCache(settings.GEMINI_SEMANTIC_THRESHOLD, settings.GEMINI_SEMANTIC_CACHE_SIZE)
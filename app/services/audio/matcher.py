@@ -0,0 +1,277 @@
+"""
+Approximate nearest-neighbour matching over catalog audio features.
+
+An offline job downloads the preview audio of every track in the local Jamendo
+catalog mirror, extracts feature vectors (see extractor.py) and saves them with
+the track metadata to a single .npz file. AudioSimilarityIndex loads that file
+and answers "k most similar tracks" queries with FAISS when it is installed,
+falling back to an equivalent NumPy inverted-file (IVF) index.
+
+Usage:
+    python -m app.services.audio.matcher [--limit N] [--concurrency N]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional, Any, Tuple
+import httpx
+import numpy as np
+from ...core.config import settings
+from ...core.logging import logger
+from ...core.executors import bulkheads
+from ...core.http_transport import http_transport
+from ..metadata.jamendo_catalog import JamendoCatalogStore
+from .extractor import audio_feature_extractor, AudioFeatureExtractor, FEATURE_DIM
+
+try:
+    import faiss
+except ImportError: # Optional; the NumPy IVF index is used instead
+    faiss = None
+
+class NumpyIVFIndex:
+    """
+    Inverted-file index over unit vectors: k-means partitions the vectors and a
+    query only scans the `nprobe` partitions whose centroids are closest to it.
+    """
+
+    def __init__(self, nlist: int, nprobe: int, seed: int = 0, iterations: int = 10):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.iterations = iterations
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.lists: List[np.ndarray] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def build(self, vectors: np.ndarray) -> None:
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist, len(vectors))
+        centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)]
+        for _ in range(self.iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-10)
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        self.centroids = centroids.astype(np.float32)
+        self.lists = [np.flatnonzero(assignment == c) for c in range(nlist)]
+        self.vectors = vectors
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        candidates = np.concatenate([self.lists[c] for c in probes])
+        scores = self.vectors[candidates] @ query
+        top = np.argsort(-scores, kind="stable")[:k]
+        return scores[top], candidates[top]
+
+class AudioSimilarityIndex:
+    """Feature vectors + track metadata for the catalog, searchable by cosine similarity."""
+
+    IVF_MIN_SIZE = 1024 # Below this an exact scan is faster than any partitioning
+    NPROBE = 8
+
+    def __init__(self, index_path: Optional[str] = None, extractor: AudioFeatureExtractor = audio_feature_extractor):
+        self.index_path = index_path or settings.AUDIO_INDEX_PATH or \
+                          os.path.join(settings.CACHE_DIR, "audio_index.npz")
+        self.extractor = extractor
+        self.tracks: List[Dict[str, Any]] = []
+        self._mean = np.zeros(FEATURE_DIM, dtype=np.float32)
+        self._std = np.ones(FEATURE_DIM, dtype=np.float32)
+        self._vectors = np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        self._ann = None
+        self._load_lock = threading.RLock()
+        self.loaded = False
+
+    @property
+    def available(self) -> bool:
+        return os.path.exists(self.index_path)
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        z = (vectors - self._mean) / self._std
+        norms = np.linalg.norm(z, axis=-1, keepdims=True)
+        return (z / np.maximum(norms, 1e-10)).astype(np.float32)
+
+    def _build_ann(self) -> None:
+        n = len(self._vectors)
+        if n < self.IVF_MIN_SIZE:
+            self._ann = None # Exact scan
+        elif faiss is not None:
+            nlist = int(np.sqrt(n))
+            quantizer = faiss.IndexFlatIP(FEATURE_DIM)
+            ann = faiss.IndexIVFFlat(quantizer, FEATURE_DIM, nlist, faiss.METRIC_INNER_PRODUCT)
+            ann.train(self._vectors)
+            ann.add(self._vectors)
+            ann.nprobe = self.NPROBE
+            self._ann = ann
+        else:
+            ann = NumpyIVFIndex(nlist=int(np.sqrt(n)), nprobe=self.NPROBE)
+            ann.build(self._vectors)
+            self._ann = ann
+
+    def build(self, entries: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        """Index (track, features) pairs, where features come from AudioFeatureExtractor.extract."""
+        raw = np.stack([features["vector"] for _, features in entries]).astype(np.float32)
+        self._mean = raw.mean(axis=0)
+        self._std = np.where(raw.std(axis=0) > 1e-6, raw.std(axis=0), 1.0).astype(np.float32)
+        self._vectors = self._normalize(raw)
+        self.tracks = [
+            {**track, "bpm": features["bpm"], "key": features["key"], "energy": features["energy"]}
+            for track, features in entries
+        ]
+        self._build_ann()
+        self.loaded = True
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.index_path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so a running server never sees a partial index
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, vectors=self._vectors, mean=self._mean, std=self._std, tracks=np.array(json.dumps(self.tracks)))
+        os.replace(tmp_path, path)
+
+    def ensure_loaded(self) -> bool:
+        """Load the saved index once, if one has been built (blocking). Returns whether it is usable."""
+        if not self.loaded and self.available:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+        return self.loaded
+
+    def load(self) -> None:
+        """Load the saved index (blocking; call from a thread)."""
+        with self._load_lock:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                self._vectors = data["vectors"]
+                self._mean = data["mean"]
+                self._std = data["std"]
+                self.tracks = json.loads(str(data["tracks"]))
+            self._build_ann()
+            self.loaded = True
+            logger.info(f"Audio similarity index loaded: {len(self.tracks)} tracks ({'faiss' if faiss is not None else 'numpy'} backend)")
+
+    def search(self, vector: np.ndarray, k: int = 10) -> List[Dict[str, Any]]:
+        """Return the k most similar tracks with a 0..1 `similarity_score`."""
+        if not self.tracks:
+            return []
+        query = self._normalize(np.asarray(vector, dtype=np.float32))
+        k = min(k, len(self.tracks))
+        if self._ann is None:
+            scores = self._vectors @ query
+            ids = np.argsort(-scores, kind="stable")[:k]
+            scores = scores[ids]
+        elif faiss is not None and not isinstance(self._ann, NumpyIVFIndex):
+            scores, ids = self._ann.search(query[None, :], k)
+            scores, ids = scores[0], ids[0]
+        else:
+            scores, ids = self._ann.search(query, k)
+
+        results = []
+        for score, i in zip(scores, ids):
+            if i < 0:
+                continue # FAISS pads with -1 when the probed lists hold fewer than k vectors
+            track = dict(self.tracks[i])
+            track["similarity_score"] = round((float(score) + 1) / 2, 4) # Cosine -1..1 -> 0..1
+            results.append(track)
+        return results
+
+    def search_file(self, path: str, k: int = 10) -> Dict[str, Any]:
+        """Extract features from an audio file and find its nearest catalog tracks (blocking)."""
+        features = self.extractor.extract_file(path)
+        return {
+            "features": {"bpm": features["bpm"], "key": features["key"], "energy": features["energy"]},
+            "similar_tracks": self.search(features["vector"], k=k),
+        }
+
+async def _extract_preview(client: httpx.AsyncClient, track: Dict[str, Any], extractor: AudioFeatureExtractor) -> Optional[Dict[str, Any]]:
+    """Download a track's preview and extract its features. Returns None on failure."""
+    suffix = os.path.splitext(httpx.URL(track["audio_url"]).path)[1] or ".mp3"
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp_file:
+        try:
+            async with client.stream("GET", track["audio_url"]) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    tmp_file.write(chunk)
+            tmp_file.flush()
+            return await bulkheads["audio"].run(extractor.extract_file, tmp_file.name)
+        except Exception as e:
+            logger.warning(f"Skipping Jamendo track {track.get('id')}: {e}")
+            return None
+
+async def build_from_catalog(
+    store: JamendoCatalogStore,
+    index: AudioSimilarityIndex,
+    client: Optional[httpx.AsyncClient] = None,
+    concurrency: int = 8,
+    limit: Optional[int] = None
+) -> int:
+    """Extract features for catalog previews, build and save the index. Returns the number of tracks indexed."""
+    owns_client = client is None
+    client = client or http_transport.client(timeout=httpx.Timeout(30.0, connect=5.0), follow_redirects=True)
+    # A fixed pool of workers fed through a bounded queue, so memory stays flat however large the catalog is
+    concurrency = max(1, concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    entries = []
+    processed = 0
+
+    async def produce() -> None:
+        tracks = (track for track, _ in store.iter_tracks() if track.get("audio_url"))
+        for track in itertools.islice(tracks, limit):
+            await queue.put(track)
+        for _ in range(concurrency):
+            await queue.put(None) # One stop marker per worker
+
+    async def work() -> None:
+        nonlocal processed
+        while (track := await queue.get()) is not None:
+            features = await _extract_preview(client, track, index.extractor)
+            if features is not None:
+                entries.append((track, features))
+            processed += 1
+            if processed % 100 == 0:
+                logger.info(f"Audio index build: {processed} previews processed, {len(entries)} indexed")
+
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+    finally:
+        if owns_client:
+            await client.aclose()
+
+    if not entries:
+        logger.warning("Audio index build: no previews could be processed")
+        return 0
+    index.build(entries)
+    index.save()
+    logger.info(f"Audio index build finished: {len(entries)} tracks indexed to {index.index_path}")
+    return len(entries)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the audio similarity index from the local Jamendo catalog.")
+    parser.add_argument("--catalog", default=None, help="Catalog database path (defaults to JAMENDO_CATALOG_PATH)")
+    parser.add_argument("--index", default=None, help="Output index path (defaults to AUDIO_INDEX_PATH)")
+    parser.add_argument("--limit", type=int, default=None, help="Only index the first N catalog tracks")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent preview downloads")
+    args = parser.parse_args(argv)
+
+    asyncio.run(build_from_catalog(
+        JamendoCatalogStore(args.catalog),
+        AudioSimilarityIndex(args.index),
+        concurrency=args.concurrency,
+        limit=args.limit
+    ))
+
+# Create a global instance
+audio_similarity_index = AudioSimilarityIndex()
+
+if __name__ == "__main__":
+    main()
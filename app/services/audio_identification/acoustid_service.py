@@ -5,6 +5,7 @@ import logging
 import os
 import sys
 from typing import Optional, Dict, Any
+from app.core.http_transport import http_transport
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -130,7 +131,7 @@ class AcoustIDClient:
             params["meta"] = '+'.join(metadata) 
             logger.info(f"Including metadata in request: {metadata}")
 
-        async with httpx.AsyncClient() as client:
+        async with http_transport.client() as client:
             try:
                 logger.info(f"Querying AcoustID API for pre-calculated fingerprint...")
                 # Log request details (excluding the full fingerprint for brevity)
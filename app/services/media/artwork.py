@@ -0,0 +1,172 @@
+"""
+Artwork proxy that serves small, cached thumbnails of Discogs and Jamendo images.
+
+Each source image is downloaded once and immediately rendered into every
+thumbnail size. Variants are stored content-addressed (by the SHA-256 of the
+source bytes) in a byte-budgeted LRU disk cache, and the source URL -> digest
+mapping lives in the shared persistent cache, so all workers reuse them.
+"""
+import asyncio
+import hashlib
+import io
+import os
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+import httpx
+from PIL import Image
+from starlette.responses import FileResponse, Response
+from ...core.cache import PersistentTTLCache
+from ...core.config import settings
+from ...core.executors import bulkheads
+from ...core.logging import logger
+from ...core.services import services
+from ...core.http_transport import http_transport
+from ...utils.disk_cache import DiskLRUCache
+
+THUMBNAIL_SIZES = (64, 150, 300)
+DEFAULT_THUMBNAIL_SIZE = 150
+# Hosts (and their subdomains) artwork may be fetched from; the proxy is not an open relay
+ALLOWED_HOSTS = ("discogs.com", "jamendo.com")
+
+class ArtworkRejected(ValueError):
+    """The requested source URL or size is not allowed."""
+
+def artwork_url(image_url: Optional[str], size: int = DEFAULT_THUMBNAIL_SIZE) -> Optional[str]:
+    """
+    Proxy URL of a thumbnail for an upstream image URL (None if there is no image),
+    absolute when PUBLIC_BASE_URL is set.
+    """
+    if not image_url:
+        return None
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{settings.API_V1_PREFIX}/music/artwork?{urlencode({'url': image_url, 'size': size})}"
+
+def _is_allowed(url: str) -> bool:
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    return parts.scheme == "https" and any(host == allowed or host.endswith("." + allowed) for allowed in ALLOWED_HOSTS)
+
+def render_thumbnails(data: bytes) -> Dict[int, bytes]:
+    """Decode an image once and encode a JPEG for every thumbnail size (never upscaling)."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if image.mode not in ("RGB", "L"):
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        variants = {}
+        # Largest first, so each smaller variant is resampled from an already reduced image
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            image = image.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=85, optimize=True, progressive=True)
+            variants[size] = buffer.getvalue()
+        return variants
+
+class ArtworkService:
+    """Fetches artwork once and serves resized variants from disk."""
+
+    MEDIA_TYPE = "image/jpeg"
+    CACHE_CONTROL = "public, max-age=31536000, immutable" # Variants are content-addressed
+    MAX_SOURCE_BYTES = 10 * 1024 * 1024
+    URL_MAP_TTL = 30 * 24 * 60 * 60 # Upstream artwork URLs are effectively immutable
+
+    def __init__(self, cache: Optional[DiskLRUCache] = None, url_map: Optional[PersistentTTLCache] = None):
+        self.cache = cache or DiskLRUCache(
+            settings.ARTWORK_CACHE_DIR or os.path.join(settings.CACHE_DIR, "artwork"),
+            settings.ARTWORK_CACHE_MAX_BYTES
+        )
+        self.url_map = url_map or PersistentTTLCache("artwork_url", ttl=self.URL_MAP_TTL)
+        self.async_client = http_transport.client(
+            headers={"User-Agent": "SoundMatch/1.0 (andy@example.com)"},
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            follow_redirects=False # A redirect could leave the allowlisted hosts
+        )
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _variant_key(digest: str, size: int) -> str:
+        return f"{digest}:{size}"
+
+    async def get_thumbnail(self, url: str, size: int) -> Optional[Tuple[str, str]]:
+        """
+        Return (path, etag) of the thumbnail of `url` at `size`, fetching and rendering
+        the source on first use. Returns None if the source cannot be fetched or decoded.
+        Raises ArtworkRejected for hosts outside the allowlist or unsupported sizes.
+        """
+        if size not in THUMBNAIL_SIZES:
+            raise ArtworkRejected(f"size must be one of {', '.join(map(str, THUMBNAIL_SIZES))}")
+        if not _is_allowed(url):
+            raise ArtworkRejected("Artwork host is not allowed")
+
+        digest = await self.url_map.get_async(url)
+        if digest:
+            path = self.cache.get(self._variant_key(digest, size))
+            if path:
+                return path, f'"{digest[:32]}-{size}"'
+
+        # Share one download + render between concurrent requests for the same image
+        task = self._in_flight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_render(url))
+            self._in_flight[url] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(url, None))
+        digest = await asyncio.shield(task)
+        if not digest:
+            return None
+        path = self.cache.get(self._variant_key(digest, size))
+        return (path, f'"{digest[:32]}-{size}"') if path else None
+
+    async def response_for(self, url: str, size: int, request_headers: Mapping[str, str]) -> Optional[Response]:
+        """Build the thumbnail response (304 on a matching ETag), or None if the source is unavailable."""
+        thumbnail = await self.get_thumbnail(url, size)
+        if thumbnail is None:
+            return None
+        path, etag = thumbnail
+        headers = {"Cache-Control": self.CACHE_CONTROL, "ETag": etag}
+        if request_headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type=self.MEDIA_TYPE, headers=headers)
+
+    async def _download(self, url: str) -> Optional[bytes]:
+        """The source image, or None once it turns out larger than MAX_SOURCE_BYTES (the rest is never read)."""
+        async with self.async_client.stream("GET", url) as response:
+            response.raise_for_status()
+            declared = response.headers.get("content-length", "")
+            if declared.isdigit() and int(declared) > self.MAX_SOURCE_BYTES:
+                logger.warning(f"Artwork at {url} is too large ({declared} bytes)")
+                return None
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > self.MAX_SOURCE_BYTES:
+                    logger.warning(f"Artwork at {url} is larger than {self.MAX_SOURCE_BYTES} bytes")
+                    return None
+        return bytes(data)
+
+    async def _fetch_and_render(self, url: str) -> Optional[str]:
+        try:
+            data = await self._download(url)
+            if data is None:
+                return None
+            digest = hashlib.sha256(data).hexdigest()
+            if not all(self.cache.get(self._variant_key(digest, size)) for size in THUMBNAIL_SIZES):
+                variants = await bulkheads["images"].run(render_thumbnails, data)
+                for size, variant in variants.items():
+                    self.cache.put(self._variant_key(digest, size), variant)
+                logger.info(f"Rendered artwork thumbnails for {url} ({len(data)} bytes -> {[len(v) for v in variants.values()]})")
+            await self.url_map.set_async(url, digest)
+            return digest
+        except httpx.HTTPError as e:
+            logger.error(f"Fetching artwork {url} failed: {e}")
+        except (OSError, Image.DecompressionBombError) as e: # PIL raises OSError subclasses for bad images
+            logger.error(f"Artwork {url} could not be decoded: {e}")
+        return None
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.async_client.aclose()
+
+# Create a global instance
+artwork_service = services.register("artwork", ArtworkService)
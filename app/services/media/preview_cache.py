@@ -0,0 +1,198 @@
+"""
+Caching proxy for Jamendo preview audio.
+
+Previews are served from a byte-budgeted LRU disk cache. On the first play of a
+track a single background download fills the cache while the requesting client
+(and any concurrent ones) stream from the partially written file, so playback
+starts as soon as the first bytes arrive instead of after the whole download.
+File reads and writes run on the storage bulkhead, off the event loop.
+"""
+import asyncio
+import contextlib
+import os
+from typing import BinaryIO, Dict, Optional, AsyncIterator, Mapping, Tuple
+import httpx
+from starlette.responses import Response, StreamingResponse
+from ...core.config import settings
+from ...core.exceptions import BulkheadFullError
+from ...core.executors import bulkheads
+from ...core.logging import logger
+from ...core.services import services
+from ...core.http_transport import http_transport
+from ...utils.disk_cache import DiskLRUCache
+from ...utils.http_range import CHUNK_SIZE, RangeFileResponse, RangeNotSatisfiable, parse_range, range_headers
+
+def preview_url(track_id: str) -> str:
+    """URL clients play a Jamendo preview from: this API's caching proxy, absolute when PUBLIC_BASE_URL is set."""
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{settings.API_V1_PREFIX}/music/preview/{track_id}"
+
+class PreviewIncomplete(Exception):
+    """The upstream download failed after the response to a client had started."""
+
+def _append(f: BinaryIO, chunk: bytes) -> None:
+    f.write(chunk)
+    f.flush() # Readers of the partial file see it right away
+
+class PreviewFill:
+    """Progress of one in-flight preview download into the cache."""
+
+    def __init__(self, path: str, final_path: str):
+        self.path = path
+        self.final_path = final_path # Where the file lives once the download is committed
+        self.total: Optional[int] = None # From Content-Length, when Jamendo sends it
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.task: Optional[asyncio.Task] = None # The download; held here so it cannot be garbage collected mid-flight
+        self.headers_ready = asyncio.Event()
+        self._progress = asyncio.Condition()
+
+    async def advance(self, written: int) -> None:
+        async with self._progress:
+            self.written = written
+            self._progress.notify_all()
+
+    async def finish(self, failed: bool = False) -> None:
+        async with self._progress:
+            self.done = True
+            self.failed = failed
+            self.headers_ready.set()
+            self._progress.notify_all()
+
+    async def wait_for(self, offset: int) -> None:
+        """Wait until the byte at `offset` has been written or the download has ended."""
+        async with self._progress:
+            await self._progress.wait_for(lambda: self.written > offset or self.done)
+
+    async def read(self, start: int, end: Optional[int]) -> AsyncIterator[bytes]:
+        """
+        Stream bytes start..end (inclusive; None = to the end) as they are downloaded.
+        Raises PreviewIncomplete if the download fails first: the status and
+        Content-Length have already been sent, so the connection has to be aborted
+        rather than the body silently cut short.
+        """
+        storage = bulkheads["storage"]
+        try:
+            f = await storage.run(open, self.path, "rb")
+        except FileNotFoundError:
+            if not self.done or self.failed:
+                raise PreviewIncomplete(f"Preview download ended before byte {start}")
+            f = await storage.run(open, self.final_path, "rb") # Committed before this reader started
+        with f:
+            position = start
+            while end is None or position <= end:
+                await self.wait_for(position)
+                available = self.written - position
+                if available <= 0:
+                    if self.failed:
+                        raise PreviewIncomplete(f"Preview download failed at byte {self.written}")
+                    return # Download complete
+                length = available if end is None else min(available, end - position + 1)
+                chunk = await storage.run(os.pread, f.fileno(), min(length, CHUNK_SIZE), position)
+                if not chunk:
+                    return
+                position += len(chunk)
+                yield chunk
+
+class JamendoPreviewCache:
+    """Serves Jamendo previews through a disk cache, downloading each at most once."""
+
+    PREVIEW_URL = "https://prod-1.storage.jamendo.com/"
+    MEDIA_TYPE = "audio/mpeg"
+    CACHE_CONTROL = "public, max-age=86400" # Previews for a track id never change
+
+    def __init__(self, cache: Optional[DiskLRUCache] = None):
+        self.cache = cache or DiskLRUCache(
+            settings.PREVIEW_CACHE_DIR or os.path.join(settings.CACHE_DIR, "previews"),
+            settings.PREVIEW_CACHE_MAX_BYTES
+        )
+        self.async_client = http_transport.client(
+            headers={"Accept-Encoding": "identity"}, # Byte offsets must match the stored file
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            follow_redirects=True
+        )
+        self._fills: Dict[str, PreviewFill] = {}
+
+    @staticmethod
+    def _key(track_id: str) -> str:
+        return f"jamendo-preview:{track_id}"
+
+    def source_url(self, track_id: str) -> str:
+        return f"{self.PREVIEW_URL}?trackid={track_id}&format=mp32"
+
+    async def open(self, track_id: str) -> Tuple[Optional[str], Optional[PreviewFill]]:
+        """
+        Return (path, None) for a fully cached preview, or (None, fill) for one being
+        downloaded; the fill's headers_ready event is set once its size is known.
+        """
+        key = self._key(track_id)
+        path = await bulkheads["storage"].run(self.cache.get, key)
+        if path:
+            return path, None
+        fill = self._fills.get(key)
+        if fill is None:
+            fill = PreviewFill(self.cache.partial_path(key), self.cache.path_for(key))
+            self._fills[key] = fill
+            fill.task = asyncio.ensure_future(self._download(track_id, fill))
+        await fill.headers_ready.wait()
+        if fill.failed and fill.written == 0:
+            return None, None
+        return None, fill
+
+    async def response_for(self, track_id: str, request_headers: Mapping[str, str]) -> Optional[Response]:
+        """Build the (possibly partial) response for a preview, or None if it cannot be fetched."""
+        path, fill = await self.open(track_id)
+        headers = {"Cache-Control": self.CACHE_CONTROL}
+        if path:
+            return RangeFileResponse(path, request_headers, media_type=self.MEDIA_TYPE, headers=headers)
+        if fill is None:
+            return None
+
+        try:
+            byte_range = parse_range(request_headers.get("range"), fill.total)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{fill.total}"})
+        if fill.total is not None:
+            headers["Accept-Ranges"] = "bytes"
+        if byte_range is None or byte_range[1] is None:
+            # Whole body (also for open ranges while the size is still unknown)
+            if fill.total is not None:
+                headers["Content-Length"] = str(fill.total)
+            return StreamingResponse(fill.read(0, None), media_type=self.MEDIA_TYPE, headers=headers)
+        start, end = byte_range
+        headers.update(range_headers(start, end, fill.total))
+        return StreamingResponse(fill.read(start, end), status_code=206, media_type=self.MEDIA_TYPE, headers=headers)
+
+    async def _download(self, track_id: str, fill: PreviewFill) -> None:
+        key = self._key(track_id)
+        storage = bulkheads["storage"]
+        failed = True
+        try:
+            with await storage.run(open, fill.path, "wb") as f:
+                async with self.async_client.stream("GET", self.source_url(track_id)) as response:
+                    response.raise_for_status()
+                    if response.headers.get("content-length", "").isdigit():
+                        fill.total = int(response.headers["content-length"])
+                    fill.headers_ready.set()
+                    written = 0
+                    async for chunk in response.aiter_raw(CHUNK_SIZE):
+                        await storage.run(_append, f, chunk)
+                        written += len(chunk)
+                        await fill.advance(written)
+            await storage.run(self.cache.commit, key, fill.path)
+            failed = False
+            logger.info(f"Cached Jamendo preview {track_id} ({fill.written} bytes)")
+        except Exception as e:
+            logger.error(f"Downloading Jamendo preview {track_id} failed: {e}")
+            with contextlib.suppress(BulkheadFullError): # Otherwise left to the cache's stale .part cleanup
+                await storage.run(self.cache.discard_partial, fill.path)
+        finally:
+            self._fills.pop(key, None)
+            await fill.finish(failed=failed)
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.async_client.aclose()
+
+# Create a global instance
+jamendo_preview_cache = services.register("previews", JamendoPreviewCache)
@@ -0,0 +1,252 @@
+"""
+Offline index built from the monthly Discogs data dumps (https://data.discogs.com/).
+
+The importer streams the masters/releases XML dumps (optionally gzipped) with
+bounded memory and writes a compact SQLite table keyed by normalized
+artist + title, holding only what SoundMatch uses from Discogs: styles, year,
+genres and an image URL. DiscogsService consults it before calling the API.
+
+Usage:
+    python -m app.services.metadata.discogs_dump discogs_masters.xml.gz discogs_releases.xml.gz
+"""
+import argparse
+import gzip
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import xml.etree.ElementTree as ET
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+from ...core.config import settings
+from ...core.logging import logger
+from ..media.artwork import artwork_url
+
+# Lower priority wins: master titles beat release titles, which beat track titles
+PRIORITY_MASTER = 0
+PRIORITY_RELEASE = 1
+PRIORITY_TRACK = 2
+
+_ARTIST_NUMBERING = re.compile(r"\s*\(\d+\)$")   # Discogs disambiguation, e.g. "Nirvana (2)"
+_BRACKETED = re.compile(r"\s*[\(\[][^\)\]]*[\)\]]")  # "(Remastered 2011)", "[Live]"
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+# Letters that NFKD does not decompose into an ASCII base character
+_TRANSLITERATE = str.maketrans({"ð": "d", "đ": "d", "þ": "th", "ø": "o", "æ": "ae", "œ": "oe", "ß": "ss", "ł": "l", "ı": "i"})
+_ARTIST_SEPARATORS = re.compile(r"\s+(?:feat\.?|ft\.?|featuring|&|and|x|vs\.?)\s+|\s*,\s*|\s*/\s*", re.IGNORECASE)
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.casefold().translate(_TRANSLITERATE).replace("&", " and ")
+    return " ".join(_NON_ALNUM.sub(" ", text).split())
+
+def normalize_artist(artist: str) -> str:
+    artist = _ARTIST_NUMBERING.sub("", artist or "")
+    folded = _fold(artist)
+    if folded.startswith("the "):
+        folded = folded[4:]
+    return folded
+
+def normalize_title(title: str) -> str:
+    return _fold(_BRACKETED.sub("", title or "")) or _fold(title or "")
+
+def make_key(artist: str, title: str) -> str:
+    return f"{normalize_artist(artist)}\t{normalize_title(title)}"
+
+class DiscogsDumpIndex:
+    """Read/write access to the local Discogs dump index."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.DISCOGS_DUMP_INDEX_PATH or \
+                       os.path.join(settings.CACHE_DIR, "discogs_index.sqlite3")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock() # lookup() runs on worker threads sharing one connection
+
+    @property
+    def available(self) -> bool:
+        return os.path.exists(self.db_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS discogs_index (
+                    key TEXT PRIMARY KEY,
+                    discogs_id INTEGER NOT NULL,
+                    priority INTEGER NOT NULL,
+                    year INTEGER,
+                    styles TEXT,
+                    genres TEXT,
+                    image_url TEXT
+                ) WITHOUT ROWID
+                """
+            )
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def lookup(self, artist: str, title: str) -> Optional[Dict[str, Any]]:
+        """Return release data shaped like DiscogsService.get_release_data, or None on a miss (blocking)."""
+        if not self.available:
+            return None
+
+        candidate_artists = [artist]
+        # "A feat. B" / "A & B" are usually indexed under the first credited artist
+        first_artist = _ARTIST_SEPARATORS.split(artist or "", maxsplit=1)[0]
+        if first_artist and first_artist != artist:
+            candidate_artists.append(first_artist)
+
+        try:
+            with self._lock:
+                conn = self._connect()
+                for candidate in candidate_artists:
+                    row = conn.execute(
+                        "SELECT discogs_id, year, styles, genres, image_url FROM discogs_index WHERE key = ?",
+                        (make_key(candidate, title),)
+                    ).fetchone()
+                    if row:
+                        return self._row_to_data(row)
+        except sqlite3.Error as e:
+            logger.error(f"Discogs dump index lookup failed: {e}")
+        return None
+
+    @staticmethod
+    def _row_to_data(row: Tuple) -> Dict[str, Any]:
+        discogs_id, year, styles, genres, image_url = row
+        discogs_data: Dict[str, Any] = {"discogs_id": discogs_id}
+        if styles:
+            discogs_data["styles"] = styles.split("|")
+        if year:
+            discogs_data["year"] = year
+        if genres:
+            discogs_data["genres"] = genres.split("|")
+        if image_url:
+            discogs_data["image_url"] = image_url
+            discogs_data["thumbnail_url"] = artwork_url(image_url) # Same shape as DiscogsService API results
+        return discogs_data
+
+    def write_entries(self, entries: List[Tuple]) -> None:
+        """Upsert (key, discogs_id, priority, year, styles, genres, image_url) rows, keeping the best priority."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO discogs_index (key, discogs_id, priority, year, styles, genres, image_url)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    discogs_id = excluded.discogs_id,
+                    priority = excluded.priority,
+                    year = excluded.year,
+                    styles = excluded.styles,
+                    genres = excluded.genres,
+                    image_url = excluded.image_url
+                WHERE excluded.priority < discogs_index.priority
+                """,
+                entries
+            )
+
+def _open_dump(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+def _texts(elem: ET.Element, path: str) -> List[str]:
+    return [e.text.strip() for e in elem.findall(path) if e.text and e.text.strip()]
+
+def _parse_year(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    match = re.match(r"\d{4}", value.strip())
+    year = int(match.group(0)) if match else 0
+    return year or None
+
+def _primary_image(elem: ET.Element) -> Optional[str]:
+    images = elem.findall("images/image")
+    primary = [img for img in images if img.get("type") == "primary"] or images
+    for img in primary:
+        if img.get("uri"):
+            return img.get("uri")
+    return None
+
+def _entries_for(elem: ET.Element, include_tracks: bool) -> Iterator[Tuple]:
+    """Yield index rows for one <master> or <release> element."""
+    artists = _texts(elem, "artists/artist/name")
+    title = (elem.findtext("title") or "").strip()
+    if not artists or not title:
+        return
+
+    styles = "|".join(_texts(elem, "styles/style")) or None
+    genres = "|".join(_texts(elem, "genres/genre")) or None
+    image_url = _primary_image(elem)
+
+    if elem.tag == "master":
+        discogs_id = int(elem.get("id"))
+        year = _parse_year(elem.findtext("year"))
+        yield (make_key(artists[0], title), discogs_id, PRIORITY_MASTER, year, styles, genres, image_url)
+        return
+
+    # Releases: only index the main release of a master (or standalone releases)
+    master = elem.find("master_id")
+    if master is not None and master.get("is_main_release") != "true":
+        return
+    discogs_id = int(master.text) if master is not None and master.text else int(elem.get("id"))
+    year = _parse_year(elem.findtext("released"))
+    yield (make_key(artists[0], title), discogs_id, PRIORITY_RELEASE, year, styles, genres, image_url)
+
+    if include_tracks:
+        for track_title in _texts(elem, "tracklist/track/title"):
+            yield (make_key(artists[0], track_title), discogs_id, PRIORITY_TRACK, year, styles, genres, image_url)
+
+def import_dump(dump_path: str, index: DiscogsDumpIndex, include_tracks: bool = True, batch_size: int = 10000) -> int:
+    """
+    Stream a Discogs masters or releases dump into the index.
+
+    Elements are cleared as soon as they are processed, so memory stays bounded
+    regardless of dump size. Returns the number of index rows written.
+    """
+    written = 0
+    batch: List[Tuple] = []
+    with _open_dump(dump_path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag not in ("master", "release"):
+                continue
+            batch.extend(_entries_for(elem, include_tracks))
+            # Drop the processed element (and its already-parsed siblings) from the tree
+            root.clear()
+            if len(batch) >= batch_size:
+                index.write_entries(batch)
+                written += len(batch)
+                batch = []
+                logger.info(f"Discogs dump import: {written} rows written from {dump_path}")
+    if batch:
+        index.write_entries(batch)
+        written += len(batch)
+    logger.info(f"Discogs dump import finished: {written} rows written from {dump_path}")
+    return written
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the local Discogs index from XML data dumps.")
+    parser.add_argument("dumps", nargs="+", help="Paths to discogs_*_masters.xml(.gz) / discogs_*_releases.xml(.gz)")
+    parser.add_argument("--index", default=None, help="Index database path (defaults to DISCOGS_DUMP_INDEX_PATH)")
+    parser.add_argument("--skip-tracks", action="store_true", help="Do not index individual track titles from releases")
+    args = parser.parse_args(argv)
+
+    index = DiscogsDumpIndex(args.index)
+    try:
+        for dump_path in args.dumps:
+            import_dump(dump_path, index, include_tracks=not args.skip_tracks)
+    finally:
+        index.close()
+
+# Create a global instance
+discogs_dump_index = DiscogsDumpIndex()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import sqlite3
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+from ...core.config import settings
+from ...core.executors import bulkheads
+from ...core.logging import logger
+
+class DiscogsRateLimiter:
+    """
+    Adaptive rate limiter for the Discogs API.
+
+    Discogs reports the quota of its moving one-minute window in the
+    X-Discogs-Ratelimit / -Used / -Remaining response headers. The last observed
+    values are kept in a small SQLite database so that every worker process shares
+    one view of the budget. Requests go out immediately while quota is plentiful,
+    are spaced out progressively once the remaining budget drops below a low-water
+    mark, and a 429 blocks all workers until its Retry-After has elapsed.
+    """
+
+    WINDOW_SECONDS = 60.0      # Discogs uses a moving one-minute window
+    DEFAULT_LIMIT = 60         # Authenticated requests per window
+    LOW_WATER_FRACTION = 0.25  # Start backing off below 25% remaining quota
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.DISCOGS_RATELIMIT_DB or \
+                       os.path.join(settings.CACHE_DIR, "discogs_ratelimit.sqlite3")
+        try:
+            self._init_db()
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Failed to initialize Discogs rate limiter state at {self.db_path}: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+
+    def _init_db(self) -> None:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS discogs_ratelimit (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    ratelimit INTEGER NOT NULL,
+                    remaining INTEGER NOT NULL,
+                    observed_at REAL NOT NULL,
+                    next_request_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO discogs_ratelimit VALUES (1, ?, ?, 0, 0, 0)",
+                (self.DEFAULT_LIMIT, self.DEFAULT_LIMIT)
+            )
+        finally:
+            conn.close()
+
+    def _spacing(self, limit: int, remaining: int) -> float:
+        """Delay to keep between requests for the given remaining quota."""
+        low_water = max(1, int(limit * self.LOW_WATER_FRACTION))
+        if remaining > low_water:
+            return 0.0
+        # Ramp linearly from no delay at the low-water mark up to twice the
+        # sustainable rate (one request per WINDOW/limit seconds) at zero.
+        fraction = (low_water - max(remaining, 0)) / low_water
+        return 2.0 * (self.WINDOW_SECONDS / max(limit, 1)) * fraction
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Reserve a request slot and return how many seconds the caller must wait
+        before sending it. The reservation decrements the shared remaining quota
+        optimistically so concurrent workers see it before the response arrives.
+        If the wait would exceed `max_wait`, nothing is reserved and None is returned.
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                limit, remaining, observed_at, next_request_at, blocked_until = conn.execute(
+                    "SELECT ratelimit, remaining, observed_at, next_request_at, blocked_until "
+                    "FROM discogs_ratelimit WHERE id = 1"
+                ).fetchone()
+
+                if now - observed_at >= self.WINDOW_SECONDS:
+                    # Nothing observed for a full window: the quota has replenished
+                    remaining = limit
+                    observed_at = now
+
+                start_at = max(now, next_request_at, blocked_until)
+                if max_wait is not None and start_at - now > max_wait:
+                    conn.execute("ROLLBACK") # Leave the slot to a caller that can wait
+                    logger.debug(f"Discogs rate limiter wait of {start_at - now:.2f}s exceeds {max_wait:.2f}s")
+                    return None
+                spacing = self._spacing(limit, remaining)
+                conn.execute(
+                    "UPDATE discogs_ratelimit SET remaining = ?, observed_at = ?, next_request_at = ? WHERE id = 1",
+                    (remaining - 1, observed_at, start_at + spacing)
+                )
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Discogs rate limiter state unavailable, not delaying request: {e}")
+            return 0.0
+
+        delay = start_at - now
+        if delay > 0:
+            logger.debug(f"Discogs rate limiter delaying request by {delay:.2f}s (remaining quota: {remaining})")
+        return delay
+
+    async def acquire_async(self, max_wait: Optional[float] = None) -> bool:
+        """
+        Wait (without blocking the event loop) until a request may be sent. Returns
+        False, without waiting or using quota, if that would take longer than `max_wait`.
+        """
+        # reserve() may wait up to 10s on another worker's SQLite lock, so it runs off the loop
+        delay = await bulkheads["storage"].run(self.reserve, max_wait)
+        if delay is None:
+            return False
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def record_response(self, headers: Mapping[str, str], status_code: int) -> None:
+        """Update the shared quota from a Discogs response's headers."""
+        now = time.time()
+        limit_header = headers.get("X-Discogs-Ratelimit")
+        used_header = headers.get("X-Discogs-Ratelimit-Used")
+        remaining_header = headers.get("X-Discogs-Ratelimit-Remaining")
+
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                limit, remaining, blocked_until = conn.execute(
+                    "SELECT ratelimit, remaining, blocked_until FROM discogs_ratelimit WHERE id = 1"
+                ).fetchone()
+                observed = False
+
+                try:
+                    if limit_header is not None:
+                        limit = int(limit_header)
+                    if remaining_header is not None:
+                        remaining = int(remaining_header)
+                        observed = True
+                    elif used_header is not None:
+                        remaining = limit - int(used_header)
+                        observed = True
+                except ValueError:
+                    logger.warning(f"Ignoring malformed Discogs rate limit headers: {limit_header}/{used_header}/{remaining_header}")
+
+                if status_code == 429:
+                    retry_after = self._parse_retry_after(headers.get("Retry-After"))
+                    if retry_after is None:
+                        retry_after = self.WINDOW_SECONDS / max(limit, 1)
+                    blocked_until = max(blocked_until, now + retry_after)
+                    remaining = 0
+                    observed = True
+                    logger.warning(f"Discogs rate limit hit, pausing Discogs requests for {retry_after:.1f}s")
+
+                if observed:
+                    conn.execute(
+                        "UPDATE discogs_ratelimit SET ratelimit = ?, remaining = ?, observed_at = ?, blocked_until = ? WHERE id = 1",
+                        (limit, remaining, now, blocked_until)
+                    )
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to record Discogs rate limit state: {e}")
+
+    async def record_response_async(self, headers: Mapping[str, str], status_code: int) -> None:
+        """record_response() off the event loop."""
+        await bulkheads["storage"].run(self.record_response, headers, status_code)
+
+# Create a global instance
+discogs_rate_limiter = DiscogsRateLimiter()
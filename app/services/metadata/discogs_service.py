@@ -1,135 +1,189 @@
-import discogs_client
-from typing import Dict, Any, Optional, List
+import httpx
+from cachetools import TTLCache
+from typing import Dict, Any, Optional, List, Tuple
 from ...core.config import settings
 from ...core.logging import logger
+from ...core.services import services
+from ...core.http_transport import http_transport
+from ...core.executors import bulkheads
 from ...core.exceptions import MetadataAPIError
+from .discogs_ratelimit import discogs_rate_limiter, DiscogsRateLimiter
+from .discogs_dump import discogs_dump_index, DiscogsDumpIndex
+from ..media.artwork import artwork_url
 import asyncio
-import time
-import requests # Add requests import
 
 class DiscogsService:
-    """Client for interacting with the Discogs API."""
-    
-    USER_AGENT = "SoundMatch/1.0 (andy@example.com)" 
-
-    def __init__(self):
-        self.client = None
-        token = settings.DISCOGS_PERSONAL_ACCESS_TOKEN
-        
-        if token:
-            try:
-                self.client = discogs_client.Client(
-                    self.USER_AGENT,
-                    user_token=token
-                )
-                logger.info("Discogs client initialized successfully using Personal Access Token.")
-            except Exception as e:
-                logger.error(f"Failed to initialize Discogs client using token: {e}", exc_info=True)
+    """Async client for the Discogs API (search + master/release lookups)."""
+
+    BASE_URL = "https://api.discogs.com"
+    USER_AGENT = "SoundMatch/1.0 (andy@example.com)"
+    REQUEST_TIMEOUT = 10.0
+    MAX_ATTEMPTS = 2 # Retry once after a 429, once Retry-After has elapsed
+    RELEASE_CACHE_SIZE = 2048
+    RELEASE_CACHE_TTL = 24 * 60 * 60 # Styles/genres/year rarely change
+
+    def __init__(self, limiter: DiscogsRateLimiter = discogs_rate_limiter, dump_index: DiscogsDumpIndex = discogs_dump_index):
+        self.token = settings.DISCOGS_PERSONAL_ACCESS_TOKEN
+        self.limiter = limiter
+        self.dump_index = dump_index
+        self.max_wait = settings.DISCOGS_MAX_WAIT
+        self.async_client: Optional[httpx.AsyncClient] = None
+        # Release/master details keyed by (resource type, Discogs ID); many tracks
+        # resolve to the same master, so this saves most detail fetches.
+        self._release_cache: TTLCache = TTLCache(maxsize=self.RELEASE_CACHE_SIZE, ttl=self.RELEASE_CACHE_TTL)
+
+        if self.token:
+            self.async_client = http_transport.client(
+                base_url=self.BASE_URL,
+                headers={
+                    "User-Agent": self.USER_AGENT,
+                    "Authorization": f"Discogs token={self.token}",
+                },
+                timeout=self.REQUEST_TIMEOUT
+            )
+            logger.info("Discogs client initialized successfully using Personal Access Token.")
         else:
             logger.warning("Discogs Personal Access Token not found in settings. Discogs service will be disabled.")
 
-    async def _search_release_async(self, query: str, search_type: str = 'master', limit: int = 1):
-        """Internal async wrapper for discogs_client search."""
-        if not self.client:
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        GET a Discogs resource through the shared rate limiter. Returns None on 404,
+        or when the limiter would hold the request longer than max_wait.
+        """
+        for attempt in range(self.MAX_ATTEMPTS):
+            if not await self.limiter.acquire_async(self.max_wait):
+                logger.warning(f"Skipping Discogs request for {path}: rate limited for longer than {self.max_wait:.1f}s")
+                return None
+            response = await self.async_client.get(path, params=params)
+            await self.limiter.record_response_async(response.headers, response.status_code)
+            if response.status_code != 429:
+                break
+            logger.warning(f"Discogs returned 429 for {path} (attempt {attempt + 1}/{self.MAX_ATTEMPTS})")
+
+        if response.status_code == 404:
             return None
+        response.raise_for_status()
+        return response.json()
+
+    async def _search_release_async(self, query: str, search_type: str = 'master', limit: int = 1) -> List[Dict[str, Any]]:
+        """Search Discogs and return the raw result items (empty on failure)."""
+        if not self.async_client:
+            return []
         try:
-            # Use to_thread as discogs_client is synchronous
-            # Add a small delay to respect rate limits (Discogs is strict)
-            await asyncio.sleep(1.0) # 1 second delay before each search
-            
             logger.debug(f"Searching Discogs ({search_type}): {query}")
-            results = await asyncio.to_thread(
-                self.client.search,
-                query,
-                type=search_type,
-                limit=limit
-            )
-            return results
-        except discogs_client.exceptions.HTTPError as e:
-            # Handle specific Discogs errors (like 404 Not Found, 429 Rate Limit)
-            if e.status_code == 404:
-                 logger.warning(f"Discogs search returned 404 (Not Found) for query: {query}")
-            elif e.status_code == 429:
-                 logger.error(f"Discogs rate limit hit! Status: {e.status_code}")
-                 # Consider implementing backoff or circuit breaker here
+            data = await self._get("/database/search", params={"q": query, "type": search_type, "per_page": limit})
+            return (data or {}).get("results", [])[:limit]
+        except httpx.HTTPStatusError as e:
+            # Handle specific Discogs errors (like 429 Rate Limit after retrying)
+            if e.response.status_code == 429:
+                 logger.error(f"Discogs rate limit hit! Status: {e.response.status_code}")
             else:
-                 logger.error(f"Discogs API HTTP error: {e.status_code} - {e}")
-            return None
+                 logger.error(f"Discogs API HTTP error: {e.response.status_code} - {e}")
+            return []
+        except httpx.RequestError as e:
+            logger.error(f"Discogs API request failed: {e}")
+            return []
         except Exception as e:
             logger.error(f"Unexpected error during Discogs search: {e}", exc_info=True)
-            return None
+            return []
+
+    async def _get_release_details(self, resource_type: str, resource_id: int) -> Optional[Dict[str, Any]]:
+        """Fetch a master or release document, served from the cache when possible."""
+        cache_key: Tuple[str, int] = (resource_type, resource_id)
+        if cache_key in self._release_cache:
+            logger.debug(f"Discogs {resource_type} {resource_id} served from cache")
+            return self._release_cache[cache_key]
+
+        path = f"/masters/{resource_id}" if resource_type == "master" else f"/releases/{resource_id}"
+        logger.debug(f"Fetching Discogs {resource_type} ID: {resource_id}")
+        details = await self._get(path)
+        if details is not None:
+            self._release_cache[cache_key] = details
+        return details
 
     async def get_release_data(self, artist: str, title: str) -> Optional[Dict[str, Any]]:
         """Search Discogs for a master release and return styles and year."""
-        if not self.client:
+        # The offline dump index answers most lookups without touching the API
+        indexed_data = None
+        if self.dump_index.available:
+            indexed_data = await bulkheads["storage"].run(self.dump_index.lookup, artist=artist, title=title)
+        if indexed_data:
+            logger.info(f"Discogs data for '{title}' by '{artist}' found in local dump index: {indexed_data}")
+            return indexed_data
+
+        if not self.async_client:
              logger.warning("Discogs client not initialized, skipping search.")
              return None
 
         logger.info(f"Searching Discogs for release data: '{title}' by '{artist}'")
         search_query = f"{artist} {title}"
-        
-        # Prioritize searching for 'master' releases (Using discogs-client)
-        results = await self._search_release_async(search_query, search_type='master', limit=1)
-        
-        # Fallback to general release search if no master found
-        if not results:
-             logger.info("No 'master' release found on Discogs, trying general 'release' search...")
-             results = await self._search_release_async(search_query, search_type='release', limit=1)
-
-        if not results or len(results) == 0:
+
+        # Search 'master' and general 'release' concurrently; masters still take priority
+        master_results, release_results = await asyncio.gather(
+            self._search_release_async(search_query, search_type='master', limit=1),
+            self._search_release_async(search_query, search_type='release', limit=1)
+        )
+
+        if master_results:
+            best_match = master_results[0]
+        elif release_results:
+            logger.info("No 'master' release found on Discogs, using general 'release' search result.")
+            best_match = release_results[0]
+        else:
             logger.warning(f"Discogs found no releases for query: {search_query}")
             return None
 
-        best_match = results[0] 
-        
-        try: 
-            release_to_fetch = getattr(best_match, 'main_release', best_match)
-            if release_to_fetch:
-                logger.debug(f"Refreshing Discogs release ID: {release_to_fetch.id}")
-                await asyncio.to_thread(release_to_fetch.refresh)
-                await asyncio.sleep(0.5) 
-            else:
-                 logger.warning("Could not determine release object to refresh.")
-                 return None 
-        
-            discogs_data = {"discogs_id": best_match.id}
-        
-            styles = getattr(release_to_fetch, 'styles', [])
+        discogs_id = best_match.get("id")
+        try:
+            release_to_fetch = await self._get_release_details(best_match.get("type", "release"), discogs_id)
+            if not release_to_fetch:
+                 logger.warning(f"Could not fetch Discogs {best_match.get('type')} ID {discogs_id}.")
+                 return None
+
+            discogs_data = {"discogs_id": discogs_id}
+
+            styles = release_to_fetch.get('styles', [])
             if styles:
                 discogs_data["styles"] = styles
                 logger.info(f"Extracted Discogs styles: {styles}")
-        
-            year = getattr(release_to_fetch, 'year', None)
-            if year and year > 0: 
+
+            year = release_to_fetch.get('year')
+            if year and year > 0:
                 discogs_data["year"] = year
                 logger.info(f"Extracted Discogs year: {year}")
-                
+
             # Get primary genre(s)
-            genres = getattr(release_to_fetch, 'genres', [])
+            genres = release_to_fetch.get('genres', [])
             if genres:
-                 discogs_data["genres"] = genres 
-                 
+                 discogs_data["genres"] = genres
+
             # Get primary image URL
-            images = getattr(release_to_fetch, 'images', [])
+            images = release_to_fetch.get('images', [])
             if images and isinstance(images, list) and len(images) > 0:
                 primary_image = images[0]
                 if isinstance(primary_image, dict) and primary_image.get('uri'):
                      discogs_data["image_url"] = primary_image['uri']
+                     discogs_data["thumbnail_url"] = artwork_url(primary_image['uri'])
                      logger.info(f"Extracted Discogs image URL: {primary_image['uri']}")
 
             return discogs_data
-            
-        except AttributeError as e:
-             logger.error(f"Attribute error accessing Discogs data for ID {best_match.id}: {e}")
+
+        except httpx.HTTPStatusError as e:
+             logger.error(f"Discogs API HTTP error fetching release details: {e.response.status_code} - {e}")
+             if e.response.status_code == 401:
+                  logger.error("Authentication failed specifically during Discogs release fetch!")
              return None
-        except discogs_client.exceptions.HTTPError as e:
-             logger.error(f"Discogs API HTTP error during refresh: {e.status_code} - {e}") 
-             if e.status_code == 401:
-                  logger.error("Authentication failed specifically during Discogs refresh call!")
+        except httpx.RequestError as e:
+             logger.error(f"Discogs API request failed fetching release details: {e}")
              return None
         except Exception as e:
-             logger.exception(f"Unexpected error processing Discogs result ID {best_match.id}: {e}")
+             logger.exception(f"Unexpected error processing Discogs result ID {discogs_id}: {e}")
              return None
 
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        if self.async_client:
+            await self.async_client.aclose()
+
 # Create a global instance
-discogs_service = DiscogsService() 
\ No newline at end of file
+discogs_service = services.register("discogs", DiscogsService)
@@ -1,7 +1,14 @@
-from typing import Dict, List, Optional, Any
-import requests
+from typing import Dict, List, Optional, Any, Tuple
+import httpx
+from cachetools import TTLCache
 from ...core.config import settings
 from ...core.logging import logger
+from ...core.executors import bulkheads
+from ...core.services import services
+from ...core.http_transport import http_transport
+from .jamendo_catalog import jamendo_catalog_index, JamendoCatalogIndex, format_jamendo_track
+from .jamendo_query_planner import jamendo_query_planner, JamendoQueryPlanner
+from ..similarity.tag_ranker import tag_similarity_ranker, TagSimilarityRanker
 import asyncio
 
 class JamendoService:
@@ -9,10 +16,48 @@ class JamendoService:
     
     BASE_URL = "https://api.jamendo.com/v3.0"
     CLIENT_ID = "b553314a"
+    REQUEST_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+    RESULT_CACHE_SIZE = 1024
+    RESULT_CACHE_TTL = 30 * 60 # Jamendo's catalog changes slowly
+    CANDIDATE_MULTIPLIER = 3 # Over-fetch so re-ranking by tag similarity has room to work
+    MAX_CANDIDATES = 200 # Jamendo's maximum page size
     
-    def __init__(self):
+    def __init__(self, catalog_index: JamendoCatalogIndex = jamendo_catalog_index, ranker: TagSimilarityRanker = tag_similarity_ranker,
+                 planner: JamendoQueryPlanner = jamendo_query_planner):
         # self.api_key = settings.JAMENDO_API_KEY # API key not typically needed for public search
         self.base_url = "https://api.jamendo.com/v3.0"
+        self.async_client = http_transport.client(base_url=self.base_url, timeout=self.REQUEST_TIMEOUT)
+        # Results keyed by the canonical keyword set + limit, so reordered or
+        # differently-cased keyword lists from Gemini share one entry
+        self._result_cache: TTLCache = TTLCache(maxsize=self.RESULT_CACHE_SIZE, ttl=self.RESULT_CACHE_TTL)
+        self._in_flight: Dict[Tuple, asyncio.Task] = {}
+        self.catalog_index = catalog_index
+        self.ranker = ranker
+        self.planner = planner
+        self._catalog_load_lock = asyncio.Lock()
+
+    async def _search_catalog(self, keywords: List[str], limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """Answer from the local catalog mirror when one has been synced (empty otherwise)."""
+        if not self.catalog_index.loaded:
+            if not self.catalog_index.store.available:
+                return []
+            async with self._catalog_load_lock:
+                if not self.catalog_index.loaded:
+                    try:
+                        await bulkheads["index"].run(self.catalog_index.load)
+                    except Exception as e:
+                        logger.error(f"Failed to load local Jamendo catalog: {e}")
+                        return []
+        return self.catalog_index.search(keywords, limit=offset + limit)[offset:]
+
+    @staticmethod
+    def _canonical_keywords(keywords: List[str]) -> List[str]:
+        """Strip, case-fold and de-duplicate keywords, keeping first-seen order."""
+        return list(dict.fromkeys(kw.strip().casefold() for kw in keywords if kw and kw.strip()))
+
+    @staticmethod
+    def _cache_key(keywords: List[str], limit: int, offset: int = 0) -> Tuple:
+        return (tuple(sorted(keywords)), limit, offset)
     
     @staticmethod
     def _map_spotify_mood(valence: float, energy: float) -> str:
@@ -33,10 +78,28 @@ class JamendoService:
         """Determine if track is likely instrumental based on Spotify features."""
         return instrumentalness > 0.5 and danceability < 0.5
     
+    def candidate_limit(self, limit: int) -> int:
+        """Candidates fetched per sub-query for a search returning `limit` results."""
+        return min(limit * self.CANDIDATE_MULTIPLIER, self.MAX_CANDIDATES)
+
+    def start_speculative_search(self, seed_keywords: List[str], limit: int = 10) -> Optional[asyncio.Task]:
+        """
+        Start fetching candidates for tags that are known early (e.g. Musixmatch genres,
+        MusicBrainz tags, Discogs styles) while slower stages are still running. Pass
+        the returned task to find_similar_tracks_by_keywords once the final keywords
+        are known. Returns None when there is nothing to search for.
+        """
+        seed_keywords = self._canonical_keywords(seed_keywords)
+        if not seed_keywords:
+            return None
+        logger.info(f"Starting speculative Jamendo search with seed keywords: {seed_keywords}")
+        return asyncio.ensure_future(self._find_candidates(seed_keywords, self.candidate_limit(limit)))
+
     async def find_similar_tracks_by_keywords(
         self,
         keywords: List[str],
-        limit: int = 10 # How many results to return
+        limit: int = 10, # How many results to return
+        speculative: Optional[asyncio.Task] = None
     ) -> List[Dict[str, Any]]:
         """
         Find similar tracks on Jamendo based on a list of keywords (tags).
@@ -44,25 +107,125 @@ class JamendoService:
         Args:
             keywords: List of keywords generated by AI or other means.
             limit: Max number of tracks to return.
+            speculative: Task from start_speculative_search. Its candidates are merged
+                with those of a search for the keywords themselves, which runs while
+                the speculative search finishes.
             
         Returns:
-            List of similar tracks with metadata.
+            List of similar tracks with metadata, best match first, each with a
+            `similarity_score` between 0 and 1.
+        """
+        return (await self.rank_similar_tracks(keywords, limit=limit, speculative=speculative))[:limit]
+
+    async def rank_similar_tracks(
+        self,
+        keywords: List[str],
+        limit: int = 10,
+        speculative: Optional[asyncio.Task] = None
+    ) -> List[Dict[str, Any]]:
         """
+        Like find_similar_tracks_by_keywords, but return every fetched candidate in
+        ranked order (the first `limit` are the best matches), so callers can page
+        through more results without searching again.
+        """
+        keywords = self._canonical_keywords(keywords)
         if not keywords:
             logger.warning("No keywords provided for Jamendo search.")
+            if speculative is not None:
+                speculative.cancel()
+            return []
+
+        if speculative is None:
+            candidates = await self._find_candidates(keywords, self.candidate_limit(limit)) or []
+            return self.ranker.rank(keywords, candidates, len(candidates))
+
+        # The final keywords are always searched too (the seed tags may have missed them
+        # entirely); that search overlaps whatever is left of the speculative one
+        fresh = asyncio.ensure_future(self._find_candidates(keywords, self.candidate_limit(limit)))
+        try:
+            speculative_candidates = await speculative or []
+        except asyncio.CancelledError:
+            fresh.cancel()
+            raise
+        except Exception as e:
+            logger.warning(f"Speculative Jamendo search failed: {e}")
+            speculative_candidates = []
+        fresh_candidates = await fresh or []
+        logger.info(
+            f"Merging {len(speculative_candidates)} speculative and {len(fresh_candidates)} keyword Jamendo candidates for {keywords}"
+        )
+        candidates = self.planner.fuse([fresh_candidates, speculative_candidates])
+        return self.ranker.rank(keywords, candidates, len(candidates))
+
+    async def fetch_ranked_page(self, keywords: List[str], offset: int, page_size: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetch and rank the candidates at `offset` (per sub-query) for keywords, e.g. to
+        extend a paginated result list. Returns an empty list once results run out,
+        and None if the page could not be fetched (worth retrying later).
+        """
+        keywords = self._canonical_keywords(keywords)
+        if not keywords:
             return []
+        candidates = await self._find_candidates(keywords, page_size, offset=offset)
+        if candidates is None:
+            return None
+        return self.ranker.rank(keywords, candidates, len(candidates))
 
+    async def _find_candidates(self, keywords: List[str], candidate_limit: int, offset: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """
+        Unranked candidates for canonical keywords, from the local catalog or the API.
+        None if there are none because a Jamendo request failed (rather than ran out).
+        """
+        local_tracks = await self._search_catalog(keywords, candidate_limit, offset=offset)
+        if local_tracks:
+            logger.info(f"Found {len(local_tracks)} candidate tracks in local Jamendo catalog for keywords: {keywords}")
+            return local_tracks
+
+        # Long keyword lists are split into focused per-facet sub-queries that run
+        # concurrently over the shared pool, so the fan-out costs one round trip
+        sub_queries = self.planner.plan(keywords)
+        if len(sub_queries) > 1:
+            logger.info(f"Jamendo query plan for {keywords}: {sub_queries}")
+        results = await asyncio.gather(*(self._fetch_candidates(sub, candidate_limit, offset) for sub in sub_queries))
+        candidates = self.planner.fuse([result for result in results if result is not None])
+        if not candidates and any(result is None for result in results):
+            return None
+        return candidates
+
+    async def _fetch_candidates(self, keywords: List[str], limit: int, offset: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """Fetch (or reuse cached) unranked candidates from the Jamendo API. None when the request failed."""
+        cache_key = self._cache_key(keywords, limit, offset)
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Jamendo results for keywords {keywords} served from cache")
+            return cached
+
+        # Share a single request between concurrent callers asking for the same set
+        task = self._in_flight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._search_tracks(keywords, limit, offset))
+            self._in_flight[cache_key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(cache_key, None))
+        similar_tracks = await asyncio.shield(task)
+
+        if similar_tracks is None:
+            return None # Request failed; don't cache the failure
+        self._result_cache[cache_key] = similar_tracks
+        return similar_tracks
+
+    async def _search_tracks(self, keywords: List[str], limit: int, offset: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """Query Jamendo's track search. Returns None when the request fails."""
         try:
             search_tags_str = " ".join(keywords)
             logger.info(f"Searching Jamendo with keywords: {search_tags_str}")
             
-            response = await asyncio.to_thread( # Use async request
-                requests.get,
-                f"{self.base_url}/tracks/",
+            response = await self.async_client.get(
+                "/tracks/",
                 params={
                     "client_id": self.CLIENT_ID, # Use the public CLIENT_ID
                     "format": "json",
                     "limit": limit,
+                    "offset": offset,
                     "fuzzytags": search_tags_str,
                     "include": "musicinfo stats",
                     "boost": "popularity_total",
@@ -77,31 +240,21 @@ class JamendoService:
             # Process and format results
             similar_tracks = []
             for track in data.get("results", []):
-                # Add basic track info
-                similar_tracks.append({
-                    "id": track["id"],
-                    "title": track["name"],
-                    "artist": track["artist_name"],
-                    "duration": str(track["duration"]),
-                    "audio_url": track.get("audio", ""),
-                    "download_url": track.get("audiodownload", ""),
-                    "image_url": track.get("image", ""),
-                    "license": track.get("license_ccurl", "Unknown License"),
-                    "tags": track.get("musicinfo", {}).get("tags", {}).get("genres", []) + \
-                            track.get("musicinfo", {}).get("tags", {}).get("instruments", []) + \
-                            track.get("musicinfo", {}).get("tags", {}).get("vartags", []),
-                    # No simple similarity score based just on keywords, could be added later
-                })
+                similar_tracks.append(format_jamendo_track(track))
             
             logger.info(f"Found {len(similar_tracks)} tracks on Jamendo for keywords: {search_tags_str}")
             return similar_tracks
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Jamendo API request failed: {str(e)}")
-            return [] # Return empty list on API error
+            return None
         except Exception as e:
             logger.exception(f"Error finding similar tracks on Jamendo: {str(e)}")
-            return [] # Return empty list on other errors
+            return None
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.async_client.aclose()
 
 # Create a global instance
-jamendo_service = JamendoService() 
\ No newline at end of file
+jamendo_service = services.register("jamendo", JamendoService)
\ No newline at end of file
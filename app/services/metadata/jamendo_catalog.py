@@ -0,0 +1,307 @@
+"""
+Local mirror of the Jamendo track catalog with an in-memory inverted tag index.
+
+A sync job pages through Jamendo's /tracks endpoint (incrementally, by release
+date) into a SQLite store. JamendoCatalogIndex loads the store into posting
+arrays over the `musicinfo` tags (genres, instruments, vartags) and answers
+keyword queries with BM25 scoring plus a popularity boost, without calling
+Jamendo.
+
+Usage:
+    python -m app.services.metadata.jamendo_catalog [--full]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+import httpx
+import numpy as np
+from ...core.config import settings
+from ...core.logging import logger
+from ...core.http_transport import http_transport
+from ..media.artwork import artwork_url
+from ..media.preview_cache import preview_url
+
+_TAG_JOINERS = re.compile(r"[\s\-_/&+.']+")
+
+def normalize_tag(tag: str) -> str:
+    """Fold a tag so 'Hip-Hop', 'hip hop' and 'hiphop' match."""
+    return _TAG_JOINERS.sub("", (tag or "").casefold())
+
+def query_terms(keywords: Iterable[str]) -> List[str]:
+    """Expand keywords into index terms: the whole keyword plus its individual words."""
+    terms = []
+    for keyword in keywords:
+        words = [w for w in _TAG_JOINERS.split((keyword or "").casefold()) if w]
+        for term in ["".join(words)] + (words if len(words) > 1 else []):
+            if term and term not in terms:
+                terms.append(term)
+    return terms
+
+def format_jamendo_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a raw Jamendo API track the way JamendoService returns it."""
+    tags = track.get("musicinfo", {}).get("tags", {})
+    return {
+        "id": track["id"],
+        "title": track["name"],
+        "artist": track["artist_name"],
+        "duration": str(track["duration"]),
+        "audio_url": track.get("audio", ""),
+        "download_url": track.get("audiodownload", ""),
+        "image_url": track.get("image", ""),
+        "license": track.get("license_ccurl", "Unknown License"),
+        "preview_url": preview_url(track["id"]), # Cached proxy for audio_url
+        "thumbnail_url": artwork_url(track.get("image")), # Resized, cached proxy for image_url
+        "tags": tags.get("genres", []) + tags.get("instruments", []) + tags.get("vartags", []),
+    }
+
+def track_popularity(track: Dict[str, Any]) -> float:
+    stats = track.get("stats") or {}
+    try:
+        return float(stats.get("rate_listened_total") or 0) + float(stats.get("rate_downloads_total") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class JamendoCatalogStore:
+    """SQLite store holding the mirrored catalog and sync state."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.JAMENDO_CATALOG_PATH or \
+                       os.path.join(settings.CACHE_DIR, "jamendo_catalog.sqlite3")
+
+    @property
+    def available(self) -> bool:
+        return os.path.exists(self.db_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jamendo_tracks (
+                id TEXT PRIMARY KEY,
+                releasedate TEXT,
+                popularity REAL NOT NULL,
+                track TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS jamendo_sync_state (key TEXT PRIMARY KEY, value TEXT)")
+        return conn
+
+    def upsert_tracks(self, raw_tracks: List[Dict[str, Any]]) -> int:
+        """Insert or update raw Jamendo tracks. Returns the number of rows written."""
+        rows = [
+            (str(t["id"]), t.get("releasedate"), track_popularity(t), json.dumps(format_jamendo_track(t)))
+            for t in raw_tracks if t.get("id") and t.get("audio")
+        ]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO jamendo_tracks (id, releasedate, popularity, track) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+        finally:
+            conn.close()
+        return len(rows)
+
+    def get_state(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM jamendo_sync_state WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def set_state(self, key: str, value: str) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO jamendo_sync_state (key, value) VALUES (?, ?)", (key, value))
+        finally:
+            conn.close()
+
+    def iter_tracks(self) -> Iterable[Tuple[Dict[str, Any], float]]:
+        conn = self._connect()
+        try:
+            for track_json, popularity in conn.execute("SELECT track, popularity FROM jamendo_tracks ORDER BY id"):
+                yield json.loads(track_json), popularity
+        finally:
+            conn.close()
+
+class JamendoCatalogSync:
+    """Pages through the Jamendo catalog into a JamendoCatalogStore."""
+
+    BASE_URL = "https://api.jamendo.com/v3.0"
+    CLIENT_ID = "b553314a"
+    PAGE_SIZE = 200 # Jamendo's maximum page size
+    LAST_RELEASEDATE_KEY = "last_releasedate"
+
+    def __init__(self, store: JamendoCatalogStore, client: Optional[httpx.AsyncClient] = None):
+        self.store = store
+        self.client = client or http_transport.client(base_url=self.BASE_URL, timeout=httpx.Timeout(30.0, connect=5.0))
+
+    async def sync(self, full: bool = False) -> int:
+        """
+        Mirror the catalog. Incremental runs only request tracks released since the
+        newest release date seen by the previous run. Returns the number of tracks written.
+        """
+        since = None if full else self.store.get_state(self.LAST_RELEASEDATE_KEY)
+        params = {
+            "client_id": self.CLIENT_ID,
+            "format": "json",
+            "limit": self.PAGE_SIZE,
+            "include": "musicinfo stats",
+            "audioformat": "mp32",
+            "order": "releasedate_asc",
+        }
+        if since:
+            # Inclusive range; re-fetching the boundary day is harmless thanks to upserts
+            params["datebetween"] = f"{since}_{date.today().isoformat()}"
+        logger.info(f"Starting Jamendo catalog sync ({'full' if not since else f'since {since}'})")
+
+        written = 0
+        offset = 0
+        newest = since
+        while True:
+            response = await self.client.get("/tracks/", params={**params, "offset": offset})
+            response.raise_for_status()
+            results = response.json().get("results", [])
+            if not results:
+                break
+            written += self.store.upsert_tracks(results)
+            newest = max([newest or ""] + [t.get("releasedate") or "" for t in results]) or None
+            offset += len(results)
+            logger.info(f"Jamendo catalog sync: {written} tracks written (offset {offset})")
+            if len(results) < self.PAGE_SIZE:
+                break
+
+        if newest:
+            self.store.set_state(self.LAST_RELEASEDATE_KEY, newest)
+        logger.info(f"Jamendo catalog sync finished: {written} tracks written")
+        return written
+
+class JamendoCatalogIndex:
+    """
+    In-memory inverted index over catalog tags.
+
+    Each term maps to a posting array of document indices and precomputed BM25
+    term weights, so a query is a handful of vectorized scatter-adds followed by
+    a partial sort.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    POPULARITY_WEIGHT = 0.3 # Max relative boost for the most popular track
+
+    def __init__(self, store: JamendoCatalogStore):
+        self.store = store
+        self.tracks: List[Dict[str, Any]] = []
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._popularity_boost: np.ndarray = np.zeros(0, dtype=np.float32)
+        self._load_lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def load(self) -> None:
+        """Build the index from the store (blocking; call from a thread at startup)."""
+        with self._load_lock:
+            tracks: List[Dict[str, Any]] = []
+            popularity: List[float] = []
+            doc_terms: List[Dict[str, int]] = []
+            for track, track_popularity_value in self.store.iter_tracks():
+                # Proxy URLs are stored at sync time; follow the current PUBLIC_BASE_URL
+                track["preview_url"] = preview_url(track["id"])
+                track["thumbnail_url"] = artwork_url(track.get("image_url"))
+                term_counts: Dict[str, int] = {}
+                for tag in track.get("tags", []):
+                    term = normalize_tag(tag)
+                    if term:
+                        term_counts[term] = term_counts.get(term, 0) + 1
+                tracks.append(track)
+                popularity.append(track_popularity_value)
+                doc_terms.append(term_counts)
+
+            n_docs = len(tracks)
+            doc_lengths = np.array([sum(t.values()) for t in doc_terms], dtype=np.float32)
+            avg_length = float(doc_lengths.mean()) if n_docs else 0.0
+
+            raw_postings: Dict[str, Tuple[List[int], List[int]]] = {}
+            for doc_id, term_counts in enumerate(doc_terms):
+                for term, tf in term_counts.items():
+                    docs, tfs = raw_postings.setdefault(term, ([], []))
+                    docs.append(doc_id)
+                    tfs.append(tf)
+
+            postings = {}
+            for term, (docs, tfs) in raw_postings.items():
+                doc_ids = np.array(docs, dtype=np.int32)
+                tf = np.array(tfs, dtype=np.float32)
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.K1 * (1 - self.B + self.B * doc_lengths[doc_ids] / max(avg_length, 1e-9))
+                postings[term] = (doc_ids, (idf * tf * (self.K1 + 1) / (tf + norm)).astype(np.float32))
+
+            pop = np.log1p(np.array(popularity, dtype=np.float32))
+            max_pop = float(pop.max()) if n_docs else 0.0
+            boost = 1.0 + self.POPULARITY_WEIGHT * (pop / max_pop if max_pop > 0 else pop)
+
+            self.tracks = tracks
+            self._postings = postings
+            self._popularity_boost = boost.astype(np.float32)
+            self.loaded = True
+            logger.info(f"Jamendo catalog index loaded: {n_docs} tracks, {len(postings)} tags")
+
+    def search(self, keywords: List[str], limit: int = 10) -> List[Dict[str, Any]]:
+        """Return up to `limit` tracks ranked by BM25 over tags, boosted by popularity."""
+        if not self.tracks:
+            return []
+        scores = np.zeros(len(self.tracks), dtype=np.float32)
+        for term in query_terms(keywords):
+            posting = self._postings.get(term)
+            if posting is not None:
+                doc_ids, weights = posting
+                scores[doc_ids] += weights
+
+        matched = np.flatnonzero(scores)
+        if matched.size == 0:
+            return []
+        scores = scores[matched] * self._popularity_boost[matched]
+        if matched.size > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(matched.size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [dict(self.tracks[matched[i]]) for i in top]
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Mirror the Jamendo catalog into the local store.")
+    parser.add_argument("--full", action="store_true", help="Ignore the last sync date and re-mirror everything")
+    parser.add_argument("--db", default=None, help="Catalog database path (defaults to JAMENDO_CATALOG_PATH)")
+    args = parser.parse_args(argv)
+
+    async def run():
+        syncer = JamendoCatalogSync(JamendoCatalogStore(args.db))
+        try:
+            await syncer.sync(full=args.full)
+        finally:
+            await syncer.client.aclose()
+
+    asyncio.run(run())
+
+# Create global instances
+jamendo_catalog_store = JamendoCatalogStore()
+jamendo_catalog_index = JamendoCatalogIndex(jamendo_catalog_store)
+
+if __name__ == "__main__":
+    main()
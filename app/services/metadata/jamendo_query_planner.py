@@ -0,0 +1,100 @@
+"""
+Query planning for Jamendo tag searches.
+
+Jamendo's `fuzzytags` search loses recall quickly as the tag string grows, so a
+long keyword list is split into a few focused sub-queries, one per facet (genre,
+mood, instrumentation, era). The sub-query results are merged with
+reciprocal-rank fusion (RRF) and de-duplicated by track id.
+"""
+import re
+from typing import Dict, List, Any
+from ...core.logging import logger
+from .jamendo_catalog import normalize_tag
+
+FACET_GENRE = "genre"
+FACET_MOOD = "mood"
+FACET_INSTRUMENT = "instrument"
+FACET_ERA = "era"
+
+# Vocabulary in normalize_tag() form; anything unrecognised is treated as a genre
+MOOD_TAGS = {
+    "happy", "sad", "calm", "relaxing", "relaxed", "energetic", "melancholic", "melancholy", "dark",
+    "romantic", "epic", "chill", "chillout", "dreamy", "uplifting", "aggressive", "peaceful",
+    "emotional", "upbeat", "mellow", "atmospheric", "angry", "hopeful", "nostalgic", "intense",
+    "soft", "groovy", "sentimental", "playful", "powerful", "tense", "mysterious", "sexy",
+    "inspiring", "motivational", "introspective", "moody", "euphoric", "bittersweet", "dance",
+}
+INSTRUMENT_TAGS = {
+    "piano", "guitar", "acousticguitar", "electricguitar", "bass", "bassguitar", "drums",
+    "drummachine", "synthesizer", "synth", "violin", "strings", "saxophone", "sax", "trumpet",
+    "cello", "flute", "organ", "vocals", "voice", "percussion", "ukulele", "harp", "accordion",
+    "banjo", "harmonica", "brass", "choir", "keyboard", "keyboards", "clarinet", "horns", "sampler",
+}
+ERA_TAGS = {"retro", "vintage", "oldschool", "oldies", "modern", "contemporary"}
+_DECADE = re.compile(r"^(?:19|20)?\d0s$")
+
+class JamendoQueryPlanner:
+    """Splits keywords into per-facet sub-queries and fuses their ranked results."""
+
+    MAX_TERMS_PER_QUERY = 3 # Keeps each fuzzytags query narrow enough to match well
+    MAX_SUB_QUERIES = 4 # All run concurrently; more would only add rate-limit pressure
+    RRF_K = 60 # Standard RRF damping constant
+
+    @staticmethod
+    def facet_of(keyword: str) -> str:
+        tag = normalize_tag(keyword)
+        if tag in MOOD_TAGS:
+            return FACET_MOOD
+        if tag in INSTRUMENT_TAGS:
+            return FACET_INSTRUMENT
+        if tag in ERA_TAGS or _DECADE.match(tag):
+            return FACET_ERA
+        return FACET_GENRE
+
+    def plan(self, keywords: List[str]) -> List[List[str]]:
+        """
+        Group keywords by facet, keeping their original priority order, and return up
+        to MAX_SUB_QUERIES sub-queries of at most MAX_TERMS_PER_QUERY keywords each.
+        Overflow from any facet fills the remaining budget; what still does not fit is
+        logged. Short keyword lists are returned as a single query.
+        """
+        if len(keywords) <= self.MAX_TERMS_PER_QUERY:
+            return [list(keywords)]
+
+        facets: Dict[str, List[str]] = {FACET_GENRE: [], FACET_MOOD: [], FACET_INSTRUMENT: [], FACET_ERA: []}
+        for keyword in keywords:
+            facets[self.facet_of(keyword)].append(keyword)
+
+        sub_queries = []
+        # One query per facet first, so every facet is represented...
+        for terms in facets.values():
+            if terms:
+                sub_queries.append(terms[:self.MAX_TERMS_PER_QUERY])
+        # ...then spend any remaining budget on each facet's overflow, genres (the most
+        # discriminative facet) first
+        overflow = [
+            terms[start:start + self.MAX_TERMS_PER_QUERY]
+            for terms in facets.values()
+            for start in range(self.MAX_TERMS_PER_QUERY, len(terms), self.MAX_TERMS_PER_QUERY)
+        ]
+        budget = max(0, self.MAX_SUB_QUERIES - len(sub_queries))
+        sub_queries.extend(overflow[:budget])
+        dropped = [term for terms in overflow[budget:] for term in terms]
+        if dropped:
+            logger.info(f"Jamendo query plan is over its {self.MAX_SUB_QUERIES} sub-query budget; not searching for: {dropped}")
+        return sub_queries[:self.MAX_SUB_QUERIES]
+
+    def fuse(self, result_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Merge ranked result lists with reciprocal-rank fusion, de-duplicating by track id."""
+        scores: Dict[Any, float] = {}
+        tracks: Dict[Any, Dict[str, Any]] = {}
+        for results in result_lists:
+            for rank, track in enumerate(results, start=1):
+                track_id = track["id"]
+                scores[track_id] = scores.get(track_id, 0.0) + 1.0 / (self.RRF_K + rank)
+                tracks.setdefault(track_id, track)
+        # sorted() is stable, so equal scores keep first-seen order
+        return [tracks[track_id] for track_id in sorted(tracks, key=lambda t: -scores[t])]
+
+# Create a global instance
+jamendo_query_planner = JamendoQueryPlanner()
@@ -1,17 +1,24 @@
-import requests
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+from cachetools import TTLCache
 from ...core.logging import logger
-from ...core.exceptions import MetadataAPIError
-import asyncio
+from ...core.exceptions import MetadataAPIError, BulkheadFullError
+from ...core.executors import bulkheads
+from ...core.services import services
 import musicbrainzngs # Keep the library import
+from urllib.parse import urlparse, unquote
 
 class MusicBrainzClient:
     """Client for interacting with MusicBrainz API."""
     
     # BASE_URL = "https://musicbrainz.org/ws/2" # Not needed for library
     USER_AGENT = "SoundMatch/1.0 (andy@example.com)" # Replace with actual contact if possible
+    REFERENCE_CACHE_SIZE = 4096
+    REFERENCE_CACHE_TTL = 7 * 24 * 60 * 60 # url-rels rarely change
     
     def __init__(self):
+        # (MBID, release group ID) -> Wikipedia reference or None. Each miss costs one or two
+        # rate-limited (~1 req/s) MusicBrainz lookups, so "no link" answers are cached too.
+        self._reference_cache: TTLCache = TTLCache(maxsize=self.REFERENCE_CACHE_SIZE, ttl=self.REFERENCE_CACHE_TTL)
         # Setup musicbrainzngs user agent
         try:
             musicbrainzngs.set_useragent(app="SoundMatch", version="1.0", contact="andy@example.com") # Replace with actual contact
@@ -22,15 +29,18 @@ class MusicBrainzClient:
     async def _search_recordings_async(self, title: str, artist: str, limit: int = 5):
         """Internal async wrapper for musicbrainzngs search."""
         try:
-            # Use to_thread as musicbrainzngs is synchronous
+            # musicbrainzngs is synchronous (and sleeps for its rate limit), so it gets its own pool
             logger.debug(f"Querying MusicBrainz with: recording:\"{title}\" AND artist:\"{artist}\"")
-            result = await asyncio.to_thread(
+            result = await bulkheads["musicbrainz"].run(
                 musicbrainzngs.search_recordings,
                 query=f'recording:"{title}" AND artist:"{artist}"', 
                 limit=limit,
                 strict=True 
             )
             return result
+        except BulkheadFullError as exc:
+            logger.warning(f"Skipping MusicBrainz search for '{title}': {exc}")
+            return None
         except (musicbrainzngs.UsageError, musicbrainzngs.ResponseError) as exc:
             logger.error(f"MusicBrainz usage or response parsing error: {exc}", exc_info=True)
             logger.error(f"This often indicates an issue with the data received from MusicBrainz or how it's being parsed (e.g., unexpected attributes like 'type-id' in aliases).")
@@ -80,11 +90,81 @@ class MusicBrainzClient:
             mb_data["tags"] = [tag['name'] for tag in tags if 'name' in tag]
             logger.info(f"Extracted MusicBrainz tags: {mb_data['tags']}")
 
-        # We could potentially fetch more data using the MBID here if needed (e.g., genres)
-        # using musicbrainzngs.get_recording_by_id(mbid, includes=["genres"]) 
-        # but keep it simple for now.
+        # Keep the release group of the first release; it may carry Wikipedia links
+        # when the recording and its works do not.
+        releases = best_match.get('release-list', [])
+        release_group_id = releases[0].get('release-group', {}).get('id') if releases else None
+        if release_group_id:
+            mb_data["release_group_id"] = release_group_id
 
         return mb_data
+
+    @staticmethod
+    def _wikipedia_reference_from_relations(url_relations: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        """Pick an English Wikipedia page title or a Wikidata item ID from url-rels."""
+        wikidata_id = None
+        for relation in url_relations:
+            target = relation.get('target', '')
+            parsed = urlparse(target)
+            if relation.get('type') == 'wikipedia' and parsed.netloc == 'en.wikipedia.org' and parsed.path.startswith('/wiki/'):
+                page_title = unquote(parsed.path[len('/wiki/'):]).replace('_', ' ')
+                if page_title:
+                    return {"wikipedia_title": page_title}
+            elif relation.get('type') == 'wikidata' and not wikidata_id:
+                wikidata_id = parsed.path.rstrip('/').rsplit('/', 1)[-1] or None
+        return {"wikidata_id": wikidata_id} if wikidata_id else None
+
+    async def get_wikipedia_reference(self, mbid: str, release_group_id: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """
+        Find the Wikipedia page for a recording via MusicBrainz URL relationships.
+
+        Checks the recording's own url-rels and those of its works (one lookup), then
+        falls back to the release group. Returns {"wikipedia_title": ...} or
+        {"wikidata_id": ...}, or None when MusicBrainz has no such link. Answers are
+        cached per MBID; failed lookups are not.
+        """
+        cache_key: Tuple[str, Optional[str]] = (mbid, release_group_id)
+        if cache_key in self._reference_cache:
+            return self._reference_cache[cache_key]
+        try:
+            result = await bulkheads["musicbrainz"].run(
+                musicbrainzngs.get_recording_by_id,
+                mbid,
+                includes=["url-rels", "work-rels", "work-level-rels"]
+            )
+            recording = result.get('recording', {})
+            reference = self._wikipedia_reference_from_relations(recording.get('url-relation-list', []))
+            if not reference:
+                for work_relation in recording.get('work-relation-list', []):
+                    work = work_relation.get('work', {})
+                    reference = self._wikipedia_reference_from_relations(work.get('url-relation-list', []))
+                    if reference:
+                        break
+
+            if not reference and release_group_id:
+                result = await bulkheads["musicbrainz"].run(
+                    musicbrainzngs.get_release_group_by_id,
+                    release_group_id,
+                    includes=["url-rels"]
+                )
+                release_group = result.get('release-group', {})
+                reference = self._wikipedia_reference_from_relations(release_group.get('url-relation-list', []))
+
+            if reference:
+                logger.info(f"Found Wikipedia reference for MBID {mbid} via MusicBrainz url-rels: {reference}")
+            else:
+                logger.info(f"No Wikipedia/Wikidata url-rels found on MusicBrainz for MBID {mbid}")
+            self._reference_cache[cache_key] = reference
+            return reference
+        except BulkheadFullError as exc:
+            logger.warning(f"Skipping MusicBrainz url-rels lookup for {mbid}: {exc}")
+            return None
+        except musicbrainzngs.WebServiceError as exc:
+            logger.error(f"MusicBrainz API WebServiceError during url-rels lookup for {mbid}: {exc}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error during MusicBrainz url-rels lookup for {mbid}: {e}", exc_info=True)
+            return None
             
     # --- Remove old/unused methods --- 
     # async def search_track(self, query: str) -> Optional[Dict[str, Any]]: ...
@@ -93,4 +173,4 @@ class MusicBrainzClient:
     # def _extract_features(self, tags: list, ratings: list, genres: list) -> Dict[str, Any]: ...
 
 # Create a global instance
-musicbrainz_client = MusicBrainzClient() 
\ No newline at end of file
+musicbrainz_client = services.register("musicbrainz", MusicBrainzClient)
\ No newline at end of file
@@ -3,6 +3,8 @@ from typing import Dict, Any, Optional, List
 import asyncio
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.services import services
+from app.core.http_transport import http_transport
 from app.core.exceptions import MusixmatchAPIError
 
 class MusixmatchService:
@@ -14,7 +16,7 @@ class MusixmatchService:
         self.api_key = settings.MUSIXMATCH_API_KEY
         if not self.api_key:
             raise ValueError("Musixmatch API key not configured")
-        self.async_client = httpx.AsyncClient()
+        self.async_client = http_transport.client()
         
     async def _parse_track_data(self, track_data: Dict) -> Optional[Dict]:
         """Helper to parse track data from Musixmatch response."""
@@ -140,5 +142,9 @@ class MusixmatchService:
             logger.exception(f"Unexpected error getting Musixmatch metadata (search): {str(e)}")
             raise MusixmatchAPIError(f"Unexpected error getting Musixmatch metadata: {str(e)}")
 
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.async_client.aclose()
+
 # Create a global instance
-musixmatch_service = MusixmatchService() 
\ No newline at end of file
+musixmatch_service = services.register("musixmatch", MusixmatchService)
\ No newline at end of file
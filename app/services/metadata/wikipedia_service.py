@@ -1,81 +1,217 @@
 import asyncio
+import time
 import httpx
-from typing import Optional, Dict, Any
+from cachetools import LRUCache
+from typing import Optional, Dict, Any, List
 from ...core.logging import logger
+from ...core.services import services
+from ...core.http_transport import http_transport
 
 class WikipediaService:
     USER_AGENT = "SoundMatch/1.0 (Contact: andy@example.com)" # Replace with actual contact
     BASE_URL = "https://en.wikipedia.org/w/api.php"
+    WIKIDATA_URL = "https://www.wikidata.org/w/api.php"
+    REQUEST_TIMEOUT = 10.0
+    CACHE_SIZE = 4096
+    # Cached pages younger than this are served without contacting Wikipedia; older
+    # ones are revalidated with a cheap revision-id check before reuse.
+    FRESH_SECONDS = 6 * 60 * 60
 
-    async def get_wikipedia_summary(self, search_term: str) -> Optional[str]:
-        """Fetches the introductory summary of a Wikipedia page."""
-        logger.info(f"Querying Wikipedia for summary of: {search_term}")
-        
+    def __init__(self):
+        self.async_client = http_transport.client(
+            headers={'User-Agent': self.USER_AGENT},
+            timeout=self.REQUEST_TIMEOUT
+        )
+        # Page title -> {"revid", "summary", "checked_at"}
+        self._page_cache: LRUCache = LRUCache(maxsize=self.CACHE_SIZE)
+        # Requested title -> (resolved page title or None if missing, checked_at)
+        self._title_cache: LRUCache = LRUCache(maxsize=self.CACHE_SIZE)
+        # Wikidata item ID -> English Wikipedia page title (or None); sitelinks rarely change
+        self._wikidata_cache: LRUCache = LRUCache(maxsize=self.CACHE_SIZE)
+
+    async def _query(self, titles: List[str], with_extracts: bool) -> Dict[str, Any]:
+        """Run one MediaWiki query for all titles and return its 'query' object."""
         params = {
             "action": "query",
             "format": "json",
-            "titles": search_term,
-            "prop": "extracts",
-            "exintro": 1,       # Get only content before the first section
-            "explaintext": 1,   # Get plain text extract
+            "titles": "|".join(titles),
+            "prop": "extracts|revisions|pageprops" if with_extracts else "revisions",
+            "rvprop": "ids",
             "redirects": 1,     # Automatically follow redirects
             "origin": "*"       # Necessary for unauthenticated CORS requests if using browser JS, good practice
         }
-        
-        headers = {'User-Agent': self.USER_AGENT}
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.BASE_URL, params=params, headers=headers, timeout=10.0)
-                response.raise_for_status() # Raise exceptions for 4XX/5XX errors
-                
-            data = response.json()
-            pages = data.get("query", {}).get("pages", {})
-            
-            if not pages:
-                logger.warning(f"Wikipedia query returned no pages for: {search_term}")
-                return None
+        if with_extracts:
+            params.update({
+                "exintro": 1,       # Get only content before the first section
+                "explaintext": 1,   # Get plain text extract
+                "exlimit": "max",
+                "ppprop": "disambiguation",
+            })
+        response = await self.async_client.get(self.BASE_URL, params=params)
+        response.raise_for_status() # Raise exceptions for 4XX/5XX errors
+        return response.json().get("query", {})
 
-            # Find the actual page data (API returns page ID as key)
-            page_data = None
-            for page_id, page_info in pages.items():
-                # Ignore invalid pages (e.g., page ID -1 often means missing page)
-                if int(page_id) > 0:
-                    page_data = page_info
-                    break 
-            
-            if not page_data:
-                 logger.warning(f"Wikipedia query returned invalid page data for: {search_term}")
-                 return None
-
-            summary = page_data.get("extract")
-            
-            if summary:
-                # Clean up potential "(listen)" text often found in intros
-                summary = summary.replace("(listen)", "").strip()
-                # Limit length slightly if needed?
-                # MAX_SUMMARY_LEN = 500 
-                # if len(summary) > MAX_SUMMARY_LEN:
-                #    summary = summary[:MAX_SUMMARY_LEN] + "..."
-                logger.info(f"Successfully extracted Wikipedia summary for: {search_term}")
-                return summary
-            else:
-                logger.info(f"No Wikipedia summary (extract) found for page: {page_data.get('title', search_term)}")
-                return None
+    @staticmethod
+    def _resolve_titles(query: Dict[str, Any], titles: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Map each requested title to its page (following normalization and redirects)."""
+        normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+        redirects = {r["from"]: r["to"] for r in query.get("redirects", [])}
+        pages_by_title = {}
+        for page_id, page_info in query.get("pages", {}).items():
+            # Ignore invalid pages (e.g., page ID -1 often means missing page)
+            if int(page_id) > 0 and "missing" not in page_info:
+                pages_by_title[page_info.get("title")] = page_info
 
-        except httpx.HTTPStatusError as e:
-            # Handle cases like 404 Not Found gracefully
-            if e.response.status_code == 404:
-                 logger.warning(f"Wikipedia page not found (404) for: {search_term}")
+        resolved = {}
+        for title in titles:
+            page_title = normalized.get(title, title)
+            page_title = redirects.get(page_title, page_title)
+            resolved[title] = pages_by_title.get(page_title)
+        return resolved
+
+    @staticmethod
+    def _page_revid(page_info: Dict[str, Any]) -> Optional[int]:
+        revisions = page_info.get("revisions") or []
+        return revisions[0].get("revid") if revisions else page_info.get("lastrevid")
+
+    @staticmethod
+    def _clean_summary(page_info: Dict[str, Any]) -> Optional[str]:
+        if "disambiguation" in page_info.get("pageprops", {}):
+            return None
+        summary = page_info.get("extract")
+        if not summary:
+            return None
+        # Clean up potential "(listen)" text often found in intros
+        return summary.replace("(listen)", "").strip() or None
+
+    async def _revalidate(self, titles: List[str], now: float) -> List[str]:
+        """
+        Check cached pages for stale titles with a revisions-only query. Titles whose
+        page is unchanged are marked fresh again; the rest are returned for refetching.
+        """
+        query = await self._query(titles, with_extracts=False)
+        resolved = self._resolve_titles(query, titles)
+        changed = []
+        for title in titles:
+            cached_page_title, _ = self._title_cache[title]
+            page_info = resolved.get(title)
+            page_title = page_info.get("title") if page_info else None
+            cached_page = self._page_cache.get(cached_page_title) if cached_page_title else None
+            unchanged = page_title == cached_page_title and (
+                page_title is None or (cached_page and cached_page["revid"] == self._page_revid(page_info))
+            )
+            if unchanged:
+                self._title_cache[title] = (cached_page_title, now)
+                if cached_page:
+                    cached_page["checked_at"] = now
             else:
-                 logger.error(f"Wikipedia API HTTP error: {e.response.status_code} - {e.request.url}")
+                changed.append(title)
+        return changed
+
+    async def _fetch(self, titles: List[str], now: float) -> None:
+        """Fetch extracts for all titles in one request and populate the caches."""
+        query = await self._query(titles, with_extracts=True)
+        resolved = self._resolve_titles(query, titles)
+        for title in titles:
+            page_info = resolved.get(title)
+            if not page_info:
+                self._title_cache[title] = (None, now)
+                continue
+            page_title = page_info.get("title")
+            self._title_cache[title] = (page_title, now)
+            self._page_cache[page_title] = {
+                "revid": self._page_revid(page_info),
+                "summary": self._clean_summary(page_info),
+                "checked_at": now,
+            }
+
+    def _cached_summary(self, title: str) -> Optional[str]:
+        page_title, _ = self._title_cache.get(title, (None, 0))
+        page = self._page_cache.get(page_title) if page_title else None
+        return page["summary"] if page else None
+
+    async def get_wikipedia_summary(self, *search_terms: str) -> Optional[str]:
+        """
+        Fetches the introductory summary of the first candidate title that resolves
+        to a Wikipedia page with an intro. All candidates are resolved in (at most)
+        one request; results are cached per page together with their revision id.
+        """
+        titles = [t for t in dict.fromkeys(search_terms) if t]
+        if not titles:
             return None
+        logger.info(f"Querying Wikipedia for summary of: {titles}")
+
+        now = time.time()
+        uncached: List[str] = []
+        stale: List[str] = []
+        for title in titles:
+            cached = self._title_cache.get(title)
+            if cached is None:
+                uncached.append(title)
+            elif now - cached[1] >= self.FRESH_SECONDS:
+                stale.append(title)
+
+        try:
+            if stale:
+                uncached.extend(await self._revalidate(stale, now))
+            if uncached:
+                await self._fetch(uncached, now)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Wikipedia API HTTP error: {e.response.status_code} - {e.request.url}")
         except httpx.RequestError as e:
             logger.error(f"Wikipedia API request failed: {e}")
-            return None
         except Exception as e:
-            logger.exception(f"Unexpected error fetching Wikipedia summary for {search_term}: {e}")
+            logger.exception(f"Unexpected error fetching Wikipedia summary for {titles}: {e}")
+
+        for title in titles:
+            summary = self._cached_summary(title)
+            if summary:
+                logger.info(f"Successfully extracted Wikipedia summary for: {title}")
+                return summary
+
+        logger.info(f"No Wikipedia summary (extract) found for any of: {titles}")
+        return None
+
+    async def _wikidata_to_title(self, wikidata_id: str) -> Optional[str]:
+        """Resolve a Wikidata item to its English Wikipedia page title."""
+        if wikidata_id in self._wikidata_cache:
+            return self._wikidata_cache[wikidata_id]
+        params = {
+            "action": "wbgetentities",
+            "format": "json",
+            "ids": wikidata_id,
+            "props": "sitelinks",
+            "sitefilter": "enwiki",
+        }
+        response = await self.async_client.get(self.WIKIDATA_URL, params=params)
+        response.raise_for_status()
+        entity = response.json().get("entities", {}).get(wikidata_id, {})
+        page_title = entity.get("sitelinks", {}).get("enwiki", {}).get("title")
+        self._wikidata_cache[wikidata_id] = page_title
+        return page_title
+
+    async def get_summary_for_reference(self, reference: Dict[str, str]) -> Optional[str]:
+        """
+        Fetch the summary of a page identified directly (e.g. from MusicBrainz url-rels)
+        as {"wikipedia_title": ...} or {"wikidata_id": ...}, without any title guessing.
+        """
+        page_title = reference.get("wikipedia_title")
+        if not page_title and reference.get("wikidata_id"):
+            try:
+                page_title = await self._wikidata_to_title(reference["wikidata_id"])
+            except httpx.HTTPError as e:
+                logger.error(f"Wikidata sitelink lookup failed for {reference['wikidata_id']}: {e}")
+                return None
+            if not page_title:
+                logger.info(f"Wikidata item {reference['wikidata_id']} has no English Wikipedia page")
+                return None
+        if not page_title:
             return None
+        return await self.get_wikipedia_summary(page_title)
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.async_client.aclose()
 
 # Create a global instance
-wikipedia_service = WikipediaService() 
\ No newline at end of file
+wikipedia_service = services.register("wikipedia", WikipediaService)
@@ -2,6 +2,8 @@ import httpx
 from typing import Dict, Any, Optional
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.services import services
+from app.core.http_transport import http_transport
 from app.core.exceptions import RecognitionAPIError
 import asyncio
 
@@ -20,7 +22,7 @@ class ZylaShazamClient:
         self.headers = {
             "Authorization": f"Bearer {self.api_key}"
         }
-        self.async_client = httpx.AsyncClient(timeout=self.REQUEST_TIMEOUT)
+        self.async_client = http_transport.client(timeout=self.REQUEST_TIMEOUT)
         
     async def recognize_audio(self, audio_data: bytes, filename: str) -> Optional[Dict[str, Any]]:
         """Recognize a song from audio data using httpx."""
@@ -69,5 +71,9 @@ class ZylaShazamClient:
             logger.exception(f"Unexpected error recognizing audio with Shazam: {str(e)}")
             raise RecognitionAPIError(f"Unexpected error recognizing audio: {str(e)}")
 
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.async_client.aclose()
+
 # Create a global instance
-zyla_shazam_client = ZylaShazamClient() 
\ No newline at end of file
+zyla_shazam_client = services.register("shazam", ZylaShazamClient)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Server-side cursors over ranked similar-track lists.
+
+When a search finishes, its whole ranked candidate list is stored under a random
+cursor id in the shared persistent cache. Cursor tokens are "<id>:<offset>", so
+serving a page is one cache read, and retrying a page is safe. When a client gets
+close to the end of what has been fetched, the next Jamendo page is fetched in
+the background and appended (de-duplicated) to the list.
+"""
+import asyncio
+import secrets
+from typing import Dict, List, Optional, Any, Tuple
+from ...core.cache import PersistentTTLCache
+from ...core.logging import logger
+from ..metadata.jamendo import jamendo_service, JamendoService
+
+class InvalidCursorError(ValueError):
+    """Raised for cursor tokens that are not of the form '<id>:<offset>'."""
+
+class SimilarTracksCursors:
+    """Creates cursors for ranked similar-track lists and serves pages from them."""
+
+    TTL = 30 * 60 # Long enough to browse results; ranked lists are cheap to rebuild
+    PREFETCH_SIZE = 50 # Candidates per Jamendo sub-query fetched by each background prefetch
+    PREFETCH_AHEAD_PAGES = 2 # Prefetch once fewer than this many pages remain
+
+    def __init__(self, jamendo: JamendoService = jamendo_service, store: Optional[PersistentTTLCache] = None):
+        self.jamendo = jamendo
+        self.store = store or PersistentTTLCache("similar_tracks_cursor", ttl=self.TTL)
+        self._prefetching: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _encode(cursor_id: str, offset: int) -> str:
+        return f"{cursor_id}:{offset}"
+
+    @staticmethod
+    def _decode(token: str) -> Tuple[str, int]:
+        cursor_id, _, offset = (token or "").partition(":")
+        if not cursor_id or not offset.isdigit():
+            raise InvalidCursorError(f"Malformed cursor: {token!r}")
+        return cursor_id, int(offset)
+
+    async def create(self, keywords: List[str], ranked_tracks: List[Dict[str, Any]], served: int, fetched: int) -> Optional[str]:
+        """
+        Store a ranked track list of which the first `served` tracks have been returned,
+        and return the cursor for the next page (None if there are no keywords to extend it).
+        `fetched` is how many candidates per Jamendo sub-query the list was built from;
+        prefetching continues from there.
+        """
+        if not keywords:
+            return None
+        cursor_id = secrets.token_urlsafe(12)
+        await self.store.set_async(cursor_id, {
+            "keywords": keywords,
+            "tracks": ranked_tracks,
+            "next_offset": fetched, # Jamendo offset of the next prefetch
+            "exhausted": False,
+        })
+        return self._encode(cursor_id, served)
+
+    async def page(self, token: str, limit: int = 10) -> Optional[Dict[str, Any]]:
+        """
+        Return {"similar_tracks", "next_cursor"} for a cursor token, or None if the
+        cursor is unknown or has expired. Raises InvalidCursorError for malformed tokens.
+        """
+        cursor_id, offset = self._decode(token)
+        state = await self.store.get_async(cursor_id)
+        if state is None:
+            return None
+
+        if offset + limit > len(state["tracks"]) and not state["exhausted"]:
+            # The client got ahead of the background prefetch; wait for it this once
+            await self._prefetch(cursor_id)
+            state = await self.store.get_async(cursor_id) or state
+
+        tracks = state["tracks"][offset:offset + limit]
+        next_offset = offset + len(tracks)
+        remaining = len(state["tracks"]) - next_offset
+        if not state["exhausted"] and remaining < limit * self.PREFETCH_AHEAD_PAGES:
+            self._schedule_prefetch(cursor_id)
+
+        # Until an empty page has actually been fetched there may be more, even if this one came back empty
+        has_more = remaining > 0 or not state["exhausted"]
+        return {
+            "similar_tracks": tracks,
+            "next_cursor": self._encode(cursor_id, next_offset) if has_more else None,
+        }
+
+    def _schedule_prefetch(self, cursor_id: str) -> asyncio.Task:
+        """Start extending a cursor in the background, unless that is already running (one at a time per cursor)."""
+        task = self._prefetching.get(cursor_id)
+        if task is None:
+            # Held in _prefetching until done, so the task cannot be garbage collected mid-flight
+            task = asyncio.ensure_future(self._extend(cursor_id))
+            self._prefetching[cursor_id] = task
+            task.add_done_callback(lambda _: self._prefetching.pop(cursor_id, None))
+        return task
+
+    async def _prefetch(self, cursor_id: str) -> None:
+        """Fetch the next Jamendo page for a cursor and append its new tracks."""
+        await asyncio.shield(self._schedule_prefetch(cursor_id))
+
+    async def _extend(self, cursor_id: str) -> None:
+        state = await self.store.get_async(cursor_id)
+        if state is None or state["exhausted"]:
+            return
+        try:
+            fetched = await self.jamendo.fetch_ranked_page(state["keywords"], offset=state["next_offset"], page_size=self.PREFETCH_SIZE)
+        except Exception as e:
+            logger.error(f"Prefetching similar tracks for cursor {cursor_id} failed: {e}")
+            return
+        if fetched is None:
+            # A failed request is not the end of the results; the next page request retries it
+            logger.warning(f"Prefetching similar tracks for cursor {cursor_id} got no page from Jamendo")
+            return
+
+        known_ids = {track["id"] for track in state["tracks"]}
+        new_tracks = [track for track in fetched if track["id"] not in known_ids]
+        state["tracks"].extend(new_tracks)
+        state["next_offset"] += self.PREFETCH_SIZE
+        state["exhausted"] = not fetched
+        await self.store.set_async(cursor_id, state)
+        logger.info(f"Prefetched {len(new_tracks)} more similar tracks for cursor {cursor_id}")
+
+# Create a global instance
+similar_tracks_cursors = SimilarTracksCursors()
@@ -0,0 +1,78 @@
+"""
+Tag-similarity ranking for candidate tracks.
+
+Query keywords and each candidate's tags are embedded as sparse TF-IDF vectors
+over a shared tag vocabulary; all candidates are scored against the query with
+one sparse matrix-vector product (cosine similarity) and re-ranked by score.
+"""
+import math
+from typing import Dict, List, Any, Iterable
+import numpy as np
+from scipy import sparse
+from ..metadata.jamendo_catalog import query_terms
+
+class TagSimilarityRanker:
+    """Scores and re-ranks tracks by cosine similarity between keyword and tag TF-IDF vectors."""
+
+    SCORE_DECIMALS = 4
+
+    @staticmethod
+    def _terms(tags: Iterable[str]) -> List[str]:
+        # Same term expansion as the catalog index: "hip hop" -> "hiphop", "hip", "hop"
+        return query_terms(tags)
+
+    def score(self, keywords: List[str], candidates: List[Dict[str, Any]]) -> np.ndarray:
+        """Return the cosine similarity (0..1) of each candidate's tags to the keywords."""
+        if not candidates:
+            return np.zeros(0, dtype=np.float32)
+        query = self._terms(keywords)
+        docs = [self._terms(track.get("tags") or []) for track in candidates]
+
+        vocabulary: Dict[str, int] = {}
+        rows, cols = [], []
+        for row, terms in enumerate(docs):
+            for term in terms:
+                rows.append(row)
+                cols.append(vocabulary.setdefault(term, len(vocabulary)))
+        if not any(term in vocabulary for term in query):
+            return np.zeros(len(candidates), dtype=np.float32)
+        # Keywords no candidate has still weigh on the query norm (df = 0, the maximal IDF),
+        # so a track matching only some of them scores below 1
+        query_cols = [vocabulary.setdefault(term, len(vocabulary)) for term in query]
+
+        n_docs = len(docs)
+        tf = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(n_docs, len(vocabulary))
+        )
+        # Smoothed IDF over the candidate pool: tags every candidate shares carry less signal
+        df = np.bincount(cols, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+
+        doc_vectors = tf.multiply(idf).tocsr()
+        doc_norms = np.sqrt(np.asarray(doc_vectors.multiply(doc_vectors).sum(axis=1)).ravel())
+        query_vector = np.zeros(len(vocabulary), dtype=np.float32)
+        query_vector[query_cols] = idf[query_cols]
+        query_norm = math.sqrt(float(query_vector @ query_vector))
+
+        dots = doc_vectors @ query_vector
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.where(doc_norms > 0, dots / (doc_norms * query_norm), 0.0)
+        return np.clip(scores, 0.0, 1.0).astype(np.float32)
+
+    def rank(self, keywords: List[str], candidates: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        """
+        Keep the `limit` candidates most similar to the keywords, best first, with
+        `similarity_score` filled in. Ties keep the candidates' original order.
+        """
+        scores = self.score(keywords, candidates)
+        order = np.argsort(-scores, kind="stable")[:limit]
+        ranked = []
+        for i in order:
+            track = dict(candidates[i])
+            track["similarity_score"] = round(float(scores[i]), self.SCORE_DECIMALS)
+            ranked.append(track)
+        return ranked
+
+# Create a global instance
+tag_similarity_ranker = TagSimilarityRanker()
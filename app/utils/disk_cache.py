@@ -0,0 +1,161 @@
+import fcntl
+import hashlib
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+class DiskLRUCache:
+    """
+    Directory of cached files with least-recently-used eviction by total byte size.
+
+    The directory is the index, so every worker process sharing it sees the same
+    entries: a lookup stats the file and bumps its mtime, and mtimes give the
+    recency order. Entries are written to a ".part" file unique to the writer and
+    only become visible when renamed into place, so readers never see a
+    half-written entry. The byte budget covers all workers together: commits add
+    their size to a running total kept in the directory under an exclusive file
+    lock, and once it passes the budget the committing worker rescans the
+    directory and deletes the least recently used files.
+    """
+
+    PART_SUFFIX = ".part"
+    STALE_PART_SECONDS = 60 * 60 # A .part file untouched this long was left behind by a crashed writer
+    LOCK_NAME = ".lock"
+    TOTAL_NAME = ".total"
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            self._evict()
+
+    @staticmethod
+    def file_name(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @property
+    def total_bytes(self) -> int:
+        """Bytes held by committed entries, across every worker sharing the directory."""
+        with self._locked():
+            total = self._read_total()
+            return total if total is not None else self._evict()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, self.file_name(key))
+
+    def partial_path(self, key: str) -> str:
+        """A fresh path to write an entry to before committing it (unique per writer)."""
+        return f"{self.path_for(key)}.{os.getpid()}-{uuid.uuid4().hex[:12]}{self.PART_SUFFIX}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the path of a committed entry (marking it recently used), or None."""
+        path = self.path_for(key)
+        try:
+            self._touch(path)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            pass # Read-only mount; still a hit
+        return path
+
+    def commit(self, key: str, source_path: str) -> str:
+        """Publish a fully written entry (e.g. from partial_path) and evict if over budget."""
+        path = self.path_for(key)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(source_path, path)
+        self._touch(path) # Most recently used, however long the write took
+        size = os.path.getsize(path)
+        with self._locked():
+            total = self._read_total()
+            if total is None or total + size - replaced > self.max_bytes:
+                self._evict()
+            else:
+                self._write_total(total + size - replaced)
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """Write and commit an entry in one step."""
+        part_path = self.partial_path(key)
+        try:
+            with open(part_path, "wb") as f:
+                f.write(data)
+            return self.commit(key, part_path)
+        except BaseException:
+            self.discard_partial(part_path)
+            raise
+
+    def discard_partial(self, part_path: str) -> None:
+        self._unlink(part_path)
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # An explicit time: the kernel's own file timestamps are too coarse to order quick successive uses
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        # flock locks belong to the open file, so this also excludes other threads of this process
+        with open(os.path.join(self.directory, self.LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_total(self) -> Optional[int]:
+        try:
+            with open(os.path.join(self.directory, self.TOTAL_NAME)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_total(self, total: int) -> None:
+        with open(os.path.join(self.directory, self.TOTAL_NAME), "w") as f:
+            f.write(str(total))
+
+    def _scan(self) -> Tuple[List[Tuple[int, str, int]], int]:
+        """Committed entries as (mtime_ns, name, size), oldest first, and their total size. Removes stale .part files."""
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(self.PART_SUFFIX):
+                # Other workers may still be writing theirs, so only old ones are removed
+                if now - stat.st_mtime > self.STALE_PART_SECONDS:
+                    self._unlink(entry.path)
+                continue
+            entries.append((stat.st_mtime_ns, entry.name, stat.st_size))
+            total += stat.st_size
+        entries.sort()
+        return entries, total
+
+    def _evict(self) -> int:
+        """Rescan, delete least recently used entries until within budget, and record the total (lock held)."""
+        entries, total = self._scan()
+        for _, name, size in entries[:-1]: # The newest entry is always kept
+            if total <= self.max_bytes:
+                break
+            self._unlink(os.path.join(self.directory, name))
+            total -= size
+        self._write_total(total)
+        return total
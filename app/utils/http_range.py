@@ -0,0 +1,101 @@
+import os
+import re
+from typing import Mapping, Optional, Tuple
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 64 * 1024
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range lies outside the resource."""
+
+def parse_range(header: Optional[str], size: Optional[int]) -> Optional[Tuple[int, Optional[int]]]:
+    """
+    Parse a single-range "Range: bytes=..." header into an inclusive (start, end).
+    Returns None when the whole resource should be sent (no header, or a form we do
+    not support such as multiple ranges). `end` is None for an open range of a
+    resource whose size is not known yet.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.group(1), match.group(2)
+    if first == "": # Suffix range: the last N bytes
+        if size is None:
+            return None
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else None
+    if size is not None:
+        if start >= size:
+            raise RangeNotSatisfiable()
+        end = size - 1 if end is None else min(end, size - 1)
+    if end is not None and end < start:
+        raise RangeNotSatisfiable()
+    return start, end
+
+def range_headers(start: int, end: int, size: Optional[int]) -> dict:
+    return {
+        "Content-Range": f"bytes {start}-{end}/{size if size is not None else '*'}",
+        "Content-Length": str(end - start + 1),
+    }
+
+class RangeFileResponse(Response):
+    """
+    Serve a file (or a byte range of it) honouring the Range header.
+
+    When the ASGI server supports the zero-copy send extension the kernel copies the
+    bytes straight from the page cache to the socket (sendfile); otherwise the file
+    is read in chunks in a worker thread.
+    """
+
+    def __init__(self, path: str, request_headers: Mapping[str, str], media_type: str, headers: Optional[dict] = None):
+        super().__init__(content=None, media_type=media_type, headers=headers)
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        self.headers["Accept-Ranges"] = "bytes"
+        try:
+            byte_range = parse_range(request_headers.get("range"), self.file_size)
+        except RangeNotSatisfiable:
+            self.status_code = 416
+            self.headers["Content-Range"] = f"bytes */{self.file_size}"
+            self.headers["Content-Length"] = "0"
+            self.start, self.count = 0, 0
+            return
+        if byte_range is None:
+            self.start, self.count = 0, self.file_size
+            self.headers["Content-Length"] = str(self.file_size)
+        else:
+            start, end = byte_range
+            self.status_code = 206
+            self.start, self.count = start, end - start + 1
+            self.headers.update(range_headers(start, end, self.file_size))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.start, "count": self.count})
+                return
+            offset, remaining = self.start, self.count
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, f.fileno(), min(CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0: # File shrank underneath us; end the body cleanly
+                await send({"type": "http.response.body", "body": b""})
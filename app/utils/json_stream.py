@@ -0,0 +1,65 @@
+import json
+from typing import Any, Optional
+
+class StreamingFieldParser:
+    """
+    Picks one top-level field out of a JSON object while the object is still being
+    streamed, so a caller can act on it before the rest of the document arrives.
+    Only array and object values are recognised; the text is scanned once overall.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.value: Any = None
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None # Last complete string at the top level
+        self._at_field = False # Just read `"field":`
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        """Consume the next piece of text; returns the field's value once, when it is complete."""
+        if self.done:
+            return None
+        self._text += chunk
+        text = self._text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._last_key = text[self._string_start:self._pos + 1]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif self._depth == 1 and self._value_start is None and char == ":":
+                self._at_field = self._last_key is not None and json.loads(self._last_key) == self.field
+                self._last_key = None
+            elif self._depth == 1 and self._value_start is None and char == ",":
+                self._at_field = False
+                self._last_key = None
+            elif char in "[{":
+                if self._depth == 1 and self._at_field:
+                    self._value_start = self._pos
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._value_start is not None and self._depth == 1:
+                    self.done = True
+                    try:
+                        self.value = json.loads(text[self._value_start:self._pos + 1])
+                    except json.JSONDecodeError:
+                        return None
+                    return self.value
+            self._pos += 1
+        return None
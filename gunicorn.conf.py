@@ -1,4 +1,6 @@
 import multiprocessing
+import os
+import shutil
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -11,6 +13,14 @@ worker_connections = 1000
 timeout = 30
 keepalive = 2
 
+# Metrics: workers share their values through this directory (see app/core/metrics.py)
+os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(os.getenv("CACHE_DIR", "/tmp/soundmatch/cache"), "metrics"))
+
+def on_starting(server):
+    # Values left by a previous run must not be added to this one's
+    shutil.rmtree(os.environ["METRICS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["METRICS_MULTIPROC_DIR"], exist_ok=True)
+
 # Logging
 accesslog = "-"
 errorlog = "-"
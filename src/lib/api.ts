@@ -4,6 +4,11 @@ const API_BASE_URL = import.meta.env.VITE_API_URL || 'https://soundmatch-audio-f
 
 console.log('API Base URL:', API_BASE_URL); // Debug log
 
+// The API hands out host-relative URLs for its own endpoints (e.g. preview_url) unless
+// PUBLIC_BASE_URL is set server-side; resolve them against the API's origin
+export const resolveApiUrl = (url: string): string =>
+  new URL(url, new URL(API_BASE_URL, window.location.origin)).href;
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   headers: {
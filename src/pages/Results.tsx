@@ -7,6 +7,7 @@ import { filterOptions, applyFilters } from '@/lib/music-utils';
 import { ArrowUp, Filter, Music, Download, Play, Pause } from 'lucide-react';
 import { SearchResultProps } from '@/components/SearchResult';
 import { toast } from 'react-hot-toast';
+import { resolveApiUrl } from '@/lib/api';
 
 // Interface for props passed to AnalyzingDisplay
 interface AnalyzingDisplayProps {
@@ -84,12 +85,14 @@ interface Track {
   artist: string;
   duration: string;
   audio_url: string;
+  preview_url?: string; // Cached, range-capable proxy for audio_url
   download_url: string;
   license: string;
   tags: string[];
   mood: string;
   similarity: number;
   image_url?: string;
+  thumbnail_url?: string; // Resized, cached proxy for image_url
 }
 
 interface ResultsData {
@@ -435,7 +438,7 @@ const Results: React.FC = () => {
                   >
                     {track.image_url && (
                         <img 
-                            src={track.image_url} 
+                            src={track.thumbnail_url ? resolveApiUrl(track.thumbnail_url) : track.image_url} 
                             alt={`${track.title} artwork`} 
                             className="w-16 h-16 rounded-md object-cover flex-shrink-0 shadow-sm"
                         />
@@ -461,7 +464,7 @@ const Results: React.FC = () => {
                         </div>
                         <div className="flex flex-col md:flex-row items-center space-y-2 md:space-y-0 md:space-x-2 mt-2 md:mt-0"> {/* Container for controls */} 
                           <button
-                            onClick={() => handlePlay(track.id, track.audio_url)}
+                            onClick={() => handlePlay(track.id, track.preview_url ? resolveApiUrl(track.preview_url) : track.audio_url)}
                             className="p-2 rounded-full text-gray-600 hover:bg-gray-200 hover:text-gray-900 transition-colors"
                             title={playingTrack === track.id ? "Pause" : "Play"}
                           >
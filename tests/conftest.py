@@ -0,0 +1,46 @@
+import asyncio
+import inspect
+from typing import Any, Callable, List, Optional
+import httpx
+import pytest
+
+class FakeAPI:
+    """
+    Stand-in for a provider's HTTP API. Records every request and answers it with
+    `respond(request)` (plain or async); `delay` holds each response so concurrent
+    callers overlap, and setting `status_code` answers everything with that bare
+    status instead. client() builds an AsyncClient on it for a service's async_client.
+    """
+
+    def __init__(self, respond: Callable[[httpx.Request], Any], delay: float = 0.0):
+        self.respond = respond
+        self.delay = delay
+        self.status_code: Optional[int] = None
+        self.requests: List[httpx.Request] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.status_code is not None:
+                return httpx.Response(self.status_code)
+            response = self.respond(request)
+            return await response if inspect.isawaitable(response) else response
+        finally:
+            self.in_flight -= 1
+
+    @property
+    def params(self) -> List[httpx.QueryParams]:
+        return [request.url.params for request in self.requests]
+
+    def client(self, **kwargs: Any) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self), **kwargs)
+
+@pytest.fixture
+def fake_api() -> Callable[..., FakeAPI]:
+    """Builds FakeAPI instances: fake_api(respond, delay=0.0)."""
+    return FakeAPI
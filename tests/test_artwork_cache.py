@@ -0,0 +1,92 @@
+import asyncio
+import io
+import httpx
+import pytest
+from PIL import Image
+from fastapi import FastAPI, Request
+from app.core.cache import PersistentTTLCache
+from app.services.media.artwork import ArtworkService, ArtworkRejected, artwork_url
+from app.utils.disk_cache import DiskLRUCache
+
+SOURCE_URL = "https://i.discogs.com/abc/cover.png"
+
+def make_png(width=1200, height=900) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGBA", (width, height), (200, 40, 90, 255)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def make_app(tmp_path, source=None):
+    source = source or make_png()
+    downloads = []
+
+    async def fake_image_host(request: httpx.Request) -> httpx.Response:
+        downloads.append(str(request.url))
+        return httpx.Response(200, content=source, headers={"Content-Type": "image/png"})
+
+    artwork = ArtworkService(
+        DiskLRUCache(str(tmp_path / "artwork"), max_bytes=10 * 1024 * 1024),
+        PersistentTTLCache("artwork_url", ttl=60, db_path=str(tmp_path / "cache.sqlite3"))
+    )
+    artwork.async_client = httpx.AsyncClient(transport=httpx.MockTransport(fake_image_host))
+    app = FastAPI()
+
+    @app.get("/artwork")
+    async def get_artwork(request: Request, url: str, size: int = 150):
+        return await artwork.response_for(url, size, request.headers)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    return client, downloads
+
+def test_fetches_once_and_serves_every_size(tmp_path):
+    client, downloads = make_app(tmp_path)
+
+    async def run():
+        responses = await asyncio.gather(*(client.get("/artwork", params={"url": SOURCE_URL, "size": size}) for size in (64, 150, 300, 150)))
+        again = await client.get("/artwork", params={"url": SOURCE_URL, "size": 64}, headers={"If-None-Match": responses[0].headers["etag"]})
+        return responses, again
+
+    responses, again = asyncio.run(run())
+    assert downloads == [SOURCE_URL]
+    for response, size in zip(responses, (64, 150, 300, 150)):
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        assert "immutable" in response.headers["cache-control"]
+        assert max(Image.open(io.BytesIO(response.content)).size) == size
+    assert again.status_code == 304
+
+def test_small_source_is_not_upscaled(tmp_path):
+    client, _ = make_app(tmp_path, source=make_png(100, 50))
+    response = asyncio.run(client.get("/artwork", params={"url": SOURCE_URL, "size": 300}))
+    assert Image.open(io.BytesIO(response.content)).size == (100, 50)
+
+def test_rejects_other_hosts_and_sizes(tmp_path):
+    artwork = ArtworkService(
+        DiskLRUCache(str(tmp_path / "artwork"), max_bytes=1024),
+        PersistentTTLCache("artwork_url", ttl=60, db_path=str(tmp_path / "cache.sqlite3"))
+    )
+    for url, size in [("https://evil.example.com/a.png", 150), ("http://i.discogs.com/a.png", 150),
+                      ("https://discogs.com.evil.example/a.png", 150), (SOURCE_URL, 123)]:
+        with pytest.raises(ArtworkRejected):
+            asyncio.run(artwork.get_thumbnail(url, size))
+    assert artwork_url("") is None
+    assert artwork_url("https://usercontent.jamendo.com/?type=album&id=1").startswith("/api/v1/music/artwork?url=https%3A")
+
+def test_oversized_source_is_not_read_to_the_end(tmp_path):
+    sent = []
+
+    async def endless_image_host(request: httpx.Request) -> httpx.Response:
+        async def body():
+            for _ in range(1000):
+                sent.append(64 * 1024)
+                yield b"\0" * (64 * 1024)
+
+        return httpx.Response(200, content=body()) # Streamed, so no Content-Length to reject up front
+
+    artwork = ArtworkService(
+        DiskLRUCache(str(tmp_path / "artwork"), max_bytes=1024 * 1024),
+        PersistentTTLCache("artwork_url", ttl=60, db_path=str(tmp_path / "cache.sqlite3"))
+    )
+    artwork.MAX_SOURCE_BYTES = 256 * 1024
+    artwork.async_client = httpx.AsyncClient(transport=httpx.MockTransport(endless_image_host))
+    assert asyncio.run(artwork.get_thumbnail(SOURCE_URL, 150)) is None
+    assert sum(sent) <= artwork.MAX_SOURCE_BYTES + 64 * 1024
@@ -0,0 +1,99 @@
+import asyncio
+import wave
+import httpx
+import numpy as np
+from app.services.audio.extractor import AudioFeatureExtractor, SAMPLE_RATE, decode_audio
+from app.services.audio.matcher import AudioSimilarityIndex, NumpyIVFIndex, build_from_catalog
+from app.services.metadata.jamendo_catalog import JamendoCatalogStore
+
+def write_wav(path, samples, sample_rate=44100, channels=1):
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    if channels == 2:
+        pcm = np.repeat(pcm, 2)
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return str(path)
+
+def tone(freqs, seconds=6.0, sample_rate=SAMPLE_RATE, bpm=None, noise=0.0, seed=0):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = sum(np.sin(2 * np.pi * f * t) for f in freqs) / len(freqs)
+    if bpm:
+        # Short decaying bursts of noise on every beat
+        beat = (t % (60 / bpm)) < 0.03
+        signal = 0.5 * signal + beat * np.random.default_rng(seed).normal(0, 0.8, t.size)
+    if noise:
+        signal = signal + np.random.default_rng(seed + 1).normal(0, noise, t.size)
+    return (0.5 * signal).astype(np.float32)
+
+def test_wav_decoding_downmixes_and_resamples(tmp_path):
+    path = write_wav(tmp_path / "stereo.wav", tone([440], seconds=1.0, sample_rate=44100), sample_rate=44100, channels=2)
+    samples = decode_audio(path)
+    assert abs(samples.size - SAMPLE_RATE) <= 1
+
+def test_tempo_and_key_estimates():
+    features = AudioFeatureExtractor().extract(tone([261.63, 329.63, 392.0], bpm=120))
+    assert abs(features["bpm"] - 120) < 4
+    assert features["key"] == "C"
+
+def test_index_returns_nearest_tracks_and_round_trips(tmp_path):
+    extractor = AudioFeatureExtractor()
+    catalog = {
+        "a": tone([110, 220], bpm=90),
+        "b": tone([440, 554.37, 659.25], bpm=128),
+        "c": tone([1760, 2217], bpm=170),
+        "d": tone([293.66, 349.23, 440], bpm=75),
+    }
+    entries = [({"id": track_id, "title": track_id}, extractor.extract(samples)) for track_id, samples in catalog.items()]
+    index = AudioSimilarityIndex(str(tmp_path / "audio_index.npz"), extractor=extractor)
+    index.build(entries)
+    index.save()
+
+    reloaded = AudioSimilarityIndex(index.index_path, extractor=extractor)
+    assert reloaded.ensure_loaded()
+    query = write_wav(tmp_path / "query.wav", tone([440, 554.37, 659.25], bpm=128, noise=0.02, seed=7))
+    result = reloaded.search_file(query, k=2)
+
+    assert [t["id"] for t in result["similar_tracks"]][0] == "b"
+    assert result["similar_tracks"][0]["similarity_score"] > result["similar_tracks"][1]["similarity_score"]
+    assert abs(result["features"]["bpm"] - 128) < 4
+
+def test_numpy_ivf_finds_exact_neighbours():
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ivf = NumpyIVFIndex(nlist=44, nprobe=8)
+    ivf.build(vectors)
+    hits = [ivf.search(vectors[i], k=1)[1][0] for i in range(0, 2000, 97)]
+    assert hits == list(range(0, 2000, 97))
+
+def test_build_from_catalog_uses_a_bounded_worker_pool(tmp_path):
+    store = JamendoCatalogStore(str(tmp_path / "catalog.sqlite3"))
+    store.upsert_tracks([
+        {"id": str(i), "name": f"Track {i}", "artist_name": "Artist", "duration": 6, "audio": f"https://cdn.example.com/{i}.wav"}
+        for i in range(6)
+    ])
+    previews = {str(i): write_wav(tmp_path / f"{i}.wav", tone([110 * (i + 1)], seconds=2.0)) for i in range(6)}
+    active, peak = 0, 0
+
+    async def fake_cdn(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        track_id = request.url.path.strip("/").split(".")[0]
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if track_id == "3":
+            return httpx.Response(404)
+        with open(previews[track_id], "rb") as f:
+            return httpx.Response(200, content=f.read())
+
+    index = AudioSimilarityIndex(str(tmp_path / "audio_index.npz"))
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake_cdn))
+    indexed = asyncio.run(build_from_catalog(store, index, client=client, concurrency=2, limit=5))
+
+    assert indexed == 4 # Tracks 0-4, less the one whose preview is missing
+    assert peak <= 2
+    assert sorted(t["id"] for t in index.tracks) == ["0", "1", "2", "4"]
@@ -0,0 +1,56 @@
+import asyncio
+import os
+from app.services.metadata.discogs_dump import DiscogsDumpIndex, import_dump, make_key
+from app.services.metadata.discogs_service import DiscogsService
+from app.services.media.artwork import artwork_url
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def build_index(tmp_path) -> DiscogsDumpIndex:
+    index = DiscogsDumpIndex(str(tmp_path / "discogs_index.sqlite3"))
+    # Releases first, so the masters import has to take precedence on its own
+    import_dump(os.path.join(FIXTURES, "discogs_releases_sample.xml"), index, batch_size=2)
+    import_dump(os.path.join(FIXTURES, "discogs_masters_sample.xml"), index, batch_size=2)
+    return index
+
+def test_key_normalization():
+    """Keys should ignore case, accents, leading 'The', Discogs numbering and bracketed suffixes."""
+    assert make_key("Queen (2)", "Bohemian Rhapsody (Remastered 2011)") == make_key("queen", "Bohemian Rhapsody")
+    assert make_key("Sigur Rós", "Hoppípolla") == make_key("sigur ros", "hoppipolla")
+    assert make_key("The Cure", "Lovesong") == make_key("Cure", "lovesong")
+
+def test_master_entries_win_over_releases(tmp_path):
+    index = build_index(tmp_path)
+    data = index.lookup(artist="Depeche Mode", title="Some Great Reward")
+    assert data == {
+        "discogs_id": 18500,
+        "styles": ["Synth-pop", "New Wave"],
+        "year": 1984,
+        "genres": ["Electronic"],
+        "image_url": "https://i.discogs.com/master-18500.jpg",
+        "thumbnail_url": artwork_url("https://i.discogs.com/master-18500.jpg"),
+    }
+
+def test_track_titles_resolve_to_main_release(tmp_path):
+    index = build_index(tmp_path)
+    data = index.lookup(artist="Depeche Mode", title="Master and Servant")
+    assert data["discogs_id"] == 18500
+    assert data["year"] == 1984
+    assert data["styles"] == ["Synth-pop"]
+    # Tracks that only appear on non-main releases are not indexed
+    assert index.lookup(artist="Depeche Mode", title="Lie To Me") is None
+
+def test_lookup_with_featured_artist_and_missing_fields(tmp_path):
+    index = build_index(tmp_path)
+    assert index.lookup(artist="Prince feat. The Revolution", title="Kiss")["styles"] == ["Funk"]
+    queen = index.lookup(artist="Queen", title="Bohemian Rhapsody")
+    assert queen == {"discogs_id": 40000, "genres": ["Rock"]}
+
+def test_service_answers_from_index_without_api(tmp_path):
+    """DiscogsService should answer from the index even when the API is not configured."""
+    service = DiscogsService(dump_index=build_index(tmp_path))
+    service.async_client = None
+    data = asyncio.run(service.get_release_data(artist="Sigur Ros", title="Med Blodnasir"))
+    assert data["discogs_id"] == 900001
+    assert data["styles"] == ["Post Rock"]
+    assert data["year"] == 2005
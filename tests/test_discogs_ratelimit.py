@@ -0,0 +1,45 @@
+from app.services.metadata.discogs_ratelimit import DiscogsRateLimiter
+
+def test_no_delay_while_quota_is_plentiful(tmp_path):
+    """Requests should go out immediately when Discogs reports plenty of quota."""
+    limiter = DiscogsRateLimiter(db_path=str(tmp_path / "ratelimit.sqlite3"))
+    limiter.record_response({"X-Discogs-Ratelimit": "60", "X-Discogs-Ratelimit-Remaining": "55"}, 200)
+
+    delays = [limiter.reserve() for _ in range(10)]
+    assert all(delay == 0 for delay in delays)
+
+def test_backs_off_near_the_limit(tmp_path):
+    """Once quota is nearly used up, consecutive requests should be spaced out."""
+    limiter = DiscogsRateLimiter(db_path=str(tmp_path / "ratelimit.sqlite3"))
+    limiter.record_response({"X-Discogs-Ratelimit": "60", "X-Discogs-Ratelimit-Used": "58"}, 200)
+
+    first = limiter.reserve()
+    second = limiter.reserve()
+    assert first == 0
+    assert second > 0
+
+def test_retry_after_blocks_requests(tmp_path):
+    """A 429 should pause all requests for at least Retry-After seconds."""
+    limiter = DiscogsRateLimiter(db_path=str(tmp_path / "ratelimit.sqlite3"))
+    limiter.record_response({"X-Discogs-Ratelimit": "60", "Retry-After": "5"}, 429)
+
+    assert 4 < limiter.reserve() <= 5
+
+def test_wait_beyond_max_wait_reserves_nothing(tmp_path):
+    """A reservation that would wait too long is refused and leaves the queue untouched."""
+    limiter = DiscogsRateLimiter(db_path=str(tmp_path / "ratelimit.sqlite3"))
+    limiter.record_response({"X-Discogs-Ratelimit": "60", "X-Discogs-Ratelimit-Used": "58"}, 200)
+    assert limiter.reserve() == 0
+
+    assert limiter.reserve(max_wait=0.1) is None
+    assert limiter.reserve(max_wait=0.1) is None
+    assert 0 < limiter.reserve() <= 2 # Still the second slot in line
+
+def test_state_is_shared_between_instances(tmp_path):
+    """Separate limiter instances (one per worker) should see the same quota."""
+    db_path = str(tmp_path / "ratelimit.sqlite3")
+    worker_a = DiscogsRateLimiter(db_path=db_path)
+    worker_b = DiscogsRateLimiter(db_path=db_path)
+
+    worker_a.record_response({"Retry-After": "3"}, 429)
+    assert worker_b.reserve() > 2
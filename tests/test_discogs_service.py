@@ -0,0 +1,74 @@
+import asyncio
+import httpx
+from app.services.metadata.discogs_dump import DiscogsDumpIndex
+from app.services.metadata.discogs_ratelimit import DiscogsRateLimiter
+from app.services.metadata.discogs_service import DiscogsService
+
+MASTER = {"id": 18500, "year": 1984, "styles": ["Synth-pop"], "genres": ["Electronic"],
+          "images": [{"uri": "https://i.discogs.com/master-18500.jpg"}]}
+
+class DiscogsResponses:
+    """Answers the Discogs search and masters endpoints; the first `rate_limited_first` master fetches get a 429."""
+
+    def __init__(self, rate_limited_first=0):
+        self.rate_limited_first = rate_limited_first
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        headers = {"X-Discogs-Ratelimit": "60", "X-Discogs-Ratelimit-Remaining": "50"}
+        if request.url.path == "/database/search":
+            return httpx.Response(200, headers=headers, json={"results": [{"id": 18500, "type": request.url.params["type"]}]})
+        if self.rate_limited_first:
+            self.rate_limited_first -= 1
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, headers=headers, json=MASTER)
+
+def paths(api):
+    return [(request.url.path, request.url.params.get("type")) for request in api.requests]
+
+def make_service(api, tmp_path) -> DiscogsService:
+    service = DiscogsService(
+        limiter=DiscogsRateLimiter(db_path=str(tmp_path / "ratelimit.sqlite3")),
+        dump_index=DiscogsDumpIndex(str(tmp_path / "missing.sqlite3"))
+    )
+    service.async_client = api.client(base_url=service.BASE_URL)
+    return service
+
+def test_master_and_release_searches_run_concurrently(tmp_path, fake_api):
+    api = fake_api(DiscogsResponses(), delay=0.01)
+    data = asyncio.run(make_service(api, tmp_path).get_release_data(artist="Depeche Mode", title="Master and Servant"))
+    assert api.max_in_flight == 2
+    assert sorted(paths(api)[:2]) == [("/database/search", "master"), ("/database/search", "release")]
+    assert paths(api)[2] == ("/masters/18500", None)
+    assert data["styles"] == ["Synth-pop"]
+    assert data["year"] == 1984
+    assert data["thumbnail_url"].startswith("/api/v1/music/artwork?")
+
+def test_rate_limited_request_is_retried(tmp_path, fake_api):
+    api = fake_api(DiscogsResponses(rate_limited_first=1))
+    data = asyncio.run(make_service(api, tmp_path).get_release_data(artist="Depeche Mode", title="Master and Servant"))
+    assert [path for path, _ in paths(api)].count("/masters/18500") == 2
+    assert data["discogs_id"] == 18500
+
+def test_long_rate_limit_waits_skip_discogs(tmp_path, fake_api):
+    api = fake_api(DiscogsResponses())
+    service = make_service(api, tmp_path)
+    service.limiter.record_response({"Retry-After": "60"}, 429)
+
+    async def scenario():
+        return await asyncio.wait_for(service.get_release_data(artist="Depeche Mode", title="Master and Servant"), 1.0)
+
+    assert asyncio.run(scenario()) is None
+    assert api.requests == []
+
+def test_release_details_are_cached(tmp_path, fake_api):
+    api = fake_api(DiscogsResponses())
+    service = make_service(api, tmp_path)
+
+    async def scenario():
+        first = await service.get_release_data(artist="Depeche Mode", title="Master and Servant")
+        second = await service.get_release_data(artist="Depeche Mode", title="Some Great Reward")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second
+    assert [path for path, _ in paths(api)].count("/masters/18500") == 1
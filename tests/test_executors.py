@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import pytest
+from app.core.exceptions import BulkheadFullError
+from app.core.executors import Bulkhead
+from app.core.metrics import metrics
+
+def test_bulkhead_fails_fast_when_saturated_and_recovers():
+    pool = Bulkhead("test-saturation", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: threading.current_thread().name))
+        await asyncio.sleep(0.05)
+        assert pool.stats()["active"] == 1
+        assert pool.stats()["queued"] == 1
+        with pytest.raises(BulkheadFullError):
+            await pool.run(lambda: None)
+
+        release.set()
+        assert await running is True
+        assert (await queued).startswith("bulkhead-test-saturation")
+        assert await pool.run(lambda x: x * 2, 21) == 42
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    stats = pool.stats()
+    assert (stats["active"], stats["queued"], stats["rejected"]) == (0, 0, 1)
+    assert 'bulkhead_wait_seconds_count{pool="test-saturation"} 3' in metrics.render()
+
+def test_cancelled_queued_call_frees_its_slot():
+    pool = Bulkhead("test-cancel", max_workers=1, max_queue=1)
+    release = threading.Event()
+    ran = []
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(ran.append, "queued"))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        await asyncio.sleep(0.01)
+        assert pool.stats()["queued"] == 0
+        replacement = asyncio.ensure_future(pool.run(ran.append, "replacement")) # Would be rejected if the slot leaked
+        release.set()
+        await running
+        await replacement
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert ran == ["replacement"]
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import pytest
+from app.core.cache import PersistentTTLCache
+from app.core.config import settings
+from app.core.exceptions import AIServiceError
+
+settings.GOOGLE_GEMINI_API_KEY = settings.GOOGLE_GEMINI_API_KEY or "test-key" # The module builds a global instance
+from app.services.ai.gemini_service import GeminiService
+from app.services.ai.semantic_cache import SemanticAnalysisCache
+
+ANALYSIS = {"keywords": ["Funk", "80s", "Falsetto"], "description": "Minimal 80s funk with a distinctive falsetto vocal."}
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel, replaying canned outputs."""
+
+    model_name = "models/fake"
+
+    def __init__(self, outputs, delay=0.0):
+        self.outputs = list(outputs)
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self.calls.append(generation_config)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        text = self.outputs.pop(0) if len(self.outputs) > 1 else self.outputs[0]
+        return FakeStream(text, self) if stream else FakeResponse(text)
+
+class FakeStream:
+    """Async iteration over a response in small chunks, logging how far it got."""
+
+    def __init__(self, text, model, chunk_size=16):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self.model = model
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self.chunks):
+            self.model.streamed = getattr(self.model, "streamed", "") + chunk
+            await asyncio.sleep(0)
+            last = i == len(self.chunks) - 1
+            yield FakeResponse(chunk, FakeUsage(400, 60) if last else None)
+
+def make_service(model, tmp_path, concurrency=8, semantic_threshold=2.0):
+    service = GeminiService()
+    service.model = model
+    service._semaphore = asyncio.Semaphore(concurrency)
+    service.analysis_cache = PersistentTTLCache("gemini_analysis", ttl=60, db_path=str(tmp_path / "cache.sqlite3"))
+    service.semantic_cache = SemanticAnalysisCache(semantic_threshold, max_entries=100) # Off by default
+    return service
+
+def test_uses_json_mode_and_parses_output(tmp_path):
+    model = FakeModel([json.dumps(ANALYSIS)])
+    result = asyncio.run(make_service(model, tmp_path).analyze_song_and_generate_keywords({"title": "Kiss", "artist": "Prince"}))
+    assert result == ANALYSIS
+    assert model.calls[0].response_mime_type == "application/json"
+
+def test_malformed_output_is_retried_once(tmp_path):
+    model = FakeModel(["{not json", json.dumps(ANALYSIS)])
+    assert asyncio.run(make_service(model, tmp_path).analyze_song_and_generate_keywords({"title": "Kiss"})) == ANALYSIS
+    assert len(model.calls) == 2
+
+    model = FakeModel([json.dumps({"description": "x"})])
+    with pytest.raises(AIServiceError):
+        asyncio.run(make_service(model, tmp_path).analyze_song_and_generate_keywords({"title": "Purple Rain"}))
+    assert len(model.calls) == GeminiService.MAX_ATTEMPTS
+
+def test_concurrency_is_bounded(tmp_path):
+    model = FakeModel([json.dumps(ANALYSIS)], delay=0.01)
+    service = make_service(model, tmp_path, concurrency=2)
+
+    async def run():
+        await asyncio.gather(*(service.analyze_song_and_generate_keywords({"title": str(i)}) for i in range(6)))
+
+    asyncio.run(run())
+    assert model.max_in_flight == 2
+
+def test_cache_is_shared_and_keyed_on_canonical_input(tmp_path):
+    model = FakeModel([json.dumps(ANALYSIS)])
+    first = make_service(model, tmp_path)
+    asyncio.run(first.analyze_song_and_generate_keywords(
+        {"title": "Kiss", "artist": "Prince", "discogs_styles": ["Funk", "Minimal"], "rating": 63, "updated_time": "2024-01-01"}
+    ))
+
+    # Another worker, same track with cosmetic differences and a changed rating
+    second = make_service(model, tmp_path)
+    result = asyncio.run(second.analyze_song_and_generate_keywords(
+        {"title": " kiss ", "artist": "PRINCE", "discogs_styles": ["Minimal", "Funk"], "rating": 70, "album": None}
+    ))
+    assert result == ANALYSIS
+    assert len(model.calls) == 1
+
+    assert second.analysis_cache_key({"title": "Kiss"}) != second.analysis_cache_key({"title": "Kiss", "discogs_year": 1986})
+    second.PROMPT_VERSION = "test-next"
+    asyncio.run(second.analyze_song_and_generate_keywords({"title": "Kiss", "artist": "Prince", "discogs_styles": ["Funk", "Minimal"]}))
+    assert len(model.calls) == 2
+
+    assert second.invalidate_analysis_cache() == 2
+    asyncio.run(first.analyze_song_and_generate_keywords({"title": "Kiss", "artist": "Prince", "discogs_styles": ["Funk", "Minimal"]}))
+    assert len(model.calls) == 3
+
+def test_near_duplicate_input_reuses_analysis(tmp_path):
+    model = FakeModel([json.dumps(ANALYSIS)])
+    service = make_service(model, tmp_path, semantic_threshold=0.9)
+    base = {"artist": "Prince", "genres": ["Funk"], "discogs_styles": ["Minimal", "Synth-pop"], "discogs_year": 1986, "instrumental": False}
+    asyncio.run(service.analyze_song_and_generate_keywords({**base, "title": "Kiss"}))
+
+    result = asyncio.run(service.analyze_song_and_generate_keywords({**base, "title": "Girls & Boys", "discogs_year": 1985}))
+    assert len(model.calls) == 1
+    # Only the keywords carry over; the description was written about "Kiss"
+    assert result == {"keywords": ANALYSIS["keywords"], "description": "", "source": "semantic"}
+
+    # A different artist in a different era is analysed afresh
+    asyncio.run(service.analyze_song_and_generate_keywords({**base, "title": "Other", "artist": "Someone Else", "discogs_year": 2012}))
+    assert len(model.calls) == 2
+
+def test_batch_shares_one_prompt_and_retries_only_failed_items(tmp_path):
+    tracks = [{"title": f"Song {i}", "artist": f"Artist {i}"} for i in range(3)]
+    first = [{"index": 0, **ANALYSIS}, {"index": 1, "description": "missing keywords"}, {"index": 2, **ANALYSIS}]
+    retry = [{"index": 0, "description": "Fixed.", "keywords": ["Rock"]}]
+    model = FakeModel([json.dumps(first), json.dumps(retry)])
+    model.prompts = []
+    generate = model.generate_content_async
+
+    async def recording(prompt, generation_config=None):
+        model.prompts.append(prompt)
+        return await generate(prompt, generation_config)
+
+    model.generate_content_async = recording
+    service = make_service(model, tmp_path)
+    results = asyncio.run(service.analyze_batch(tracks + [dict(tracks[0])]))
+
+    assert len(model.calls) == 2
+    assert model.prompts[0].count("Write \"keywords\" first") == 1 and "Song 2:" in model.prompts[0]
+    assert "Artist 1" in model.prompts[1] and "Artist 0" not in model.prompts[1]
+    assert results[1] == {"description": "Fixed.", "keywords": ["Rock"]}
+    assert results[0] == results[2] == results[3] == ANALYSIS
+    # Batched results land in the per-track cache
+    assert asyncio.run(service.analyze_song_and_generate_keywords(tracks[1]))["keywords"] == ["Rock"]
+    assert len(model.calls) == 2
+
+def test_keywords_are_emitted_before_the_description_finishes(tmp_path):
+    model = FakeModel([json.dumps(ANALYSIS)])
+    service = make_service(model, tmp_path)
+    seen = []
+    service_result = asyncio.run(service.analyze_song_and_generate_keywords(
+        {"title": "Kiss"}, on_keywords=lambda keywords: seen.append((keywords, model.streamed))
+    ))
+    assert service_result == ANALYSIS
+    keywords, streamed_so_far = seen[0]
+    assert keywords == ANALYSIS["keywords"]
+    assert len(streamed_so_far) < len(json.dumps(ANALYSIS)) # Description still to come
+    assert len(seen) == 1
+
+def test_streaming_field_parser_handles_split_chunks_and_strings():
+    from app.utils.json_stream import StreamingFieldParser
+    document = '{"note": "a [tricky] \\"keywords\\": [x]", "nested": {"keywords": ["no"]}, "keywords": ["Lo-fi", "a ] b"], "description": "..."}'
+    parser = StreamingFieldParser("keywords")
+    found = [value for value in (parser.feed(document[i:i + 3]) for i in range(0, len(document), 3)) if value is not None]
+    assert found == [["Lo-fi", "a ] b"]]
+
+def test_prompt_is_compact_and_calls_are_metered(tmp_path):
+    from app.services.ai.gemini_service import GEMINI_CALLS, GEMINI_TOKENS
+    from app.services.ai.prompt_builder import AnalysisPromptBuilder
+
+    track = {
+        "title": "Kiss", "artist": "Prince", "musixmatch_id": 1, "updated_time": "2024", "album": None, "genres": [],
+        "musicbrainz_tags": ["funk", "Funk", "80s"] + [f"tag{i}" for i in range(20)], "instrumental": False,
+    }
+    builder = AnalysisPromptBuilder(include_example=False)
+    assert builder.compact_input(track) == {
+        "title": "Kiss", "artist": "Prince", "instrumental": False,
+        "musicbrainz_tags": ["funk", "80s", "tag0", "tag1", "tag2", "tag3", "tag4", "tag5"],
+    }
+    prompt = builder.single(track)
+    assert prompt.count("Prince") == 1 and "Example" not in prompt
+    assert len(prompt) < len(AnalysisPromptBuilder(include_example=True).single(track))
+
+    ok_before = GEMINI_CALLS.value(kind="single", outcome="ok")
+    tokens_before = GEMINI_TOKENS.value(kind="single", direction="prompt")
+    asyncio.run(make_service(FakeModel([json.dumps(ANALYSIS)]), tmp_path).analyze_song_and_generate_keywords(track))
+    assert GEMINI_CALLS.value(kind="single", outcome="ok") == ok_before + 1
+    assert GEMINI_TOKENS.value(kind="single", direction="prompt") == tokens_before + 400
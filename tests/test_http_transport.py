@@ -0,0 +1,95 @@
+import asyncio
+import httpcore
+import httpx
+from app.core.http_transport import CachingDNSBackend, SharedHTTPTransport, parse_host_limits
+
+def test_per_host_limit_and_stats():
+    in_flight = {"slow.example": 0, "fast.example": 0}
+    peak = dict(in_flight)
+
+    async def handler(request):
+        host = request.url.host
+        in_flight[host] += 1
+        peak[host] = max(peak[host], in_flight[host])
+        await asyncio.sleep(0.02)
+        in_flight[host] -= 1
+        return httpx.Response(200, json={"host": host})
+
+    transport = SharedHTTPTransport(per_host_limit=3, host_limits={"slow.example": 1}, transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        async with transport.client(base_url="https://slow.example") as slow, transport.client() as fast:
+            results = await asyncio.gather(
+                *(slow.get("/a") for _ in range(3)),
+                *(fast.get("https://fast.example/b") for _ in range(3))
+            )
+        assert [r.json()["host"] for r in results] == ["slow.example"] * 3 + ["fast.example"] * 3
+        # Closing a client must not close the shared transport
+        async with transport.client() as again:
+            assert (await again.get("https://fast.example/c")).status_code == 200
+
+    asyncio.run(scenario())
+    assert peak == {"slow.example": 1, "fast.example": 3}
+    hosts = transport.stats()["hosts"]
+    assert hosts["slow.example"] == {"limit": 1, "active": 0, "waiting": 0, "requests": 3, "utilisation": 0.0}
+    assert hosts["fast.example"]["requests"] == 4
+
+def test_streamed_response_holds_its_slot_until_closed():
+    transport = SharedHTTPTransport(per_host_limit=1, transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b"x" * 10)))
+
+    async def scenario():
+        async with transport.client() as client:
+            async with client.stream("GET", "https://h.example/") as response:
+                assert transport.stats()["hosts"]["h.example"]["active"] == 1
+                await response.aread()
+        assert transport.stats()["hosts"]["h.example"]["active"] == 0
+
+    asyncio.run(scenario())
+
+def test_waiting_for_a_host_slot_honours_the_pool_timeout():
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200)
+
+    transport = SharedHTTPTransport(per_host_limit=1, transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        async with transport.client(timeout=httpx.Timeout(5.0, pool=0.05)) as client:
+            results = await asyncio.gather(client.get("https://h.example/a"), client.get("https://h.example/b"), return_exceptions=True)
+        assert results[0].status_code == 200
+        assert isinstance(results[1], httpx.PoolTimeout)
+        assert transport.stats()["hosts"]["h.example"] == {"limit": 1, "active": 0, "waiting": 0, "requests": 1, "utilisation": 0.0}
+
+    asyncio.run(scenario())
+
+def test_environment_proxies_are_honoured(monkeypatch):
+    for name in ("ALL_PROXY", "all_proxy", "HTTP_PROXY", "http_proxy", "https_proxy", "no_proxy"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.internal:3128")
+    monkeypatch.setenv("NO_PROXY", "direct.example")
+    transport = SharedHTTPTransport(per_host_limit=1)
+
+    proxied = transport._transport_for(httpx.URL("https://api.jamendo.com/v3.0/tracks"))
+    assert proxied is not transport._transport
+    assert isinstance(proxied._pool, httpcore.AsyncHTTPProxy)
+    assert transport._transport_for(httpx.URL("https://direct.example/")) is transport._transport
+    assert SharedHTTPTransport(per_host_limit=1, trust_env=False)._proxies == []
+    asyncio.run(transport.shutdown())
+
+def test_dns_answers_are_cached():
+    lookups = []
+
+    async def resolver(host, port):
+        lookups.append(host)
+        return ["127.0.0.1"]
+
+    backend = CachingDNSBackend(ttl=60, resolver=resolver)
+
+    async def scenario():
+        assert await backend.resolve("api.example", 443) == ["127.0.0.1"]
+        assert await backend.resolve("api.example", 443) == ["127.0.0.1"]
+        assert await backend.resolve("10.0.0.1", 443) == ["10.0.0.1"]
+
+    asyncio.run(scenario())
+    assert lookups == ["api.example"]
+    assert parse_host_limits(" api.jamendo.com=20, api.discogs.com=5,") == {"api.jamendo.com": 20, "api.discogs.com": 5}
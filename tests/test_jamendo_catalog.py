@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import httpx
+from app.services.metadata.jamendo import JamendoService
+from app.services.metadata.jamendo_catalog import JamendoCatalogStore, JamendoCatalogSync, JamendoCatalogIndex
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def load_fixture_tracks():
+    with open(os.path.join(FIXTURES, "jamendo_catalog_sample.json")) as f:
+        return json.load(f)["results"]
+
+class FakeJamendo:
+    """Serves the fixture catalog through the paged /tracks endpoint."""
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        self.requests.append(params)
+        tracks = self.tracks
+        if "datebetween" in params:
+            start, end = params["datebetween"].split("_")
+            tracks = [t for t in tracks if start <= t["releasedate"] <= end]
+        offset, limit = int(params["offset"]), int(params["limit"])
+        return httpx.Response(200, json={"results": tracks[offset:offset + limit]})
+
+def sync_catalog(tmp_path, fake, full=False) -> JamendoCatalogStore:
+    store = JamendoCatalogStore(str(tmp_path / "jamendo_catalog.sqlite3"))
+    syncer = JamendoCatalogSync(store, client=httpx.AsyncClient(base_url="https://api.jamendo.com/v3.0", transport=httpx.MockTransport(fake)))
+    syncer.PAGE_SIZE = 3
+    asyncio.run(syncer.sync(full=full))
+    return store
+
+def build_index(tmp_path) -> JamendoCatalogIndex:
+    index = JamendoCatalogIndex(sync_catalog(tmp_path, FakeJamendo(load_fixture_tracks())))
+    index.load()
+    return index
+
+def test_sync_pages_and_resumes_from_last_release_date(tmp_path):
+    tracks = load_fixture_tracks()
+    fake = FakeJamendo(tracks[:6])
+    store = sync_catalog(tmp_path, fake)
+    assert len(fake.requests) == 3 # Two full pages, then an empty one
+    assert store.get_state(JamendoCatalogSync.LAST_RELEASEDATE_KEY) == "2023-02-14"
+
+    fake = FakeJamendo(tracks)
+    sync_catalog(tmp_path, fake)
+    assert fake.requests[0]["datebetween"].startswith("2023-02-14_")
+    assert len(list(store.iter_tracks())) == len(tracks)
+
+def test_tag_search_ranks_by_match_and_popularity(tmp_path):
+    index = build_index(tmp_path)
+    results = index.search(["Synthwave", "retro"], limit=3)
+    # Both full matches come first; the far more popular one wins the tie
+    assert [t["id"] for t in results[:2]] == ["1001", "1008"]
+    assert results[0]["tags"] == ["electronic", "synthwave", "synthesizer", "retro", "energetic"]
+
+def test_multiword_keywords_match_joined_and_split_tags(tmp_path):
+    index = build_index(tmp_path)
+    ids = {t["id"] for t in index.search(["hip hop"], limit=10)}
+    assert {"1002", "1003", "1007"} <= ids
+    assert index.search(["polka"]) == []
+
+def test_service_answers_from_local_catalog(tmp_path):
+    index = JamendoCatalogIndex(sync_catalog(tmp_path, FakeJamendo(load_fixture_tracks())))
+
+    def fail(request):
+        raise AssertionError("Jamendo API should not be called")
+
+    service = JamendoService(catalog_index=index)
+    service.async_client = httpx.AsyncClient(transport=httpx.MockTransport(fail))
+    results = asyncio.run(service.find_similar_tracks_by_keywords(["Calm", "piano"], limit=2))
+    assert index.loaded
+    assert [t["id"] for t in results] == ["1002", "1004"]
@@ -0,0 +1,111 @@
+import asyncio
+import httpx
+from app.services.metadata.jamendo import JamendoService
+from app.services.metadata.jamendo_catalog import JamendoCatalogIndex, JamendoCatalogStore
+from app.services.metadata.jamendo_query_planner import JamendoQueryPlanner
+
+def test_plan_splits_long_keyword_lists_by_facet():
+    planner = JamendoQueryPlanner()
+    assert planner.plan(["rock", "happy"]) == [["rock", "happy"]]
+    plan = planner.plan(["indie rock", "happy", "Acoustic Guitar", "80s", "shoegaze", "upbeat", "piano"])
+    assert plan == [["indie rock", "shoegaze"], ["happy", "upbeat"], ["Acoustic Guitar", "piano"], ["80s"]]
+
+def test_plan_spends_spare_budget_on_every_facets_overflow():
+    planner = JamendoQueryPlanner()
+    plan = planner.plan(["jazz", "happy", "calm", "sad", "dark", "epic", "piano", "guitar", "drums", "violin", "cello"])
+    assert plan == [["jazz"], ["happy", "calm", "sad"], ["piano", "guitar", "drums"], ["dark", "epic"]]
+    # Overflow genres come first when the budget runs short
+    plan = planner.plan(["jazz", "soul", "funk", "blues", "swing", "happy", "calm", "sad", "dark", "piano"])
+    assert plan == [["jazz", "soul", "funk"], ["happy", "calm", "sad"], ["piano"], ["blues", "swing"]]
+
+def test_fuse_rewards_agreement_and_dedupes():
+    planner = JamendoQueryPlanner()
+    fused = planner.fuse([
+        [{"id": "a"}, {"id": "b"}, {"id": "c"}],
+        [{"id": "c"}, {"id": "d"}],
+    ])
+    assert [t["id"] for t in fused] == ["c", "a", "b", "d"]
+
+def test_sub_queries_run_concurrently(tmp_path):
+    in_flight = 0
+    peak = 0
+    queries = []
+
+    async def fake_jamendo(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        tags = request.url.params["fuzzytags"].split()
+        queries.append(tags)
+        # Every sub-query returns track "shared" plus one track of its own
+        results = [
+            {"id": track_id, "name": track_id, "artist_name": "Artist", "duration": 200,
+             "musicinfo": {"tags": {"genres": tags, "instruments": [], "vartags": []}}}
+            for track_id in ("shared", f"only-{tags[0]}")
+        ]
+        return httpx.Response(200, json={"results": results})
+
+    catalog = JamendoCatalogIndex(JamendoCatalogStore(str(tmp_path / "missing.sqlite3")))
+    service = JamendoService(catalog_index=catalog)
+    service.async_client = httpx.AsyncClient(base_url="https://api.jamendo.com/v3.0", transport=httpx.MockTransport(fake_jamendo))
+    tracks = asyncio.run(service.find_similar_tracks_by_keywords(["jazz", "soul", "funk", "calm", "piano"], limit=10))
+
+    assert len(queries) == 3
+    assert peak == 3
+    assert sorted(t["id"] for t in tracks) == ["only-calm", "only-jazz", "only-piano", "shared"]
+
+def make_tag_service(tmp_path, catalog_tags):
+    """JamendoService whose fake API returns the tracks sharing any tag with the query."""
+    queries = []
+
+    def fake_jamendo(request: httpx.Request) -> httpx.Response:
+        tags = request.url.params["fuzzytags"].split()
+        queries.append(tags)
+        results = [
+            {"id": track_id, "name": track_id, "artist_name": "Artist", "duration": 200,
+             "musicinfo": {"tags": {"genres": track_tags, "instruments": [], "vartags": []}}}
+            for track_id, track_tags in catalog_tags.items() if set(tags) & set(track_tags)
+        ]
+        return httpx.Response(200, json={"results": results})
+
+    catalog = JamendoCatalogIndex(JamendoCatalogStore(str(tmp_path / "missing.sqlite3")))
+    service = JamendoService(catalog_index=catalog)
+    service.async_client = httpx.AsyncClient(base_url="https://api.jamendo.com/v3.0", transport=httpx.MockTransport(fake_jamendo))
+    return service, queries
+
+def test_keywords_are_searched_even_when_speculative_candidates_match(tmp_path):
+    service, queries = make_tag_service(tmp_path, {"1": ["jazz", "calm"], "2": ["jazz", "swing"], "3": ["calm", "piano"]})
+
+    async def run():
+        speculative = service.start_speculative_search(["Jazz"], limit=2)
+        return await service.find_similar_tracks_by_keywords(["jazz", "calm"], limit=3, speculative=speculative)
+
+    tracks = asyncio.run(run())
+    assert sorted(queries) == [["jazz"], ["jazz", "calm"]]
+    # Track 3 is only reachable through the keyword search
+    assert tracks[0]["id"] == "1"
+    assert {t["id"] for t in tracks} == {"1", "2", "3"}
+
+def test_speculative_and_keyword_candidates_are_merged(tmp_path):
+    service, queries = make_tag_service(tmp_path, {"1": ["jazz"], "2": ["ambient", "piano"], "3": ["ambient"]})
+
+    async def run():
+        speculative = service.start_speculative_search(["jazz"], limit=2)
+        return await service.find_similar_tracks_by_keywords(["ambient", "piano"], limit=2, speculative=speculative)
+
+    tracks = asyncio.run(run())
+    assert sorted(queries) == [["ambient", "piano"], ["jazz"]]
+    assert [t["id"] for t in tracks] == ["2", "3"]
+
+def test_failed_speculative_search_falls_back_to_keywords(tmp_path):
+    service, queries = make_tag_service(tmp_path, {"1": ["jazz"]})
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def run():
+        return await service.find_similar_tracks_by_keywords(["jazz"], limit=2, speculative=asyncio.ensure_future(failing()))
+
+    assert [t["id"] for t in asyncio.run(run())] == ["1"]
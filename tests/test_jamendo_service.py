@@ -0,0 +1,69 @@
+import asyncio
+import httpx
+from app.services.metadata.jamendo import JamendoService
+from app.services.metadata.jamendo_catalog import JamendoCatalogStore, JamendoCatalogIndex
+
+def api_track(track_id, tags):
+    return {
+        "id": track_id, "name": f"Track {track_id}", "artist_name": "Artist", "duration": 180,
+        "audio": f"https://cdn.example.com/{track_id}.mp3", "image": "",
+        "musicinfo": {"tags": {"genres": tags, "instruments": [], "vartags": []}},
+    }
+
+def jamendo_search(request: httpx.Request) -> httpx.Response:
+    """Answers /tracks searches with three tracks tagged with the requested tags."""
+    tags = request.url.params["fuzzytags"].split()
+    return httpx.Response(200, json={"results": [api_track(f"{'-'.join(tags)}-{i}", tags) for i in range(3)]})
+
+def make_service(tmp_path, api) -> JamendoService:
+    catalog = JamendoCatalogIndex(JamendoCatalogStore(str(tmp_path / "missing.sqlite3")))
+    service = JamendoService(catalog_index=catalog)
+    service.async_client = api.client(base_url="https://api.jamendo.com/v3.0")
+    return service
+
+def test_search_request_parameters(tmp_path, fake_api):
+    api = fake_api(jamendo_search)
+    service = make_service(tmp_path, api)
+    tracks = asyncio.run(service.find_similar_tracks_by_keywords(["Jazz", "piano"], limit=2))
+
+    assert len(tracks) == 2
+    params = api.params[0]
+    assert params["fuzzytags"] == "jazz piano"
+    assert params["limit"] == str(2 * JamendoService.CANDIDATE_MULTIPLIER)
+    assert params["audio"] == "1"
+    assert all(0 <= t["similarity_score"] <= 1 for t in tracks)
+
+def test_cache_key_ignores_keyword_order_and_case(tmp_path, fake_api):
+    api = fake_api(jamendo_search)
+    service = make_service(tmp_path, api)
+
+    async def run():
+        first = await service.find_similar_tracks_by_keywords(["Jazz", "Piano"], limit=2)
+        second = await service.find_similar_tracks_by_keywords(["piano ", "JAZZ", "jazz"], limit=2)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(api.requests) == 1
+    assert [t["id"] for t in first] == [t["id"] for t in second]
+
+def test_concurrent_identical_searches_share_one_request(tmp_path, fake_api):
+    api = fake_api(jamendo_search, delay=0.05)
+    service = make_service(tmp_path, api)
+
+    async def run():
+        return await asyncio.gather(*(service.find_similar_tracks_by_keywords(["jazz", "calm"], limit=2) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(api.requests) == 1
+    assert all(len(tracks) == 2 for tracks in results)
+    assert not service._in_flight
+
+def test_failed_requests_are_not_cached(tmp_path, fake_api):
+    api = fake_api(jamendo_search)
+    api.status_code = 503
+    service = make_service(tmp_path, api)
+    assert asyncio.run(service.find_similar_tracks_by_keywords(["jazz"], limit=2)) == []
+
+    api.status_code = None
+    assert len(asyncio.run(service.find_similar_tracks_by_keywords(["jazz"], limit=2))) == 2
+    assert len(api.requests) == 2
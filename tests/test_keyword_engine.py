@@ -0,0 +1,48 @@
+import asyncio
+import json
+from app.core.config import settings
+from app.services.ai.keyword_engine import RuleBasedKeywordEngine, canonical_genre, era_bucket
+from test_gemini_service import ANALYSIS, FakeModel, make_service
+
+KISS = {
+    "title": "Kiss", "artist": "Prince", "instrumental": False,
+    "genres": ["Pop", "R&B/Soul"],
+    "discogs_styles": ["Funk", "Minimal Funk", "Synth-pop"],
+    "discogs_year": 1986,
+    "musicbrainz_tags": ["funk", "80s", "pop", "prince"],
+}
+
+def test_taxonomy_folding_and_era_buckets():
+    assert canonical_genre("Hip-Hop/Rap") == "hiphop"
+    assert canonical_genre("Drum & Bass") == "drum and bass"
+    assert canonical_genre("SYNTH POP") == "synthpop"
+    assert canonical_genre("prince") is None
+    assert (era_bucket(1986), era_bucket("2014"), era_bucket(None)) == ("80s", "2010s", None)
+
+def test_generates_weighted_keywords():
+    engine = RuleBasedKeywordEngine()
+    result = engine.generate(KISS)
+    # Funk is named by all three sources, so it leads
+    assert result["keywords"][0] == "Funk"
+    assert {"Pop", "Synth-pop", "Groovy", "80s", "Vocal"} <= set(result["keywords"])
+    assert engine.coverage(KISS) == 1.0
+    assert engine.generate({"genres": ["Polka-ish"], "musicbrainz_tags": ["prince"]}) is None
+
+def test_policy_bypasses_or_refines_with_gemini(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "KEYWORD_RULES_MODE", "bypass")
+    model = FakeModel([json.dumps(ANALYSIS)])
+    service = make_service(model, tmp_path)
+    assert asyncio.run(service.analyze_song_and_generate_keywords(KISS))["source"] == "rules"
+    assert model.calls == []
+
+    monkeypatch.setattr(settings, "KEYWORD_RULES_MODE", "background")
+
+    async def run():
+        instant = await service.analyze_song_and_generate_keywords(KISS)
+        await asyncio.gather(*service._refining.values())
+        return instant, await service.analyze_song_and_generate_keywords(KISS)
+
+    instant, refined = asyncio.run(run())
+    assert instant["source"] == "rules"
+    assert refined == ANALYSIS # Gemini's analysis, now cached
+    assert len(model.calls) == 1
@@ -0,0 +1,56 @@
+from app.core.metrics import MetricsRegistry
+
+def test_renders_prometheus_text_format():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls", ["kind"])
+    latency = registry.histogram("latency_seconds", "Latency", (0.5, 1.0), ["kind"])
+    calls.inc(kind="single")
+    calls.inc(2, kind='batch "x"')
+    for value in (0.2, 0.7, 3.0):
+        latency.observe(value, kind="single")
+    assert registry.counter("calls_total", "Calls", ["kind"]) is calls
+
+    text = registry.render()
+    assert '# TYPE calls_total counter' in text
+    assert 'calls_total{kind="single"} 1' in text
+    assert 'calls_total{kind="batch \\"x\\""} 2' in text
+    assert 'latency_seconds_bucket{kind="single",le="0.5"} 1' in text
+    assert 'latency_seconds_bucket{kind="single",le="1"} 2' in text
+    assert 'latency_seconds_bucket{kind="single",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{kind="single"} 3' in text
+    assert 'latency_seconds_sum{kind="single"} 3.9' in text
+
+def make_worker_metrics(registry: MetricsRegistry):
+    return (
+        registry.counter("calls_total", "Calls", ["kind"]),
+        registry.gauge("in_flight", "Requests in flight"),
+        registry.histogram("latency_seconds", "Latency", (0.5, 1.0)),
+    )
+
+def test_multiprocess_mode_merges_every_worker(tmp_path):
+    import json
+    import os
+    this_worker = MetricsRegistry(str(tmp_path))
+    calls, in_flight, latency = make_worker_metrics(this_worker)
+    calls.inc(kind="single")
+    in_flight.set(2)
+    latency.observe(0.2)
+
+    # Another live worker (the parent process stands in for it) and one that has exited
+    other_worker = MetricsRegistry()
+    other_calls, other_in_flight, other_latency = make_worker_metrics(other_worker)
+    other_calls.inc(3, kind="single")
+    other_calls.inc(kind="batch")
+    other_in_flight.set(5)
+    other_latency.observe(0.7)
+    for pid in (os.getppid(), 2 ** 22 + 1): # Above Linux's pid_max, so never a running process
+        (tmp_path / f"{pid}.json").write_text(json.dumps(other_worker.snapshot()))
+
+    text = this_worker.render()
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+    assert 'calls_total{kind="single"} 7' in text
+    assert 'calls_total{kind="batch"} 2' in text
+    assert "in_flight 7" in text # Gauges of exited workers are dropped
+    assert 'latency_seconds_bucket{le="0.5"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 3' in text
+    assert "latency_seconds_count 3" in text
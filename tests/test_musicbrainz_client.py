@@ -0,0 +1,70 @@
+import asyncio
+import musicbrainzngs
+from app.services.metadata.musicbrainz import MusicBrainzClient
+
+class FakeMusicBrainz:
+    """Stands in for musicbrainzngs' recording and release group lookups."""
+
+    def __init__(self, recording=None, release_group=None):
+        self.recording = recording or {}
+        self.release_group = release_group or {}
+        self.calls = []
+
+    def get_recording_by_id(self, mbid, includes=None):
+        self.calls.append(("recording", mbid))
+        return {"recording": self.recording}
+
+    def get_release_group_by_id(self, release_group_id, includes=None):
+        self.calls.append(("release-group", release_group_id))
+        return {"release-group": self.release_group}
+
+def make_client(monkeypatch, fake: FakeMusicBrainz) -> MusicBrainzClient:
+    monkeypatch.setattr(musicbrainzngs, "get_recording_by_id", fake.get_recording_by_id)
+    monkeypatch.setattr(musicbrainzngs, "get_release_group_by_id", fake.get_release_group_by_id)
+    return MusicBrainzClient()
+
+def url_rels(*relations):
+    return {"url-relation-list": [{"type": kind, "target": target} for kind, target in relations]}
+
+def test_recording_wikipedia_link(monkeypatch):
+    fake = FakeMusicBrainz(recording=url_rels(
+        ("wikipedia", "https://de.wikipedia.org/wiki/Kiss_(Lied)"),
+        ("wikipedia", "https://en.wikipedia.org/wiki/Kiss_(Prince_song)"),
+    ))
+    client = make_client(monkeypatch, fake)
+    reference = asyncio.run(client.get_wikipedia_reference("rec-1", release_group_id="rg-1"))
+    assert reference == {"wikipedia_title": "Kiss (Prince song)"}
+    assert fake.calls == [("recording", "rec-1")]
+
+def test_work_wikidata_link(monkeypatch):
+    work = {"work": url_rels(("wikidata", "https://www.wikidata.org/wiki/Q1140397"))}
+    fake = FakeMusicBrainz(recording={"work-relation-list": [work]})
+    client = make_client(monkeypatch, fake)
+    reference = asyncio.run(client.get_wikipedia_reference("rec-1"))
+    assert reference == {"wikidata_id": "Q1140397"}
+
+def test_falls_back_to_release_group(monkeypatch):
+    fake = FakeMusicBrainz(release_group=url_rels(("wikipedia", "https://en.wikipedia.org/wiki/Parade_(album)")))
+    client = make_client(monkeypatch, fake)
+    reference = asyncio.run(client.get_wikipedia_reference("rec-1", release_group_id="rg-1"))
+    assert reference == {"wikipedia_title": "Parade (album)"}
+    assert fake.calls == [("recording", "rec-1"), ("release-group", "rg-1")]
+
+def test_missing_links_are_cached(monkeypatch):
+    fake = FakeMusicBrainz()
+    client = make_client(monkeypatch, fake)
+    assert asyncio.run(client.get_wikipedia_reference("rec-1", release_group_id="rg-1")) is None
+    assert asyncio.run(client.get_wikipedia_reference("rec-1", release_group_id="rg-1")) is None
+    assert len(fake.calls) == 2
+
+def test_failed_lookups_are_not_cached(monkeypatch):
+    fake = FakeMusicBrainz(recording=url_rels(("wikipedia", "https://en.wikipedia.org/wiki/Kiss_(Prince_song)")))
+    client = make_client(monkeypatch, fake)
+
+    def unavailable(mbid, includes=None):
+        raise musicbrainzngs.NetworkError("unavailable")
+
+    monkeypatch.setattr(musicbrainzngs, "get_recording_by_id", unavailable)
+    assert asyncio.run(client.get_wikipedia_reference("rec-1")) is None
+    monkeypatch.setattr(musicbrainzngs, "get_recording_by_id", fake.get_recording_by_id)
+    assert asyncio.run(client.get_wikipedia_reference("rec-1")) == {"wikipedia_title": "Kiss (Prince song)"}
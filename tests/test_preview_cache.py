@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from app.services.media.preview_cache import JamendoPreviewCache, PreviewIncomplete
+from app.utils.disk_cache import DiskLRUCache
+from app.utils.http_range import parse_range, RangeNotSatisfiable
+
+AUDIO = bytes(range(256)) * 1024 # 256 KiB stand-in for an MP3 preview
+
+def make_app(tmp_path, fail_after=None):
+    downloads = []
+
+    async def fake_storage(request: httpx.Request) -> httpx.Response:
+        downloads.append(request.url.params["trackid"])
+
+        async def body():
+            for i in range(0, len(AUDIO), 32 * 1024):
+                await asyncio.sleep(0) # Let readers run between chunks
+                if fail_after is not None and i >= fail_after:
+                    raise httpx.ReadError("connection reset")
+                yield AUDIO[i:i + 32 * 1024]
+
+        return httpx.Response(200, headers={"Content-Length": str(len(AUDIO))}, content=body())
+
+    previews = JamendoPreviewCache(DiskLRUCache(str(tmp_path / "previews"), max_bytes=10 * len(AUDIO)))
+    previews.async_client = httpx.AsyncClient(transport=httpx.MockTransport(fake_storage))
+    app = FastAPI()
+
+    @app.get("/preview/{track_id}")
+    async def preview(track_id: str, request: Request):
+        return await previews.response_for(track_id, request.headers)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    return client, previews, downloads
+
+def test_first_play_streams_and_fills_cache_once(tmp_path):
+    client, previews, downloads = make_app(tmp_path)
+
+    async def run():
+        first, second = await asyncio.gather(client.get("/preview/42"), client.get("/preview/42", headers={"Range": "bytes=1000-1999"}))
+        await asyncio.sleep(0.01)
+        cached = await client.get("/preview/42", headers={"Range": "bytes=-100"})
+        return first, second, cached
+
+    first, second, cached = asyncio.run(run())
+    assert downloads == ["42"]
+    assert first.status_code == 200 and first.content == AUDIO
+    assert second.status_code == 206 and second.content == AUDIO[1000:2000]
+    assert second.headers["content-range"] == f"bytes 1000-1999/{len(AUDIO)}"
+    assert cached.status_code == 206 and cached.content == AUDIO[-100:]
+    assert previews.cache.get("jamendo-preview:42") is not None
+
+def test_fill_holds_its_download_task(tmp_path):
+    _, previews, _ = make_app(tmp_path)
+
+    async def run():
+        path, fill = await previews.open("9")
+        assert path is None and not fill.task.done()
+        await fill.task
+        return fill
+
+    fill = asyncio.run(run())
+    assert fill.done and not fill.failed
+    assert "jamendo-preview:9" not in previews._fills
+    assert previews.cache.get("jamendo-preview:9") is not None
+
+def test_unsatisfiable_range_on_cached_file(tmp_path):
+    client, previews, _ = make_app(tmp_path)
+    previews.cache.put("jamendo-preview:7", b"abc")
+    response = asyncio.run(client.get("/preview/7", headers={"Range": "bytes=10-"}))
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */3"
+
+def test_lru_eviction_by_byte_budget(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "cache"), max_bytes=25)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    cache.get("a") # "b" becomes least recently used
+    cache.put("c", b"x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.total_bytes == 20
+    # Recency and sizes survive a restart
+    assert DiskLRUCache(str(tmp_path / "cache"), max_bytes=25).total_bytes == 20
+
+def test_failed_download_aborts_the_response(tmp_path):
+    client, previews, _ = make_app(tmp_path, fail_after=64 * 1024)
+    # Headers are already out, so the connection is aborted instead of ending the body early
+    with pytest.raises(Exception) as excinfo:
+        asyncio.run(client.get("/preview/42"))
+    assert excinfo.errisinstance(PreviewIncomplete) or excinfo.group_contains(PreviewIncomplete)
+    assert previews.cache.get("jamendo-preview:42") is None
+    assert not [name for name in os.listdir(tmp_path / "previews") if name.endswith(".part")]
+
+def test_workers_share_entries_and_byte_budget(tmp_path):
+    first = DiskLRUCache(str(tmp_path / "cache"), max_bytes=25)
+    second = DiskLRUCache(str(tmp_path / "cache"), max_bytes=25)
+    first.put("a", b"x" * 10)
+    second.put("b", b"x" * 10)
+    assert second.get("a") and first.get("b")
+    first.put("c", b"x" * 10) # 30 bytes across both workers: "a" is least recently used
+    assert second.get("a") is None
+    assert second.get("b") and second.get("c")
+    assert first.total_bytes == second.total_bytes == 20
+
+def test_partial_files_are_unique_and_only_removed_when_stale(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "cache"), max_bytes=100)
+    fresh, stale = cache.partial_path("a"), cache.partial_path("a")
+    assert fresh != stale
+    for path in (fresh, stale):
+        with open(path, "wb") as f:
+            f.write(b"x")
+    old = time.time() - 2 * DiskLRUCache.STALE_PART_SECONDS
+    os.utime(stale, (old, old))
+    DiskLRUCache(str(tmp_path / "cache"), max_bytes=100) # Another worker starting up
+    assert os.path.exists(fresh)
+    assert not os.path.exists(stale)
+    assert cache.commit("a", fresh) == cache.get("a")
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-", 100) == (0, 99)
+    assert parse_range("bytes=10-2000", 100) == (10, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=5-", None) == (5, None)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", 100)
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from app.core.services import ServiceRegistry
+
+class AsyncClosing:
+    def __init__(self):
+        self.closed = False
+        self.value = 1
+
+    async def aclose(self):
+        self.closed = True
+
+class SyncClosing:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_services_are_built_on_first_use_and_closed_on_shutdown():
+    registry = ServiceRegistry()
+    built = []
+    def factory(cls):
+        def build():
+            built.append(cls.__name__)
+            return cls()
+        return build
+    first = registry.register("first", factory(AsyncClosing))
+    second = registry.register("second", factory(SyncClosing))
+    unused = registry.register("unused", factory(AsyncClosing))
+    assert built == []
+
+    assert first.value == 1
+    first.value = 2 # Attribute writes reach the real instance
+    assert registry.get("first").value == 2
+    registry.preload(["second"])
+    assert built == ["AsyncClosing", "SyncClosing"]
+    assert registry.built() == ["first", "second"]
+
+    instances = [registry.get("first"), registry.get("second")]
+    asyncio.run(registry.aclose())
+    assert all(instance.closed for instance in instances)
+    assert registry.built() == []
+    assert "not built" in repr(unused)
+
+def test_failed_construction_is_retried():
+    registry = ServiceRegistry()
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("API key not configured")
+        return SyncClosing()
+    service = registry.register("flaky", flaky)
+    registry.preload(["flaky"]) # Logged, not raised
+    assert not registry.is_built("flaky")
+    assert service.closed is False
+    assert len(attempts) == 2
+    with pytest.raises(KeyError):
+        registry.get("missing")
@@ -0,0 +1,113 @@
+import asyncio
+import httpx
+import pytest
+from app.core.cache import PersistentTTLCache
+from app.services.metadata.jamendo import JamendoService
+from app.services.metadata.jamendo_catalog import JamendoCatalogIndex, JamendoCatalogStore
+from app.services.similarity.cursor import SimilarTracksCursors, InvalidCursorError
+
+def test_persistent_cache_is_shared_and_expires(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    writer = PersistentTTLCache("test", ttl=60, db_path=db_path)
+    reader = PersistentTTLCache("test", ttl=60, db_path=db_path)
+    other_namespace = PersistentTTLCache("other", ttl=60, db_path=db_path)
+
+    writer.set("key", {"tracks": [1, 2]})
+    writer.set("stale", "value", ttl=-1)
+    assert reader.get("key") == {"tracks": [1, 2]}
+    assert other_namespace.get("key") is None
+    assert reader.get("stale") is None
+    assert writer.purge_expired() == 1
+
+def test_periodic_purge_reclaims_the_file(tmp_path):
+    db_path = tmp_path / "cache.sqlite3"
+    cache = PersistentTTLCache("test", ttl=60, db_path=str(db_path), purge_every=50)
+    for i in range(49):
+        cache.set(f"stale-{i}", "x" * 10_000, ttl=-1)
+    grown = db_path.stat().st_size
+    assert grown > 400_000
+
+    cache.set("key", "value") # The 50th write purges
+    assert db_path.stat().st_size < grown / 4
+    assert cache.get("key") == "value"
+    assert cache.purge_expired() == 0
+
+def make_cursors(tmp_path, total_tracks=20, failing_offsets=()):
+    requests = []
+    failing_offsets = set(failing_offsets) # Each fails once
+
+    def fake_jamendo(request: httpx.Request) -> httpx.Response:
+        offset, limit = int(request.url.params["offset"]), int(request.url.params["limit"])
+        requests.append((offset, limit))
+        if offset in failing_offsets:
+            failing_offsets.discard(offset)
+            return httpx.Response(503)
+        results = [
+            {"id": f"t{i}", "name": f"Track {i}", "artist_name": "Artist", "duration": 200,
+             "musicinfo": {"tags": {"genres": ["jazz"], "instruments": [], "vartags": []}}}
+            for i in range(offset, min(offset + limit, total_tracks))
+        ]
+        return httpx.Response(200, json={"results": results})
+
+    catalog = JamendoCatalogIndex(JamendoCatalogStore(str(tmp_path / "missing.sqlite3")))
+    jamendo = JamendoService(catalog_index=catalog)
+    jamendo.async_client = httpx.AsyncClient(base_url="https://api.jamendo.com/v3.0", transport=httpx.MockTransport(fake_jamendo))
+    store = PersistentTTLCache("similar_tracks_cursor", ttl=60, db_path=str(tmp_path / "cache.sqlite3"))
+    return SimilarTracksCursors(jamendo=jamendo, store=store), requests
+
+def test_pages_are_served_from_the_cursor_and_extended_by_prefetch(tmp_path):
+    cursors, requests = make_cursors(tmp_path)
+
+    async def run():
+        ranked = [{"id": f"t{i}", "similarity_score": 1.0} for i in range(12)]
+        # As if the search had fetched the first 12 candidates of its only sub-query
+        token = await cursors.create(["jazz"], ranked, served=5, fetched=12)
+        pages = []
+        while token:
+            page = await cursors.page(token, limit=5)
+            pages.append([t["id"] for t in page["similar_tracks"]])
+            token = page["next_cursor"]
+        return pages
+
+    pages = asyncio.run(run())
+    assert pages[0] == ["t5", "t6", "t7", "t8", "t9"]
+    assert pages[1] == ["t10", "t11", "t12", "t13", "t14"] # Spans the stored list and the prefetched page
+    assert sum(pages, []) == [f"t{i}" for i in range(5, 20)]
+    assert requests == [(12, 50), (62, 50)] # Resumes after what the search fetched
+
+def test_failed_prefetch_does_not_end_the_results(tmp_path):
+    cursors, requests = make_cursors(tmp_path, failing_offsets=[12])
+
+    async def run():
+        ranked = [{"id": f"t{i}", "similarity_score": 1.0} for i in range(12)]
+        token = await cursors.create(["jazz"], ranked, served=10, fetched=12)
+        first = await cursors.page(token, limit=5) # Prefetch fails: only what is stored
+        second = await cursors.page(first["next_cursor"], limit=5) # Retried
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [t["id"] for t in first["similar_tracks"]] == ["t10", "t11"]
+    assert first["next_cursor"] is not None
+    assert [t["id"] for t in second["similar_tracks"]] == ["t12", "t13", "t14", "t15", "t16"]
+    assert requests[:2] == [(12, 50), (12, 50)]
+
+def test_unknown_and_malformed_cursors(tmp_path):
+    cursors, _ = make_cursors(tmp_path)
+    assert asyncio.run(cursors.page("missing:10")) is None
+    with pytest.raises(InvalidCursorError):
+        asyncio.run(cursors.page("not-a-cursor"))
+
+def test_background_prefetch_is_tracked_until_done(tmp_path):
+    cursors, requests = make_cursors(tmp_path, total_tracks=100)
+
+    async def run():
+        ranked = [{"id": f"t{i}", "similarity_score": 1.0} for i in range(12)]
+        token = await cursors.create(["jazz"], ranked, served=5, fetched=12)
+        await cursors.page(token, limit=5) # Leaves 2 of 12 tracks, so a prefetch starts
+        tasks = list(cursors._prefetching.values())
+        assert len(tasks) == 1
+        await tasks[0]
+        return cursors._prefetching
+
+    assert asyncio.run(run()) == {}
+    assert requests == [(12, 50)]
@@ -0,0 +1,52 @@
+import asyncio
+import httpx
+from app.services.metadata.jamendo import JamendoService
+from app.services.metadata.jamendo_catalog import JamendoCatalogIndex, JamendoCatalogStore
+from app.services.similarity.tag_ranker import TagSimilarityRanker
+
+CANDIDATES = [
+    {"id": "1", "tags": ["rock", "guitar", "energetic"]},
+    {"id": "2", "tags": ["jazz", "piano", "calm"]},
+    {"id": "3", "tags": ["Hip-Hop", "drums"]},
+    {"id": "4", "tags": ["jazz", "piano", "saxophone", "calm", "night"]},
+    {"id": "5", "tags": []},
+]
+
+def test_rank_orders_by_cosine_similarity():
+    ranked = TagSimilarityRanker().rank(["jazz", "calm piano"], CANDIDATES, limit=3)
+    assert [t["id"] for t in ranked] == ["2", "4", "1"]
+    assert 0 < ranked[1]["similarity_score"] < ranked[0]["similarity_score"] <= 1
+    assert ranked[2]["similarity_score"] == 0
+    assert "similarity_score" not in CANDIDATES[1] # Candidates are not mutated
+
+def test_tag_spelling_variants_match():
+    scores = TagSimilarityRanker().score(["hip hop"], CANDIDATES)
+    assert scores.argmax() == 2
+    assert scores[4] == 0
+
+def test_partial_match_scores_below_one():
+    keywords = ["rock", "jazz", "sad", "piano", "80s", "saxophone"]
+    scores = TagSimilarityRanker().score(keywords, [{"id": "1", "tags": ["rock"]}])
+    assert 0 < scores[0] < 0.5
+    assert TagSimilarityRanker().score(["rock"], [{"id": "1", "tags": ["rock"]}])[0] == 1
+
+def test_api_results_are_over_fetched_and_reranked(tmp_path):
+    requested_limits = []
+
+    def fake_jamendo(request: httpx.Request) -> httpx.Response:
+        requested_limits.append(int(request.url.params["limit"]))
+        results = [
+            {"id": str(i), "name": f"Track {i}", "artist_name": "Artist", "duration": 180,
+             "musicinfo": {"tags": {"genres": genres, "instruments": [], "vartags": []}}}
+            for i, genres in enumerate([["pop"], ["pop", "ambient"], ["ambient"]])
+        ]
+        return httpx.Response(200, json={"results": results})
+
+    catalog = JamendoCatalogIndex(JamendoCatalogStore(str(tmp_path / "missing.sqlite3")))
+    service = JamendoService(catalog_index=catalog)
+    service.async_client = httpx.AsyncClient(base_url="https://api.jamendo.com/v3.0", transport=httpx.MockTransport(fake_jamendo))
+    tracks = asyncio.run(service.find_similar_tracks_by_keywords(["ambient"], limit=2))
+
+    assert requested_limits == [2 * JamendoService.CANDIDATE_MULTIPLIER]
+    assert [t["id"] for t in tracks] == ["2", "1"]
+    assert tracks[0]["similarity_score"] == 1.0
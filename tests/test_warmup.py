@@ -0,0 +1,37 @@
+import asyncio
+import httpx
+from app.core.http_transport import SharedHTTPTransport
+from app.core.warmup import StartupWarmup
+
+def make_transport(handler):
+    return SharedHTTPTransport(per_host_limit=10, transport=httpx.MockTransport(handler))
+
+def test_warmup_opens_connections_and_reports_each_provider():
+    seen = []
+
+    async def handler(request):
+        seen.append((request.method, request.url.host))
+        if request.url.host == "api.discogs.com":
+            raise httpx.ConnectError("unreachable", request=request)
+        return httpx.Response(405) # Status is irrelevant; the connection is what matters
+
+    warmup = StartupWarmup(make_transport(handler), {"jamendo": 2, "discogs": 1, "bogus": 1}, timeout=5)
+    assert not warmup.ready
+    asyncio.run(warmup.run())
+
+    assert warmup.ready
+    assert sorted(seen) == [("HEAD", "api.discogs.com"), ("HEAD", "api.jamendo.com"), ("HEAD", "api.jamendo.com")]
+    steps = warmup.report()["steps"]
+    assert steps["jamendo"]["status"] == "ok"
+    assert steps["discogs"]["status"] == "failed"
+    assert "bogus" not in steps
+
+def test_slow_warmup_still_becomes_ready_after_timeout():
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200)
+
+    warmup = StartupWarmup(make_transport(handler), {"musixmatch": 1}, timeout=0.05)
+    asyncio.run(warmup.run())
+    assert warmup.ready
+    assert warmup.report()["steps"]["musixmatch"]["status"] == "timed out"
@@ -0,0 +1,73 @@
+import asyncio
+import httpx
+from app.services.metadata.wikipedia_service import WikipediaService
+
+class WikipediaPages:
+    """Answers MediaWiki page queries: "Kiss (song)" redirects to a page at revision `revid`, other titles are missing."""
+
+    def __init__(self):
+        self.revid = 100
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        titles = request.url.params["titles"].split("|")
+        with_extracts = "extracts" in request.url.params["prop"]
+        pages, redirects = {}, []
+        for i, title in enumerate(titles):
+            if title == "Kiss (song)":
+                redirects.append({"from": title, "to": "Kiss (Prince song)"})
+                page = {"pageid": 1, "title": "Kiss (Prince song)", "revisions": [{"revid": self.revid}]}
+                if with_extracts:
+                    page["extract"] = "\"Kiss\" is a song by Prince (listen)."
+                pages["1"] = page
+            else:
+                pages[str(-1 - i)] = {"title": title, "missing": ""}
+        return httpx.Response(200, json={"query": {"redirects": redirects, "pages": pages}})
+
+def make_service(api) -> WikipediaService:
+    service = WikipediaService()
+    service.async_client = api.client()
+    return service
+
+def test_candidates_resolved_in_one_request(fake_api):
+    api = fake_api(WikipediaPages())
+    service = make_service(api)
+    summary = asyncio.run(service.get_wikipedia_summary("Kiss (Prince and the Revolution song)", "Kiss (song)"))
+    assert summary == "\"Kiss\" is a song by Prince ."
+    assert len(api.requests) == 1
+
+def test_cached_pages_are_revalidated_by_revision(fake_api):
+    pages = WikipediaPages()
+    api = fake_api(pages)
+    service = make_service(api)
+    asyncio.run(service.get_wikipedia_summary("Kiss (song)"))
+    # Fresh cache entries need no request at all
+    asyncio.run(service.get_wikipedia_summary("Kiss (song)"))
+    assert len(api.requests) == 1
+
+    # Stale but unchanged: one cheap revisions-only check
+    service.FRESH_SECONDS = 0
+    asyncio.run(service.get_wikipedia_summary("Kiss (song)"))
+    assert len(api.requests) == 2
+    assert api.params[-1]["prop"] == "revisions"
+
+    # A new revision triggers a refetch of the extract
+    pages.revid = 101
+    assert asyncio.run(service.get_wikipedia_summary("Kiss (song)"))
+    assert len(api.requests) == 4
+    assert "extracts" in api.params[-1]["prop"]
+
+def test_wikidata_reference_resolves_to_enwiki_page(fake_api):
+    pages = WikipediaPages()
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "www.wikidata.org":
+            sitelinks = {"enwiki": {"title": "Kiss (song)"}} if request.url.params["ids"] == "Q1" else {}
+            return httpx.Response(200, json={"entities": {request.url.params["ids"]: {"sitelinks": sitelinks}}})
+        return pages(request)
+
+    api = fake_api(respond)
+    service = make_service(api)
+    assert asyncio.run(service.get_summary_for_reference({"wikidata_id": "Q1"})) == "\"Kiss\" is a song by Prince ."
+    assert asyncio.run(service.get_summary_for_reference({"wikidata_id": "Q2"})) is None
+    assert asyncio.run(service.get_summary_for_reference({"wikidata_id": "Q1"}))
+    assert [r.url.params["ids"] for r in api.requests if r.url.host == "www.wikidata.org"] == ["Q1", "Q2"]